@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for packing and unpacking, to compare builds and interpreters (CPython and PyPy).
+
+Usage: python bench.py [-n NUMBER] [-k FILTER]
+"""
+
+import argparse
+import array
+import platform
+import sys
+import timeit
+
+from aiolo import Bundle, Message, Midi, Route, TimeTag, parse_packet
+
+
+BLOB = array.array('b', bytes(range(256)) * 256)
+LEVELS = array.array('f', [i / 64 for i in range(64)])
+
+
+def benchmarks():
+    blob = Route('/blob', 'b')
+    mixed = Route('/mixed', 'ifsfd')
+    levels = Route('/levels', 'f' * len(LEVELS))
+    notes = Route('/notes', 'm' * 16)
+    timetags = Route('/timetags', 't' * 16)
+
+    blob_message = Message(blob, BLOB)
+    mixed_message = Message(mixed, 1, 2., 'three', 4., 5.)
+    levels_message = Message(levels, LEVELS)
+    notes_message = Message(notes, [Midi(1, 0x90, n, 127) for n in range(16)])
+    timetags_message = Message(timetags, [TimeTag((n, n)) for n in range(16)])
+    bundle = Bundle([mixed_message] * 16)
+    bundle_bytes = bytes(bundle)
+    a, b = TimeTag((100, 5)), TimeTag((100, 6))
+
+    return {
+        'pack blob (64KiB)': lambda: Message(blob, BLOB),
+        'unpack blob (64KiB)': blob_message.unpack,
+        'raw blob message (64KiB)': lambda: Message(blob, BLOB).raw(),
+        'pack mixed (5 args)': lambda: Message(mixed, 1, 2., 'three', 4., 5.),
+        'unpack mixed (5 args)': mixed_message.unpack,
+        'pack 64 floats from list': lambda: Message(levels, *LEVELS),
+        'pack 64 floats from array': lambda: Message(levels, LEVELS),
+        'unpack 64 floats': levels_message.unpack,
+        'unpack 16 midi': notes_message.unpack,
+        'unpack 16 timetags': timetags_message.unpack,
+        'parse bundle (16 messages)': lambda: parse_packet(bundle_bytes),
+        'timetag compare': lambda: a < b,
+        'timetag add': lambda: a + 0.5,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-n', '--number', type=int, default=None, help='iterations per benchmark')
+    parser.add_argument('-k', '--filter', default='', help='only run benchmarks whose name contains this')
+    args = parser.parse_args()
+
+    print('%s %s (%s)' % (platform.python_implementation(), platform.python_version(), sys.platform))
+    for name, func in benchmarks().items():
+        if args.filter not in name:
+            continue
+        timer = timeit.Timer(func)
+        number = args.number or timer.autorange()[0]
+        # Best of several runs, which is least affected by other activity (and by warmup, on PyPy)
+        best = min(timer.repeat(repeat=5, number=number)) / number
+        print('%-32s %10.2f us' % (name, best * 1e6))
+
+
+if __name__ == '__main__':
+    main()
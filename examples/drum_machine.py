@@ -28,14 +28,14 @@ BPM = 120
 STEP = 4 / 16 * (60 / BPM)
 FRAMES_PER_STEP = int(RATE * STEP)
 
-KICK = aiolo.Route('/kick', float)
-C_HAT = aiolo.Route('/c_hat', float)
-O_HAT = aiolo.Route('/o_hat', float)
-SNARE = aiolo.Route('/snare', float)
-CLAP = aiolo.Route('/clap', float)
-COWBELL = aiolo.Route('/cowbell', float)
-AIRHORN = aiolo.Route('/airhorn', float)
-EXIT = aiolo.Route('/exit', float)
+KICK = aiolo.Route('/kick')
+C_HAT = aiolo.Route('/c_hat')
+O_HAT = aiolo.Route('/o_hat')
+SNARE = aiolo.Route('/snare')
+CLAP = aiolo.Route('/clap')
+COWBELL = aiolo.Route('/cowbell')
+AIRHORN = aiolo.Route('/airhorn')
+EXIT = aiolo.Route('/exit')
 
 SEQUENCE = ((
     KICK, C_HAT, O_HAT, C_HAT,
@@ -110,13 +110,10 @@ class Machine:
         ])
 
     async def sub_exit(self):
-        async for (stamp, ) in EXIT.sub():
-            self.loop.call_at(stamp, self.exit_task)
+        async for _ in EXIT.sub():
+            await self.exit()
             break
 
-    def exit_task(self):
-        self.loop.create_task(self.exit())
-
     async def exit(self):
         for sub in self.subs.values():
             await sub.unsub()
@@ -128,13 +125,10 @@ class Machine:
     async def sub_drum(self, route, sub):
         wav = get_wav(route)
 
-        def play():
+        async for _ in sub:
+            # sub will yield when the server dispatches a step, which it holds until the step's timetag
             self.stream.write(wav)
 
-        async for (stamp, ) in sub:
-            # sub will yield anytime it receives a trigger
-            self.loop.call_at(stamp, play)
-
 
 def get_wav(route):
     filepath = WAVS_BY_ROUTE[route]
@@ -156,15 +150,17 @@ def subscribe():
 
 
 def publish():
-    start = asyncio.get_event_loop().time() + 5
+    loop = asyncio.get_event_loop()
     address = aiolo.Address(url=SERVER_URL)
-    # send the sequence as a timestamped bundle.
-    # note that timestamps are not wall clock timestamps (we'd use TimeTag for those),
-    # they are asyncio monotonic clock timestamps
-    address.bundle([
-        aiolo.Message(route, start + (STEP * i))
-        for i, route in enumerate(SEQUENCE)
-    ])
+    # stream the sequence as timetagged bundles, each sent shortly before it should play
+    sequencer = aiolo.Sequencer(
+        address,
+        [aiolo.Message(route) for route in SEQUENCE],
+        bpm=BPM,
+        repeat=1)
+    sequencer.start(at=loop.time() + 5)
+    loop.run_until_complete(sequencer.wait())
+    print(sequencer.stats)
 
 
 def config_logging():
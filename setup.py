@@ -54,7 +54,8 @@ def get_cython_compile_time_env(defaults=None):
     env = dict(**defaults or {})
     env['_LO_VERSION'] = get_system_lo_version()
     env.update({
-        'PYPY': __pypy__ is not None
+        'PYPY': __pypy__ is not None,
+        'LINUX': SYSTEM.startswith('linux'),
     })
     return env
 
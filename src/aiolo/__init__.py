@@ -13,13 +13,25 @@ from . import multicasts
 from . import multicastaddresses
 from . import pack
 from . import patterns
+from . import pacers
+from . import packets
 from . import paths
+from . import pools
+from . import protocolservers
 from . import protos
+from . import rings
 from . import routes
+from . import schedulers
+from . import sequencers
+from . import servergroups
+from . import shmaddresses
+from . import shmrings
+from . import shmservers
 from . import subs
 from . import subsasynciterators
 from . import threadedservers
 from . import timetags
+from . import transports
 from . import types
 from . import typespecs
 
@@ -38,13 +50,25 @@ __all__ = \
     + multicastaddresses.__all__ \
     + pack.__all__ \
     + patterns.__all__ \
+    + pacers.__all__ \
+    + packets.__all__ \
     + paths.__all__ \
+    + pools.__all__ \
+    + protocolservers.__all__ \
     + protos.__all__ \
+    + rings.__all__ \
     + routes.__all__ \
+    + schedulers.__all__ \
+    + sequencers.__all__ \
+    + servergroups.__all__ \
+    + shmaddresses.__all__ \
+    + shmrings.__all__ \
+    + shmservers.__all__ \
     + subs.__all__ \
     + subsasynciterators.__all__ \
     + threadedservers.__all__ \
     + timetags.__all__ \
+    + transports.__all__ \
     + types.__all__ \
     + typespecs.__all__
 
@@ -62,13 +86,25 @@ from .multicasts import *
 from .multicastaddresses import *
 from .pack import *
 from .patterns import *
+from .pacers import *
+from .packets import *
 from .paths import *
+from .pools import *
+from .protocolservers import *
 from .protos import *
+from .rings import *
 from .routes import *
+from .schedulers import *
+from .sequencers import *
+from .servergroups import *
+from .shmaddresses import *
+from .shmrings import *
+from .shmservers import *
 from .subs import *
 from .subsasynciterators import *
 from .threadedservers import *
 from .timetags import *
+from .transports import *
 from .types import *
 from .typespecs import *
 
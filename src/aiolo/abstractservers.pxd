@@ -6,8 +6,26 @@ from . cimport typespecs, lo, multicasts, paths
 cdef char * NO_IFACE
 cdef char * NO_IP
 
+# Nesting depth of bundles whose timetags are tracked, beyond which the innermost tracked timetag applies
+cdef enum:
+    MAX_BUNDLE_DEPTH = 8
+
+
+# The timetags of the bundles being dispatched, maintained by liblo's bundle handlers without the GIL
+ctypedef struct bundle_state:
+    lo.lo_timetag timetags[MAX_BUNDLE_DEPTH]
+    int depth
+
 
 cdef class AbstractServer:
+    cdef readonly object delivery
+    cdef readonly object bundle_route
+    cdef readonly object pending_timer
+    cdef readonly int rcvbuf
+    cdef readonly int sndbuf
+    cdef readonly int busy_poll
+    cdef readonly int max_msg_size
+
     # private
     cdef str _url
     cdef str _port
@@ -17,9 +35,24 @@ cdef class AbstractServer:
     cdef dict routing
     cdef object startstoplock
     cdef lo.lo_server lo_server
+    cdef double pending_when
+    cdef bundle_state bundles
+    cdef list batch
 
     cdef int lo_server_start(self) except -1
     cdef int lo_server_stop(self) except -1
+    cdef int schedule_pending(self) except -1
+    cdef int arm_pending(self) except -1
+    cdef int cancel_pending(self) except -1
+    cdef int service_pending(self) except -1
+    cdef int socket_fd(self)
+    cdef int configure_socket(self) except -1
+    cdef lo.lo_method_handler method_handler(self)
+    cdef void * method_user_data(self)
+
+IF LINUX:
+    cdef extern from "<sys/socket.h>":
+        int SO_BUSY_POLL
 
 cdef object pop_server_start_error()
 
@@ -35,3 +68,24 @@ cdef int router(
     lo.lo_message raw_msg,
     void *_route
 ) nogil except 1
+
+cdef int bundle_start(lo.lo_timetag timetag, void *_bundles) nogil
+
+cdef int bundle_end(void *_bundles) nogil
+
+cdef int batch_start(lo.lo_timetag timetag, void *_server) nogil
+
+cdef int batch_end(void *_server) nogil
+
+cdef tuple udp_queue_stats(int fd)
+
+cdef double due_time(AbstractServer server, lo.lo_timetag timetag) except? -1
+
+cdef int route_message(
+    AbstractServer server,
+    const char *path_bytes,
+    const char *typespec_bytes,
+    lo.lo_arg ** argv,
+    int argc,
+    bint threadsafe,
+) except -1
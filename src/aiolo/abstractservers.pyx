@@ -1,13 +1,17 @@
 # cython: language_level=3
 
+import asyncio
 import functools
+import os
+import socket
 import threading
-from typing import Union, Set
+from typing import Any, Dict, Union, Set
 
 from cpython.ref cimport Py_INCREF, Py_DECREF
+from libc.math cimport NAN, isnan
 
-from . import exceptions, logs, protos, routes, types
-from . cimport lo, multicasts, paths, typespecs, pack
+from . import exceptions, logs, protos, routes, schedulers, types
+from . cimport lo, messages, multicasts, paths, timetags, typespecs, pack
 
 __all__ = ['AbstractServer']
 
@@ -15,6 +19,10 @@ __all__ = ['AbstractServer']
 _SERVER_START_ERROR = None
 
 
+# Seconds within which an armed timer already covers a newly queued bundle, about the resolution of loop timers
+cdef double PENDING_RESOLUTION = 0.001
+
+
 cdef char * NO_IFACE = <char*>0
 cdef char * NO_IP = <char*>0
 
@@ -27,15 +35,40 @@ cdef class AbstractServer:
         port: Union[str, int, None] = None,
         proto: Union[str, int, None] = None,
         multicast: Union[multicasts.MultiCast, None] = None,
+        delivery: Union[schedulers.DeliveryQueue, None] = None,
+        bundled: bool = False,
+        rcvbuf: int = 0,
+        sndbuf: int = 0,
+        busy_poll: int = 0,
+        max_msg_size: int = 0,
         **kwargs,
     ):
         url, port, proto, multicast = self._validate(url, port, proto, multicast)
+        if delivery is not None and not isinstance(delivery, schedulers.DeliveryQueue):
+            raise TypeError('Invalid delivery value %s' % repr(delivery))
+        for name, value in (
+                ('rcvbuf', rcvbuf), ('sndbuf', sndbuf), ('busy_poll', busy_poll), ('max_msg_size', max_msg_size)):
+            if value < 0:
+                raise ValueError('%s must be >= 0, got %r' % (name, value))
+        IF not LINUX:
+            if busy_poll:
+                raise ValueError('busy_poll requires Linux')
+        if bundled:
+            self.bundle_route = routes.BundleRoute()
+            if delivery is None:
+                # liblo's queue would dispatch the messages of future bundles separately, outside their bundle
+                delivery = schedulers.DeliveryQueue()
 
         self._url = url
         self._port = port
         self._proto = proto
         self._multicast = multicast
         self._queue_enabled = True # default is on
+        self.delivery = delivery
+        self.rcvbuf = rcvbuf
+        self.sndbuf = sndbuf
+        self.busy_poll = busy_poll
+        self.max_msg_size = max_msg_size
         self.routing = {}
         self.startstoplock = threading.RLock()
 
@@ -46,8 +79,26 @@ cdef class AbstractServer:
         port: Union[str, int, None] = None,
         proto: Union[str, int, None] = None,
         multicast: Union[multicasts.MultiCast, None] = None,
+        delivery: Union[schedulers.DeliveryQueue, None] = None,
+        bundled: bool = False,
+        rcvbuf: int = 0,
+        sndbuf: int = 0,
+        busy_poll: int = 0,
+        max_msg_size: int = 0,
         **kwargs,
     ):
+        """
+        When delivery is given, bundles with a future timetag are held in it rather than in liblo's queue, which is
+        disabled.
+
+        When bundled is True, the messages of each bundle are published together to bundle_route, as a single
+        ReceivedBundle, instead of to their routes; nested bundles are flattened into the outermost. Future bundles
+        are held in delivery, or a default DeliveryQueue.
+
+        rcvbuf and sndbuf set the receiving socket's SO_RCVBUF and SO_SNDBUF, which the kernel may clamp, busy_poll
+        sets SO_BUSY_POLL in microseconds (Linux only), and max_msg_size sets the largest message liblo receives over
+        TCP. Zero leaves the system default. The sizes in effect are reported by stats.
+        """
         pass
 
     def __repr__(self):
@@ -173,15 +224,43 @@ cdef class AbstractServer:
 
     @property
     def queue_enabled(self) -> bool:
-        return self._queue_enabled
+        return self._queue_enabled and self.delivery is None
 
     @queue_enabled.setter
     def queue_enabled(self, value: bool):
         cdef bint val = bool(value)
-        if self.running:
+        if self.running and self.delivery is None:
             lo.lo_server_enable_queue(self.lo_server, val, val)
         self._queue_enabled = val
 
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """
+        The receiving socket's buffer sizes, and for UDP on Linux, the bytes waiting in its kernel receive queue and
+        the datagrams the kernel dropped because the queue was full, next to aiolo's own counters. Values which
+        cannot be read, such as kernel counters for TCP, are None.
+        """
+        cdef int fd = self.socket_fd()
+        stats = {
+            'rcvbuf': None,
+            'sndbuf': None,
+            'rx_queue': None,
+            'kernel_drops': None,
+            'max_msg_size': lo.lo_server_max_msg_size(self.lo_server, 0) if self.running else None,
+        }
+        if fd >= 0:
+            sock = socket.socket(fileno=fd)
+            try:
+                stats['rcvbuf'] = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+                stats['sndbuf'] = sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)
+                if sock.type == socket.SOCK_DGRAM and sock.family in (socket.AF_INET, socket.AF_INET6):
+                    stats['rx_queue'], stats['kernel_drops'] = udp_queue_stats(fd)
+            finally:
+                sock.detach()
+        if self.delivery is not None:
+            stats['delivery'] = self.delivery.stats
+        return stats
+
     @property
     def events_pending(self) -> bool:
         return bool(lo.lo_server_events_pending(self.lo_server))
@@ -207,13 +286,26 @@ cdef class AbstractServer:
                 self.lo_server,
                 NULL,
                 NULL,
-                <lo.lo_method_handler>router,
-                <void*>self
+                self.method_handler(),
+                self.method_user_data()
             ) is NULL:
                 self.stop(force=True)
                 raise exceptions.StartError('Could not add default method')
 
-            lo.lo_server_enable_queue(self.lo_server, self._queue_enabled, 0)
+            try:
+                self.configure_socket()
+            except OSError as exc:
+                self.stop(force=True)
+                raise exceptions.StartError('%r: could not configure socket: %s' % (self, exc)) from exc
+
+            lo.lo_server_enable_queue(self.lo_server, self.queue_enabled, 0)
+            self.bundles.depth = 0
+            self.batch = None
+            if self.bundle_route is not None:
+                lo.lo_server_add_bundle_handlers(self.lo_server, batch_start, batch_end, <void*>self)
+            elif self.delivery is not None:
+                # Track the timetag of the bundle being dispatched, so its messages can be held until it is due
+                lo.lo_server_add_bundle_handlers(self.lo_server, bundle_start, bundle_end, <void*>&self.bundles)
 
             lo.lo_server_set_error_context(self.lo_server, <void*>self)
             IF DEBUG: logs.logger.debug('%r: started', self)
@@ -227,13 +319,35 @@ cdef class AbstractServer:
         try:
             if not force and not self.running:
                 raise exceptions.StopError('%r not started, cannot stop' % self)
+            self.cancel_pending()
             self.lo_server_stop()
+            if self.delivery is not None:
+                self.delivery.close()
             # Unsteal the error_context ref
             Py_DECREF(self)
             IF DEBUG: logs.logger.debug('%r: stopped', self)
         finally:
             self.startstoplock.release()
 
+    def dispatch(self, data: Any) -> int:
+        """
+        Dispatch a serialized OSC packet to this server's routes as though it had been received, such as a packet
+        read from a socket the server does not own. Bundles with a future timetag are queued like received ones.
+        Must be called from the thread which services the server. Returns the number of bytes dispatched.
+        """
+        cdef:
+            const unsigned char[::1] view = messages.as_bytes_view(data)
+            int count
+        if not self.running:
+            raise exceptions.RouteError('%r not started, cannot dispatch' % self)
+        if not len(view):
+            raise ValueError('Invalid OSC packet: empty')
+        count = lo.lo_server_dispatch_data(self.lo_server, <void*>&view[0], len(view))
+        if count < 0:
+            raise ValueError('%r: could not dispatch packet: liblo error %s' % (self, -count))
+        self.schedule_pending()
+        return count
+
     def route(self, route: types.RouteTypes, typespec: types.TypeSpecTypes = '') -> routes.Route:
         """
         Create a route for this server
@@ -304,6 +418,82 @@ cdef class AbstractServer:
     cdef int lo_server_stop(self) except -1:
         raise NotImplementedError
 
+    cdef int schedule_pending(self) except -1:
+        # Servers which poll continuously service queued bundles by themselves
+        return 0
+
+    cdef int arm_pending(self) except -1:
+        """
+        Keep a single loop timer armed for the earliest queued bundle, moving it earlier if need be.
+        """
+        cdef double delay
+        if self.lo_server is NULL or not lo.lo_server_events_pending(self.lo_server):
+            return self.cancel_pending()
+        delay = lo.lo_server_next_event_delay(self.lo_server)
+        loop = asyncio.get_event_loop()
+        when = loop.time() + delay
+        if self.pending_timer is not None:
+            if self.pending_when <= when + PENDING_RESOLUTION:
+                return 0
+            self.pending_timer.cancel()
+        IF DEBUG: logs.logger.debug('%r: pending server events, will check in %ss', self, delay)
+        self.pending_when = when
+        self.pending_timer = loop.call_at(when, self._on_pending_timer)
+        return 0
+
+    cdef int cancel_pending(self) except -1:
+        if self.pending_timer is not None:
+            self.pending_timer.cancel()
+            self.pending_timer = None
+        return 0
+
+    cdef int service_pending(self) except -1:
+        if self.lo_server is NULL:
+            return 0
+        # Dispatch every bundle which has come due before re-arming, so none waits for another turn of the loop
+        with nogil:
+            while lo.lo_server_recv_noblock(self.lo_server, 0):
+                pass
+        return self.arm_pending()
+
+    def _on_pending_timer(self):
+        self.pending_timer = None
+        self.service_pending()
+
+    cdef int socket_fd(self):
+        """
+        The socket which receives packets, or -1 if there is none.
+        """
+        if self.lo_server is NULL:
+            return -1
+        return lo.lo_server_get_socket_fd(self.lo_server)
+
+    cdef int configure_socket(self) except -1:
+        cdef int fd = self.socket_fd()
+        if self.max_msg_size:
+            lo.lo_server_max_msg_size(self.lo_server, self.max_msg_size)
+        if fd < 0 or not (self.rcvbuf or self.sndbuf or self.busy_poll):
+            return 0
+        # Wraps the fd without owning it, as it is closed with the server
+        sock = socket.socket(fileno=fd)
+        try:
+            if self.rcvbuf:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+            if self.sndbuf:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.sndbuf)
+            IF LINUX:
+                if self.busy_poll:
+                    sock.setsockopt(socket.SOL_SOCKET, SO_BUSY_POLL, self.busy_poll)
+        finally:
+            sock.detach()
+        return 0
+
+    cdef lo.lo_method_handler method_handler(self):
+        return <lo.lo_method_handler>router
+
+    cdef void * method_user_data(self):
+        return <void*>self
+
 
 cdef object pop_server_start_error():
     global _SERVER_START_ERROR
@@ -344,24 +534,140 @@ cdef int router(
     void *_server
 ) nogil except 1:
     cdef int retval = 0
-    cdef lo.lo_timetag lo_timetag
     with gil:
-        server = <AbstractServer>_server
-        path_str = (<bytes>path_bytes).decode('utf8')
-        typespec_str = (<bytes>typespec_bytes).decode('utf8')
         try:
-            IF DEBUG: logs.logger.debug('%r: unpacking data for path %r, typespec %r (length %s)', server, path_str, typespec_str, argc)
-            for route in server.match(path_str, typespec_str):
-                if route.matches_any_args:
-                    typespec = <typespecs.TypeSpec>typespecs.TypeSpec(typespec_str)
-                else:
-                    typespec = <typespecs.TypeSpec>route.typespec
-                IF DEBUG: logs.logger.debug('%r: unpacking data for route %r', server, route)
-                data = pack.unpack_args(typespec, argv, argc)
-                IF DEBUG: logs.logger.debug('%r: received message %r', server, data)
-                route.pub_soon_threadsafe(data)
+            route_message(<AbstractServer>_server, path_bytes, typespec_bytes, argv, argc, True)
         except BaseException as exc:
             logs.logger.exception(exc)
             retval = 1
             raise
     return retval
+
+
+cdef int bundle_start(lo.lo_timetag timetag, void *_bundles) nogil:
+    cdef bundle_state * bundles = <bundle_state*>_bundles
+    if bundles.depth < MAX_BUNDLE_DEPTH:
+        bundles.timetags[bundles.depth] = timetag
+    bundles.depth += 1
+    return 0
+
+
+cdef int bundle_end(void *_bundles) nogil:
+    cdef bundle_state * bundles = <bundle_state*>_bundles
+    if bundles.depth > 0:
+        bundles.depth -= 1
+    return 0
+
+
+cdef int batch_start(lo.lo_timetag timetag, void *_server) nogil:
+    with gil:
+        server = <AbstractServer>_server
+        bundle_start(timetag, &server.bundles)
+        if server.bundles.depth == 1:
+            server.batch = []
+    return 0
+
+
+cdef int batch_end(void *_server) nogil:
+    cdef lo.lo_timetag timetag
+    with gil:
+        server = <AbstractServer>_server
+        bundle_end(&server.bundles)
+        if server.bundles.depth:
+            return 0
+        items, server.batch = server.batch, None
+        if not items:
+            return 0
+        timetag = server.bundles.timetags[0]
+        try:
+            received = routes.ReceivedBundle(timetags.lo_timetag_to_timetag(timetag), items)
+            when = due_time(server, timetag)
+            if not isnan(when):
+                server.delivery.push_threadsafe(when, server.bundle_route, received)
+            else:
+                server.bundle_route.pub_soon_threadsafe(received)
+        except BaseException as exc:
+            logs.logger.exception(exc)
+    return 0
+
+
+cdef tuple udp_queue_stats(int fd):
+    """
+    The bytes queued in a UDP socket's kernel receive queue and the datagrams it has dropped, from /proc/net/udp.
+    SO_RXQ_OVFL would report the same drop count, but only alongside each datagram, which liblo does not read.
+    """
+    IF LINUX:
+        inode = os.fstat(fd).st_ino
+        for name in ('/proc/net/udp', '/proc/net/udp6'):
+            try:
+                with open(name) as f:
+                    next(f)
+                    for line in f:
+                        # sl local rem st tx_queue:rx_queue tr:when retrnsmt uid timeout inode ref pointer drops
+                        fields = line.split()
+                        if int(fields[9]) == inode:
+                            return int(fields[4].split(':')[1], 16), int(fields[-1])
+            except OSError:
+                pass
+    return None, None
+
+
+cdef double due_time(AbstractServer server, lo.lo_timetag timetag) except? -1:
+    """
+    The event loop time at which a bundle with timetag should be delivered, or NaN to deliver it now. Times in the
+    past, even before the loop's epoch, are passed to the delivery queue so that its late policy applies.
+    """
+    cdef lo.lo_timetag now
+    if server.delivery is None or (timetag.sec == 0 and timetag.frac == 1):
+        return NAN
+    lo.lo_timetag_now(&now)
+    return server.delivery.loop.time() + lo.lo_timetag_diff(timetag, now)
+
+
+cdef int route_message(
+    AbstractServer server,
+    const char *path_bytes,
+    const char *typespec_bytes,
+    lo.lo_arg ** argv,
+    int argc,
+    bint threadsafe,
+) except -1:
+    """
+    Unpack a message's args for each matching route and publish them; threadsafe is False when called on the
+    routes' event loop.
+    """
+    cdef double when = NAN
+
+    batch = server.batch
+    if batch is None and server.bundles.depth:
+        when = due_time(server, server.bundles.timetags[min(server.bundles.depth, MAX_BUNDLE_DEPTH) - 1])
+
+    path_str = (<bytes>path_bytes).decode('utf8')
+    typespec_str = (<bytes>typespec_bytes).decode('utf8')
+    IF DEBUG: logs.logger.debug('%r: unpacking data for path %r, typespec %r (length %s)', server, path_str, typespec_str, argc)
+    for route in server.match(path_str, typespec_str):
+        if route.matches_any_args:
+            typespec = <typespecs.TypeSpec>typespecs.TypeSpec(typespec_str)
+        else:
+            typespec = <typespecs.TypeSpec>route.typespec
+        IF DEBUG: logs.logger.debug('%r: unpacking data for route %r', server, route)
+        array_type = pack.numeric_array_type(typespec) if route.as_array else 0
+        if array_type:
+            data = pack.unpack_array(array_type, argv, argc)
+        elif route.record is not None:
+            data = pack.unpack_record(typespec, route.record, argv, argc)
+        else:
+            data = pack.unpack_args(typespec, argv, argc)
+        IF DEBUG: logs.logger.debug('%r: received message %r', server, data)
+        if batch is not None:
+            batch.append((route, data))
+        elif not isnan(when):
+            if threadsafe:
+                server.delivery.push_threadsafe(when, route, data)
+            else:
+                server.delivery.push(when, route, data)
+        elif threadsafe:
+            route.pub_soon_threadsafe(data)
+        else:
+            route.pub_nowait(data)
+    return 0
@@ -4,10 +4,14 @@ from . cimport lo, messages
 
 cdef class Address:
 
+    cdef public object pacer
+
     # private
     cdef lo.lo_address lo_address
     cdef bint _no_delay
     cdef bint _stream_slip
+    cdef object _transport
+    cdef object _pool
 
     cdef int _message(self, messages.Message bundle) except -1
     cdef int _bundle(self, messages.Bundle bundle) except -1
@@ -1,9 +1,10 @@
 # cython: language_level=3
 
 import datetime
+import time
 from typing import Union
 
-from . import exceptions, ips, logs, protos, types
+from . import exceptions, ips, logs, pacers, pools, protos, transports, types
 from . cimport lo, messages, paths, timetags
 
 
@@ -21,6 +22,8 @@ cdef class Address:
         no_delay: bool = False,
         stream_slip: bool = False,
         ttl: int = -1,
+        pool: Union[bool, pools.TransportPool, None] = None,
+        pacer: Union[pacers.Pacer, None] = None,
     ):
         cdef char * chost = NULL
 
@@ -49,8 +52,13 @@ cdef class Address:
         self.no_delay = no_delay
         self.stream_slip = stream_slip
         self.ttl = ttl
+        self.pool = pool
+        self.pacer = pacer
 
     def __dealloc__(self):
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
         lo.lo_address_free(self.lo_address)
         self.lo_address = NULL
 
@@ -158,6 +166,53 @@ cdef class Address:
         if lo.lo_address_set_iface(self.lo_address, iface, i) != 0:
             raise ValueError('Could not set ip to %s' % repr(ip))
 
+    @property
+    def pool(self) -> Union[pools.TransportPool, None]:
+        return self._pool
+
+    @pool.setter
+    def pool(self, pool: Union[bool, pools.TransportPool, None]):
+        """
+        Draw transports for async sends from a TransportPool; True uses the default pool for the event loop.
+        """
+        if pool is True:
+            pool = pools.get_default_pool()
+        elif pool is False:
+            pool = None
+        elif pool is not None and not isinstance(pool, pools.TransportPool):
+            raise TypeError('Invalid pool value %s' % repr(pool))
+        self._pool = pool
+
+    @property
+    def transport(self) -> transports.Transport:
+        """
+        The event loop managed transport used by send_async(), message_async() and bundle_async()
+        """
+        if self._pool is not None:
+            raise ValueError('%r draws its transports from %r' % (self, self._pool))
+        if self._transport is None:
+            self._transport = transports.Transport(
+                self.proto,
+                self.host,
+                self.port,
+                stream_slip=self.stream_slip,
+                no_delay=self.no_delay,
+                ttl=self.ttl)
+        return self._transport
+
+    def set_write_buffer_limits(self, high: Union[int, None] = None, low: Union[int, None] = None):
+        """
+        Set the watermarks at which message_async() and friends will wait for the peer to catch up.
+        """
+        self.transport.set_write_buffer_limits(high, low)
+
+    def close(self):
+        """
+        Close the transport used for async sends, if it has been opened. Pooled transports are left open.
+        """
+        if self._transport is not None:
+            self._transport.close()
+
     def check_send_error(Address self):
         if lo.lo_address_errno(self.lo_address):
             raise exceptions.SendError(
@@ -169,15 +224,23 @@ cdef class Address:
         return self.message(message)
 
     def message(self, message: messages.Message) -> int:
+        """
+        Send a message. If the address has a pacer and the send must wait for the rate, it is queued and 0 is returned;
+        if the pacer's queue is full, asyncio.QueueFull is raised.
+        """
         if message.route.path.matches_any:
             raise ValueError('Message must be sent to a specific path or pattern')
+        if self.pacer is not None:
+            return self._paced(message, message.nbytes)
         return self._message(message)
 
     def delay(self, delay: Union[int, float, datetime.timedelta], route: types.RouteTypes, *args: types.MessageTypes):
+        if isinstance(delay, datetime.timedelta):
+            delay = delay.total_seconds()
         message = messages.Message(route, *args)
-        timetag = timetags.TimeTag(datetime.datetime.now(datetime.timezone.utc))
-        timetag += delay
-        bundle = messages.Bundle(message, timetag)
+        bundle = messages.Bundle(message, timetags.TimeTag(time.time() + delay))
+        if self.pacer is not None:
+            return self._paced(bundle, bundle.nbytes)
         return self._bundle(bundle)
 
     def bundle(self, bundle: types.BundleTypes, timetag: types.TimeTagTypes = None) -> int:
@@ -185,9 +248,62 @@ cdef class Address:
             bundle = messages.Bundle(bundle, timetag)
         elif timetag is not None:
             raise ValueError('Cannot provide Bundle instance and timetag together')
+        if self.pacer is not None:
+            return self._paced(bundle, bundle.nbytes)
         count = self._bundle(bundle)
         return count
 
+    def _paced(self, item: Union[messages.Message, messages.Bundle], size: int) -> int:
+        count = self.pacer.submit(lambda: self._send_now(item), size)
+        if count is None:
+            IF DEBUG: logs.logger.debug('%r: deferred %r', self, item)
+            return 0
+        return count
+
+    def _send_now(self, item: Union[messages.Message, messages.Bundle]) -> int:
+        if isinstance(item, messages.Message):
+            return self._message(item)
+        return self._bundle(item)
+
+    async def drain(self):
+        """
+        Wait until sends queued by the pacer have been released.
+        """
+        if self.pacer is not None:
+            await self.pacer.drain()
+
+    async def send_async(self, route: Union[types.RouteTypes], *data: types.MessageTypes) -> int:
+        message = messages.Message(route, *data)
+        return await self.message_async(message)
+
+    async def message_async(self, message: messages.Message) -> int:
+        if message.route.path.matches_any:
+            raise ValueError('Message must be sent to a specific path or pattern')
+        IF DEBUG: logs.logger.debug('%r: sending %r', self, message)
+        count = await self._send_async((<messages.Message>message).serialized())
+        IF DEBUG: logs.logger.debug('%r: sent %s bytes', self, count)
+        return count
+
+    async def bundle_async(self, bundle: types.BundleTypes, timetag: types.TimeTagTypes = None) -> int:
+        if not isinstance(bundle, messages.Bundle):
+            bundle = messages.Bundle(bundle, timetag)
+        elif timetag is not None:
+            raise ValueError('Cannot provide Bundle instance and timetag together')
+        IF DEBUG: logs.logger.debug('%r: sending %r', self, bundle)
+        count = await self._send_async((<messages.Bundle>bundle).serialized())
+        IF DEBUG: logs.logger.debug('%r: sent %s bytes', self, count)
+        return count
+
+    async def _send_async(self, data: bytes) -> int:
+        if self.pacer is not None:
+            await self.pacer.wait(len(data))
+        if self._pool is None:
+            transport = self.transport
+        else:
+            transport = await self._pool.acquire(
+                self.proto, self.host, self.port, stream_slip=self.stream_slip, no_delay=self.no_delay, ttl=self.ttl)
+        return await transport.send(data)
+
     cdef int _message(self, messages.Message message) except -1:
         path = (<paths.Path>message.route.path).as_bytes
         cdef:
@@ -197,7 +313,8 @@ cdef class Address:
 
         IF DEBUG: logs.logger.debug('%r: sending %r', self, message)
 
-        count = lo.lo_send_message(self.lo_address, p, lo_message)
+        with nogil:
+            count = lo.lo_send_message(self.lo_address, p, lo_message)
 
         self.check_send_error()
         if count <= 0:
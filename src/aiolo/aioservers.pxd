@@ -2,10 +2,48 @@
 
 from . cimport abstractservers
 
+
+cdef extern from "<sys/socket.h>" nogil:
+    int MSG_DONTWAIT
+    int MSG_TRUNC
+    ssize_t recv(int sockfd, void * buf, size_t len, int flags)
+
+
+IF LINUX:
+    cdef extern from "<sys/socket.h>" nogil:
+        struct iovec:
+            void * iov_base
+            size_t iov_len
+        struct msghdr:
+            void * msg_name
+            unsigned int msg_namelen
+            iovec * msg_iov
+            size_t msg_iovlen
+            void * msg_control
+            size_t msg_controllen
+            int msg_flags
+        struct mmsghdr:
+            msghdr msg_hdr
+            unsigned int msg_len
+        struct timespec:
+            pass
+        int recvmmsg(int sockfd, mmsghdr * msgvec, unsigned int vlen, int flags, timespec * timeout)
+
+
 cdef class AioServer(abstractservers.AbstractServer):
     # private
     cdef object sock
+    cdef unsigned int _recv_batch
+    cdef char * recv_buffer
+    IF LINUX:
+        cdef mmsghdr * recv_msgs
+        cdef iovec * recv_iovs
 
     cdef int lo_server_start(self) except -1
     cdef int lo_server_stop(self) except -1
+    cdef int alloc_recv_buffers(self) except -1
+    cdef void free_recv_buffers(self)
+    cdef int recv_batched(self) nogil
+    cdef int schedule_pending(self) except -1
+    cdef int service_pending(self) except -1
     cdef void _on_sock_readable(AioServer self)
@@ -5,15 +5,44 @@ from . cimport lo, messages, typespecs
 
 
 cdef class Message:
-    cdef public object route
     cdef public typespecs.TypeSpec typespec
     cdef lo.lo_message lo_message
 
+    # private
+    cdef object _route
+    cdef bytes _raw
+    cdef Py_hash_t _hash
+    cdef Py_ssize_t _exports
+
+    cdef bytes serialized(Message self)
+
 
 cdef class Bundle:
     cdef public object timetag
     cdef lo.lo_bundle lo_bundle
     cdef list msgs
+
+    # private
+    cdef bytes _raw
+    cdef Py_hash_t _hash
+    cdef Py_ssize_t _exports
+    cdef unsigned long _version
+    cdef unsigned long _raw_version
+
+    cdef unsigned long total_version(Bundle self)
+    cdef bytes serialized(Bundle self)
     cpdef object add(Bundle self, msg: types.BundleTypes)
     cpdef object add_message(Bundle self, messages.Message message)
     cpdef object add_bundle(Bundle self, Bundle bundle)
+
+
+# Not exported to Python
+cdef object as_bytes_view(object data)
+
+cdef bint is_bundle_ptr(const char * data, size_t size) nogil
+
+cdef Message message_from_ptr(char * data, size_t size)
+
+cdef Bundle bundle_from_ptr(char * data, size_t size, int depth)
+
+cdef object packet_from_ptr(char * data, size_t size)
@@ -2,7 +2,11 @@
 
 from typing import Any, Iterable, Union, Iterator
 
-from libc.stdlib cimport malloc, free
+from cpython.buffer cimport PyBUF_ND, PyBUF_STRIDES, PyBUF_WRITABLE, PyBUF_FORMAT, PyObject_GetBuffer, \
+    PyBuffer_Release
+from cpython.bytes cimport PyBytes_AS_STRING, PyBytes_FromStringAndSize
+from libc.stdint cimport uint32_t
+from libc.string cimport memcmp, memcpy
 
 cimport cython
 
@@ -25,11 +29,29 @@ IF not PYPY:
     cdef array.array MESSAGE_ARRAY_TEMPLATE = array.array('b')
 
 
+# Passed to Message() to construct an empty instance, which is then filled in from a deserialized lo_message
+cdef object FROM_LO_MESSAGE = object()
+
+# The header of a serialized bundle, followed by its timetag
+cdef char * BUNDLE_HEADER = b'#bundle'
+cdef size_t BUNDLE_HEADER_SIZE = 8
+cdef size_t BUNDLE_PREAMBLE_SIZE = 16
+
+# Nested bundles deeper than this are rejected, rather than recursing without bound on malicious input
+MAX_BUNDLE_DEPTH = 32
+
+# Routes of deserialized messages, keyed by (path, types), since compiling a Route's path pattern is expensive
+cdef dict ROUTE_CACHE = {}
+cdef Py_ssize_t ROUTE_CACHE_SIZE = 1024
+
+
 @cython.freelist(10)
 cdef class Message:
     def __cinit__(self, route: types.RouteTypes, *args: types.MessageTypes):
         cdef typespecs.TypeSpec typespec
-        if not isinstance(route, routes.Route):
+        if route is FROM_LO_MESSAGE:
+            return
+        elif not isinstance(route, routes.Route):
             typespec = typespecs.TypeSpec.guess(args)
             route = routes.Route(route, typespec)
         elif route.typespec.matches_any:
@@ -37,24 +59,62 @@ cdef class Message:
         else:
             typespec = <typespecs.TypeSpec>route.typespec
 
-        self.route = route
+        self._route = route
         self.typespec = typespec
         self.lo_message = pack.pack_lo_message(typespec, args)
+        # Hold a reference, so that the lo_message outlives any bundles it is added to
+        lo.lo_message_incref(self.lo_message)
 
     def __init__(Message self, route: types.RouteTypes, *data):
         pass
 
+    def __dealloc__(Message self):
+        lo.lo_message_free(self.lo_message)
+        self.lo_message = NULL
+
+    @staticmethod
+    def from_raw(data: Any) -> Message:
+        """
+        Parse a serialized OSC message from a bytes-like object, such as the output of raw() or a captured packet.
+        """
+        cdef const unsigned char[::1] view = as_bytes_view(data)
+        if not len(view):
+            raise ValueError('Invalid OSC message: empty')
+        return message_from_ptr(<char*>&view[0], len(view))
+
     def __repr__(Message self):
         return 'Message(%r, %r)' % (self.route, self.unpack())
 
-    def __hash__(self):
-        return hash(b'Message:' + bytes(self.raw()))
+    def __hash__(Message self):
+        self.serialized()
+        return self._hash
 
     def __eq__(Message self, other: Any) -> bool:
+        if self is other:
+            return True
         if not isinstance(other, Message):
             return False
-        cdef message = <Message>other
-        return self.raw() == other.raw()
+        raw = self.serialized()
+        other_raw = (<Message>other).serialized()
+        return self._hash == (<Message>other)._hash and raw == other_raw
+
+    def __getbuffer__(Message self, Py_buffer *buffer, int flags):
+        fill_buffer(self, self.serialized(), buffer, flags)
+        self._exports += 1
+
+    def __releasebuffer__(Message self, Py_buffer *buffer):
+        self._exports -= 1
+
+    @property
+    def route(Message self):
+        return self._route
+
+    @route.setter
+    def route(Message self, route: routes.Route):
+        if self._exports:
+            raise BufferError('Cannot change the route of a Message while its buffer is exported')
+        self._route = route
+        self._raw = None
 
     def __add__(Message self, other: types.BundleTypes):
         from aiolo import Bundle
@@ -64,6 +124,15 @@ cdef class Message:
     def timetag(self):
         return timetags.lo_timetag_to_timetag(lo.lo_message_get_timestamp(self.lo_message))
 
+    @property
+    def nbytes(Message self) -> int:
+        """
+        The size of the serialized message.
+        """
+        if self._raw is not None:
+            return len(self._raw)
+        return lo.lo_message_length(self.lo_message, self._route.path.as_bytes)
+
     def unpack(Message self) -> list:
         cdef:
             int argc = lo.lo_message_get_argc(self.lo_message)
@@ -72,23 +141,50 @@ cdef class Message:
 
     IF PYPY:
         def raw(Message self) -> array.array:
-            cdef size_t length = lo.lo_message_length(self.lo_message, self.route.path.as_bytes)
-            cdef void* raw = malloc(length)
-            arr = array.array('b')
-            lo.lo_message_serialise(self.lo_message, self.route.path.as_bytes, raw, &length)
-            for i in range(length):
-                arr.append((<char*>raw)[i])
-            try:
-                return arr
-            finally:
-                free(raw)
+            return array.array('b', self.serialized())
     ELSE:
         def raw(Message self) -> array.array:
-            cdef size_t length = lo.lo_message_length(self.lo_message, self.route.path.as_bytes)
-            cdef array.array arr = array.clone(MESSAGE_ARRAY_TEMPLATE, length, zero=True)
-            lo.lo_message_serialise(self.lo_message, self.route.path.as_bytes, <void*>arr.data.as_voidptr, &length)
+            cdef bytes raw = self.serialized()
+            cdef array.array arr = array.clone(MESSAGE_ARRAY_TEMPLATE, len(raw), zero=False)
+            memcpy(arr.data.as_voidptr, PyBytes_AS_STRING(raw), len(raw))
             return arr
 
+    def serialize_into(Message self, buf: Any, Py_ssize_t offset = 0) -> int:
+        """
+        Serialize the message into a writable buffer, such as a bytearray or mmap, at offset.
+        Returns the number of bytes written.
+        """
+        path = self._route.path.as_bytes
+        cdef:
+            char * p = path
+            Py_buffer view
+            size_t length
+        PyObject_GetBuffer(buf, &view, PyBUF_WRITABLE)
+        try:
+            length = lo.lo_message_length(self.lo_message, p)
+            check_fits(offset, length, view.len)
+            if self._raw is not None:
+                memcpy(<char*>view.buf + offset, PyBytes_AS_STRING(self._raw), length)
+            else:
+                lo.lo_message_serialise(self.lo_message, p, <char*>view.buf + offset, &length)
+            return length
+        finally:
+            PyBuffer_Release(&view)
+
+    cdef bytes serialized(Message self):
+        path = self._route.path.as_bytes
+        cdef:
+            char * p = path
+            size_t length
+            bytes raw
+        if self._raw is None:
+            length = lo.lo_message_length(self.lo_message, p)
+            raw = PyBytes_FromStringAndSize(NULL, length)
+            lo.lo_message_serialise(self.lo_message, p, PyBytes_AS_STRING(raw), &length)
+            self._raw = raw
+            self._hash = hash(raw)
+        return self._raw
+
 
 @cython.freelist(10)
 cdef class Bundle:
@@ -106,6 +202,8 @@ cdef class Bundle:
         self.lo_bundle = lo.lo_bundle_new((<timetags.TimeTag>timetag).lo_timetag)
         if self.lo_bundle is NULL:
             raise MemoryError
+        # Hold a reference, so that the lo_bundle outlives any bundles it is nested in
+        lo.lo_bundle_incref(self.lo_bundle)
         self.msgs = []
         if isinstance(msgs, messages.Message):
             self.add_message(msgs)
@@ -122,24 +220,46 @@ cdef class Bundle:
 
     def __dealloc__(Bundle self):
         lo.lo_bundle_free(self.lo_bundle)
+        self.lo_bundle = NULL
+
+    @staticmethod
+    def from_raw(data: Any) -> Bundle:
+        """
+        Parse a serialized OSC bundle, including any nested bundles, from a bytes-like object.
+        """
+        cdef const unsigned char[::1] view = as_bytes_view(data)
+        if not len(view):
+            raise ValueError('Invalid OSC bundle: empty')
+        return bundle_from_ptr(<char*>&view[0], len(view), 0)
 
     def __repr__(Bundle self):
         return 'Bundle(%r, %r)' % (self.msgs, self.timetag)
 
-    def __hash__(self):
-        return hash(b'Bundle:' + bytes(self.raw()))
+    def __hash__(Bundle self):
+        self.serialized()
+        return self._hash
 
     def __eq__(Bundle self, other: Any) -> bool:
+        if self is other:
+            return True
         if not isinstance(other, Bundle):
             return False
-        return self.timetag == (<Bundle>other).timetag \
-               and self.msgs == (<Bundle>other).msgs
+        raw = self.serialized()
+        other_raw = (<Bundle>other).serialized()
+        return self._hash == (<Bundle>other)._hash and raw == other_raw
 
     def __lt__(Bundle self, other: Any) -> bool:
         if not isinstance(other, Bundle):
             return False
         return self.timetag < (<Bundle>other).timetag
 
+    def __getbuffer__(Bundle self, Py_buffer *buffer, int flags):
+        fill_buffer(self, self.serialized(), buffer, flags)
+        self._exports += 1
+
+    def __releasebuffer__(Bundle self, Py_buffer *buffer):
+        self._exports -= 1
+
     def __gt__(Bundle self, other: Any) -> bool:
         if not isinstance(other, Bundle):
             return False
@@ -167,25 +287,69 @@ cdef class Bundle:
     def __getitem__(Bundle self, item) -> Union[Bundle, messages.Message]:
         return (<Bundle>self).msgs[item]
 
+    @property
+    def nbytes(Bundle self) -> int:
+        """
+        The size of the serialized bundle.
+        """
+        if self._raw is not None and self._raw_version == self.total_version():
+            return len(self._raw)
+        return lo.lo_bundle_length(self.lo_bundle)
+
     IF PYPY:
         def raw(Bundle self) -> array.array:
-            cdef size_t length = lo.lo_bundle_length(self.lo_bundle)
-            cdef void* raw = malloc(length)
-            arr = array.array('b')
-            lo.lo_bundle_serialise(self.lo_bundle, raw, &length)
-            for i in range(length):
-                arr.append((<char*>raw)[i])
-            try:
-                return arr
-            finally:
-                free(raw)
+            return array.array('B', self.serialized())
     ELSE:
         def raw(Bundle self) -> array.array:
-            cdef size_t length = lo.lo_bundle_length(self.lo_bundle)
-            cdef array.array arr = array.clone(BUNDLE_ARRAY_TEMPLATE, length, zero=True)
-            lo.lo_bundle_serialise(self.lo_bundle, <void*>arr.data.as_voidptr, &length)
+            cdef bytes raw = self.serialized()
+            cdef array.array arr = array.clone(BUNDLE_ARRAY_TEMPLATE, len(raw), zero=False)
+            memcpy(arr.data.as_voidptr, PyBytes_AS_STRING(raw), len(raw))
             return arr
 
+    def serialize_into(Bundle self, buf: Any, Py_ssize_t offset = 0) -> int:
+        """
+        Serialize the bundle into a writable buffer, such as a bytearray or mmap, at offset.
+        Returns the number of bytes written.
+        """
+        cdef:
+            Py_buffer view
+            size_t length
+        PyObject_GetBuffer(buf, &view, PyBUF_WRITABLE)
+        try:
+            length = lo.lo_bundle_length(self.lo_bundle)
+            check_fits(offset, length, view.len)
+            if self._raw is not None and self._raw_version == self.total_version():
+                memcpy(<char*>view.buf + offset, PyBytes_AS_STRING(self._raw), length)
+            else:
+                lo.lo_bundle_serialise(self.lo_bundle, <char*>view.buf + offset, &length)
+            return length
+        finally:
+            PyBuffer_Release(&view)
+
+    cdef unsigned long total_version(Bundle self):
+        # Nested bundles may be changed after they are added, which changes this bundle's serialization too
+        cdef unsigned long version = self._version
+        for msg in self.msgs:
+            if isinstance(msg, Bundle):
+                version += (<Bundle>msg).total_version()
+        return version
+
+    cdef bytes serialized(Bundle self):
+        cdef:
+            unsigned long version = self.total_version()
+            size_t length
+            bytes raw
+        if self._raw is None or self._raw_version != version:
+            if self._exports:
+                raise BufferError('Cannot serialize a changed Bundle while its buffer is exported')
+            length = lo.lo_bundle_length(self.lo_bundle)
+            raw = PyBytes_FromStringAndSize(NULL, length)
+            lo.lo_bundle_serialise(self.lo_bundle, PyBytes_AS_STRING(raw), &length)
+            self._raw = raw
+            self._raw_version = version
+            self._hash = hash(raw)
+        return self._raw
+
     cpdef object add(Bundle self, msg: types.BundleTypes):
         if isinstance(msg, messages.Message):
             self.add_message(msg)
@@ -204,6 +368,8 @@ cdef class Bundle:
     cpdef object add_message(Bundle self, messages.Message message):
         path = (<paths.Path>message.route.path).as_bytes
         cdef char * p = path
+        if self._exports:
+            raise BufferError('Cannot add to a Bundle while its buffer is exported')
         if lo.lo_bundle_add_message(
             self.lo_bundle,
             p,
@@ -211,12 +377,128 @@ cdef class Bundle:
         ) != 0:
             raise MemoryError
         self.msgs.append(message)
+        self._version += 1
         return None
 
     cpdef object add_bundle(Bundle self, Bundle bundle):
         if self.lo_bundle == bundle.lo_bundle:
             raise ValueError('Cannot add bundle to itself')
+        if self._exports:
+            raise BufferError('Cannot add to a Bundle while its buffer is exported')
         if lo.lo_bundle_add_bundle(self.lo_bundle, bundle.lo_bundle) != 0:
             raise MemoryError
         self.msgs.append(bundle)
+        self._version += 1
         return None
+
+
+cdef int fill_buffer(object obj, bytes raw, Py_buffer *buffer, int flags) except -1:
+    # As PyBuffer_FillInfo(), for a read-only buffer over a cached serialization owned by obj
+    if flags & PyBUF_WRITABLE == PyBUF_WRITABLE:
+        raise BufferError('%s buffers are read-only' % obj.__class__.__name__)
+    buffer.buf = PyBytes_AS_STRING(raw)
+    buffer.obj = obj
+    buffer.len = len(raw)
+    buffer.readonly = 1
+    buffer.itemsize = 1
+    buffer.format = NULL
+    if flags & PyBUF_FORMAT == PyBUF_FORMAT:
+        buffer.format = b'B'
+    buffer.ndim = 1
+    buffer.shape = NULL
+    if flags & PyBUF_ND == PyBUF_ND:
+        buffer.shape = &buffer.len
+    buffer.strides = NULL
+    if flags & PyBUF_STRIDES == PyBUF_STRIDES:
+        buffer.strides = &buffer.itemsize
+    buffer.suboffsets = NULL
+    buffer.internal = NULL
+    return 0
+
+
+cdef int check_fits(Py_ssize_t offset, size_t length, Py_ssize_t size) except -1:
+    if offset < 0 or offset + <Py_ssize_t>length > size:
+        raise ValueError('Buffer of %s bytes is too small to write %s bytes at offset %s' % (size, length, offset))
+    return 0
+
+
+cdef object as_bytes_view(object data):
+    # Any C-contiguous buffer, viewed as unsigned bytes without copying
+    view = memoryview(data)
+    if view.format != 'B' or view.ndim != 1:
+        view = view.cast('B')
+    return view
+
+
+cdef inline uint32_t read_uint32(const unsigned char * p) nogil:
+    return (<uint32_t>p[0] << 24) | (<uint32_t>p[1] << 16) | (<uint32_t>p[2] << 8) | <uint32_t>p[3]
+
+
+cdef bint is_bundle_ptr(const char * data, size_t size) nogil:
+    return size >= BUNDLE_HEADER_SIZE and memcmp(data, BUNDLE_HEADER, BUNDLE_HEADER_SIZE) == 0
+
+
+cdef object route_for(const char * path, const char * types):
+    key = (<bytes>path, <bytes>types)
+    try:
+        return ROUTE_CACHE[key]
+    except KeyError:
+        pass
+    if len(ROUTE_CACHE) >= ROUTE_CACHE_SIZE:
+        ROUTE_CACHE.clear()
+    route = ROUTE_CACHE[key] = routes.Route(key[0].decode('utf8'), typespecs.TypeSpec(key[1].decode('utf8')))
+    return route
+
+
+cdef Message message_from_ptr(char * data, size_t size):
+    cdef:
+        int result = 0
+        char * path = lo.lo_get_path(data, size)
+        lo.lo_message lo_message
+        Message message
+    if path is NULL:
+        raise ValueError('Invalid OSC message: bad path')
+    lo_message = lo.lo_message_deserialise(data, size, &result)
+    if lo_message is NULL:
+        raise ValueError('Invalid OSC message: liblo error %s' % result)
+    message = Message.__new__(Message, FROM_LO_MESSAGE)
+    message.lo_message = lo_message
+    lo.lo_message_incref(lo_message)
+    message._route = route_for(path, lo.lo_message_get_types(lo_message))
+    message.typespec = message._route.typespec
+    return message
+
+
+cdef Bundle bundle_from_ptr(char * data, size_t size, int depth):
+    cdef:
+        const unsigned char * p = <const unsigned char *>data
+        size_t offset = BUNDLE_PREAMBLE_SIZE
+        size_t length
+        lo.lo_timetag lo_timetag
+        Bundle bundle
+    if not is_bundle_ptr(data, size) or size < BUNDLE_PREAMBLE_SIZE:
+        raise ValueError('Invalid OSC bundle: bad header')
+    if depth >= MAX_BUNDLE_DEPTH:
+        raise ValueError('Invalid OSC bundle: nested more than %s deep' % MAX_BUNDLE_DEPTH)
+    lo_timetag.sec = read_uint32(p + BUNDLE_HEADER_SIZE)
+    lo_timetag.frac = read_uint32(p + BUNDLE_HEADER_SIZE + 4)
+    bundle = Bundle(None, timetags.lo_timetag_to_timetag(lo_timetag))
+    while offset < size:
+        if size - offset < 4:
+            raise ValueError('Invalid OSC bundle: truncated element size')
+        length = read_uint32(p + offset)
+        offset += 4
+        if length > size - offset:
+            raise ValueError('Invalid OSC bundle: element of %s bytes overruns bundle' % length)
+        if is_bundle_ptr(data + offset, length):
+            bundle.add_bundle(bundle_from_ptr(data + offset, length, depth + 1))
+        else:
+            bundle.add_message(message_from_ptr(data + offset, length))
+        offset += length
+    return bundle
+
+
+cdef object packet_from_ptr(char * data, size_t size):
+    if is_bundle_ptr(data, size):
+        return bundle_from_ptr(data, size, 0)
+    return message_from_ptr(data, size)
@@ -1,6 +1,14 @@
 # cython: language_level=3
 
-from libc.stdint cimport uint8_t
+from libc.stdint cimport uint8_t, uint32_t
 
 cdef class Midi:
     cdef uint8_t data[4]
+
+
+# Not exported to Python
+cdef uint32_t packed(const uint8_t * data)
+
+cdef void set_packed(uint8_t * data, uint32_t value)
+
+cdef Midi new_midi(const uint8_t * data)
@@ -1,14 +1,16 @@
 # cython: language_level=3
 from typing import Union
 
-from libc.stdint cimport UINT8_MAX
+cimport cython
+from libc.stdint cimport UINT8_MAX, uint8_t, uint32_t
 
 
 __all__ = ['Midi']
 
 
+@cython.freelist(64)
 cdef class Midi:
-    def __cinit__(self, arg1: int, arg2: int, arg3: int, arg4: int):
+    def __cinit__(self, int arg1=0, int arg2=0, int arg3=0, int arg4=0):
         if not (
             0 <= arg1 <= UINT8_MAX
             and 0 <= arg2 <= UINT8_MAX
@@ -17,11 +19,23 @@ cdef class Midi:
         ):
             raise ValueError('Invalid Midi values %r, must be between 0 and %r' % (
                 (arg1, arg2, arg3, arg4), UINT8_MAX))
-        self.data[:] = (arg1, arg2, arg3, arg4)
+        self.data[0] = arg1
+        self.data[1] = arg2
+        self.data[2] = arg3
+        self.data[3] = arg4
 
     def __init__(self, arg1: int, arg2: int, arg3: int, arg4: int):
         pass
 
+    @staticmethod
+    def from_packed(uint32_t packed) -> Midi:
+        """
+        Create a Midi from its packed 32 bit value, as returned by Midi.packed.
+        """
+        cdef Midi midi = Midi.__new__(Midi)
+        set_packed(midi.data, packed)
+        return midi
+
     def __repr__(self):
         return 'Midi(%r, %r, %r, %r)' % (self.data[0], self.data[1], self.data[2], self.data[3])
 
@@ -29,13 +43,26 @@ cdef class Midi:
         return 4
 
     def __iter__(Midi self):
-        return iter(self.data[:])
+        return iter(self.data[:4])
+
+    def __bytes__(Midi self) -> bytes:
+        return (<char*>self.data)[:4]
+
+    def __hash__(Midi self):
+        return hash(packed(self.data))
 
-    def __eq__(Midi self, Midi other: Midi) -> bool:
-        return self.data[:] == other.data[:]
+    def __eq__(Midi self, other) -> bool:
+        if not isinstance(other, Midi):
+            return NotImplemented
+        return packed(self.data) == packed((<Midi>other).data)
+
+    def __ne__(Midi self, other) -> bool:
+        if not isinstance(other, Midi):
+            return NotImplemented
+        return packed(self.data) != packed((<Midi>other).data)
 
     def __lt__(Midi self, Midi other: Midi) -> bool:
-        return self.data[:] < other.data[:]
+        return packed(self.data) < packed(other.data)
 
     def __getitem__(self, item):
         if 0 <= item < 4:
@@ -43,6 +70,35 @@ cdef class Midi:
         raise IndexError
 
     def __setitem__(self, item, value):
-        if 0 <= item < 4:
-            self.data[item] = value
-        raise IndexError
\ No newline at end of file
+        if not 0 <= item < 4:
+            raise IndexError
+        if not 0 <= value <= UINT8_MAX:
+            raise ValueError('Invalid Midi value %r, must be between 0 and %r' % (value, UINT8_MAX))
+        self.data[item] = value
+
+    @property
+    def packed(Midi self) -> int:
+        """
+        The 4 bytes as a 32 bit value, with the port id in the high byte.
+        """
+        return packed(self.data)
+
+
+cdef uint32_t packed(const uint8_t * data):
+    return (<uint32_t>data[0] << 24) | (<uint32_t>data[1] << 16) | (<uint32_t>data[2] << 8) | data[3]
+
+
+cdef void set_packed(uint8_t * data, uint32_t value):
+    data[0] = value >> 24
+    data[1] = value >> 16
+    data[2] = value >> 8
+    data[3] = value
+
+
+cdef Midi new_midi(const uint8_t * data):
+    cdef Midi midi = Midi.__new__(Midi)
+    midi.data[0] = data[0]
+    midi.data[1] = data[1]
+    midi.data[2] = data[2]
+    midi.data[3] = data[3]
+    return midi
@@ -1,6 +1,8 @@
 # cython: language_level=3
 
-from . import exceptions, logs
+from typing import Union
+
+from . import exceptions, logs, pacers
 from . cimport abstractservers, addresses, lo, messages, paths
 
 
@@ -8,7 +10,14 @@ __all__ = ['MultiCastAddress']
 
 
 cdef class MultiCastAddress(addresses.Address):
-    def __init__(self, server: abstractservers.AbstractServer, no_delay: bool = False, stream_slip: bool = False, ttl: int = 1):
+    def __init__(
+        self,
+        server: abstractservers.AbstractServer,
+        no_delay: bool = False,
+        stream_slip: bool = False,
+        ttl: int = 1,
+        pacer: Union[pacers.Pacer, None] = None,
+    ):
         self.server = server
         super(MultiCastAddress, self).__init__(
             proto=self.server.proto,
@@ -16,7 +25,8 @@ cdef class MultiCastAddress(addresses.Address):
             port=self.server.multicast.port,
             no_delay=no_delay,
             stream_slip=stream_slip,
-            ttl=ttl)
+            ttl=ttl,
+            pacer=pacer)
 
     cdef int _message(self, messages.Message message) except -1:
         path = (<paths.Path>message.route.path).as_bytes
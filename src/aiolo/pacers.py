@@ -0,0 +1,178 @@
+import asyncio
+import collections
+from typing import Any, Callable, Tuple, Union
+
+from . import logs
+
+
+__all__ = ['Pacer']
+
+
+_SENT = 0
+_QUEUED = 1
+_DROPPED = 2
+
+
+class Pacer:
+    """
+    Token bucket rate limiting for sends, configured by packets/second and/or bytes/second.
+
+    Sends which would exceed the rate are queued and released by a single timer on the event loop, in order,
+    once enough tokens have accumulated. burst_packets and burst_bytes set the bucket capacity, defaulting to
+    1/10th of a second's worth of each rate. When max_queue is set, sends arriving at a full queue are dropped.
+    """
+    __slots__ = (
+        'packets_per_second', 'bytes_per_second', 'burst_packets', 'burst_bytes', 'max_queue', 'loop',
+        'sent', 'delayed', 'dropped',
+        '_packet_tokens', '_byte_tokens', '_updated', '_queue', '_handle', '_drained')
+
+    def __init__(
+        self,
+        packets_per_second: Union[float, None] = None,
+        bytes_per_second: Union[float, None] = None,
+        *,
+        burst_packets: Union[float, None] = None,
+        burst_bytes: Union[float, None] = None,
+        max_queue: Union[int, None] = None,
+        loop: Union[asyncio.AbstractEventLoop, None] = None,
+    ):
+        if packets_per_second is None and bytes_per_second is None:
+            raise ValueError('Must provide packets_per_second and/or bytes_per_second')
+        if packets_per_second is not None and packets_per_second <= 0:
+            raise ValueError('packets_per_second must be > 0, got %r' % packets_per_second)
+        if bytes_per_second is not None and bytes_per_second <= 0:
+            raise ValueError('bytes_per_second must be > 0, got %r' % bytes_per_second)
+        self.packets_per_second = packets_per_second
+        self.bytes_per_second = bytes_per_second
+        if burst_packets is None and packets_per_second is not None:
+            burst_packets = max(1.0, packets_per_second / 10)
+        if burst_bytes is None and bytes_per_second is not None:
+            burst_bytes = bytes_per_second / 10
+        self.burst_packets = burst_packets
+        self.burst_bytes = burst_bytes
+        self.max_queue = max_queue
+        self.loop = loop or asyncio.get_event_loop()
+        self.sent = 0
+        self.delayed = 0
+        self.dropped = 0
+        self._packet_tokens = burst_packets
+        self._byte_tokens = burst_bytes
+        self._updated = self.loop.time()
+        self._queue = collections.deque()
+        self._handle = None
+        self._drained = None
+
+    def __repr__(self):
+        return 'Pacer(packets_per_second=%r, bytes_per_second=%r)' % (self.packets_per_second, self.bytes_per_second)
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    @property
+    def stats(self) -> dict:
+        return {'sent': self.sent, 'queued': self.queued, 'delayed': self.delayed, 'dropped': self.dropped}
+
+    def _refill(self):
+        now = self.loop.time()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.packets_per_second is not None:
+            self._packet_tokens = min(self.burst_packets, self._packet_tokens + elapsed * self.packets_per_second)
+        if self.bytes_per_second is not None:
+            self._byte_tokens = min(self.burst_bytes, self._byte_tokens + elapsed * self.bytes_per_second)
+
+    def _cost(self, size: int) -> float:
+        # A packet larger than the bucket can hold is allowed through once the bucket is full
+        return min(size, self.burst_bytes)
+
+    def _wait_time(self, size: int) -> float:
+        wait = 0.
+        if self.packets_per_second is not None and self._packet_tokens < 1:
+            wait = (1 - self._packet_tokens) / self.packets_per_second
+        if self.bytes_per_second is not None:
+            cost = self._cost(size)
+            if self._byte_tokens < cost:
+                wait = max(wait, (cost - self._byte_tokens) / self.bytes_per_second)
+        return wait
+
+    def _consume(self, size: int):
+        if self.packets_per_second is not None:
+            self._packet_tokens -= 1
+        if self.bytes_per_second is not None:
+            self._byte_tokens -= self._cost(size)
+        self.sent += 1
+
+    def _submit(self, send: Callable[[], Any], size: int) -> Tuple[int, Any]:
+        self._refill()
+        if not self._queue and not self._wait_time(size):
+            self._consume(size)
+            return _SENT, send()
+        if self.max_queue is not None and len(self._queue) >= self.max_queue:
+            self.dropped += 1
+            logs.logger.debug('%r: queue full, dropped send of %s bytes', self, size)
+            return _DROPPED, None
+        self._queue.append((send, size))
+        self._schedule()
+        return _QUEUED, None
+
+    def submit(self, send: Callable[[], Any], size: int) -> Any:
+        """
+        Call send() now if the rate allows and return its result, otherwise queue it and return None.
+
+        Raises asyncio.QueueFull if the queue is full, in which case send() is never called.
+        """
+        status, result = self._submit(send, size)
+        if status == _DROPPED:
+            raise asyncio.QueueFull
+        return result
+
+    async def wait(self, size: int):
+        """
+        Wait until a send of size bytes is allowed by the rate, queueing behind any sends already waiting.
+
+        Raises asyncio.QueueFull if the queue is full.
+        """
+        future = self.loop.create_future()
+
+        def release():
+            if not future.done():
+                future.set_result(None)
+
+        status, _ = self._submit(release, size)
+        if status == _DROPPED:
+            raise asyncio.QueueFull
+        await future
+
+    def _schedule(self):
+        if self._handle is None and self._queue:
+            self._handle = self.loop.call_later(self._wait_time(self._queue[0][1]), self._release)
+
+    def _release(self):
+        self._handle = None
+        self._refill()
+        while self._queue and not self._wait_time(self._queue[0][1]):
+            send, size = self._queue.popleft()
+            self._consume(size)
+            self.delayed += 1
+            try:
+                send()
+            except Exception as exc:
+                self.dropped += 1
+                logs.logger.exception(exc)
+        if self._queue:
+            self._schedule()
+        elif self._drained is not None:
+            drained, self._drained = self._drained, None
+            if not drained.done():
+                drained.set_result(None)
+
+    async def drain(self):
+        """
+        Wait until every queued send has been released.
+        """
+        if not self._queue:
+            return
+        if self._drained is None:
+            self._drained = self.loop.create_future()
+        await asyncio.shield(self._drained)
@@ -5,5 +5,29 @@ from typing import Iterable
 from . import types
 from . cimport lo, typespecs
 
+
+ctypedef int (*pack_fn)(lo.lo_message lo_message, object arg) except -1
+ctypedef object (*unpack_fn)(lo.lo_arg * arg)
+
+
+cdef class Plan:
+    cdef readonly bytes argtypes
+    cdef readonly Py_ssize_t length
+    cdef readonly char array_type
+    cdef pack_fn * packers
+    cdef unpack_fn * unpackers
+
+cdef Plan get_plan(typespecs.TypeSpec typespec)
+cdef pack_fn packer_for(char argtype)
+cdef unpack_fn unpacker_for(char argtype)
+
 cdef list unpack_args(typespecs.TypeSpec typespec, lo.lo_arg ** argv, int argc)
-cdef lo.lo_message pack_lo_message(typespecs.TypeSpec typespec, object args: Iterable[types.MessageTypes]) except NULL
\ No newline at end of file
+cdef object unpack_record(typespecs.TypeSpec typespec, object record_type, lo.lo_arg ** argv, int argc)
+cdef lo.lo_message pack_lo_message(typespecs.TypeSpec typespec, object args: Iterable[types.MessageTypes]) except NULL
+
+cpdef char numeric_array_type(typespecs.TypeSpec typespec)
+cdef list new_columns(typespecs.TypeSpec typespec, Py_ssize_t rows)
+cdef int unpack_message_into(list columns, typespecs.TypeSpec typespec, lo.lo_message lo_message, Py_ssize_t row) except -1
+cdef int unpack_values_into(list columns, typespecs.TypeSpec typespec, object values, Py_ssize_t row) except -1
+cdef object unpack_array(char argtype, lo.lo_arg ** argv, int argc)
+cdef lo.lo_message pack_lo_message_array(typespecs.TypeSpec typespec, char argtype, object arg) except NULL
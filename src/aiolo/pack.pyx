@@ -9,18 +9,37 @@ IF not PYPY:
 
 import array
 
+from libc.math cimport isinf, isnan
 from libc.stdint cimport \
-    uint8_t, int32_t, uint32_t, \
+    uint8_t, int32_t, uint32_t, int64_t, \
     UINT8_MAX as _UINT8_MAX, \
     INT32_MIN as _INT32_MIN, \
     INT32_MAX as _INT32_MAX, \
     INT64_MAX as _INT64_MIN, \
     INT64_MAX as _INT64_MAX
 
+from cpython.buffer cimport PyObject_CheckBuffer
+from cpython.float cimport PyFloat_CheckExact
+from cpython.long cimport PyLong_CheckExact
+from cpython.mem cimport PyMem_Malloc, PyMem_Free
+from cpython.ref cimport Py_INCREF
+from cpython.tuple cimport PyTuple_SET_ITEM
+from cpython.unicode cimport PyUnicode_CheckExact
 from libc.stdlib cimport malloc, free
 from libc.string cimport memcpy
 
+IF not PYPY:
+    cdef extern from *:
+        """
+        static inline PyObject *aiolo_alloc_record(PyObject *type, Py_ssize_t size) {
+            return ((PyTypeObject *)type)->tp_alloc((PyTypeObject *)type, size);
+        }
+        """
+        # An instance of a tuple subclass with size slots, all NULL until set
+        object alloc_record "aiolo_alloc_record"(object record_type, Py_ssize_t size)
+
 from . import types
+from .typespecs import BASIC_TYPES
 from . cimport lo, midis, timetags, typespecs
 
 
@@ -77,237 +96,661 @@ _ARGTYPES = [
     typespecs.LO_INFINITUM,
 ]
 
-IF PYPY:
-    cdef object ARGTYPES = array.array('b', _ARGTYPES)
-    cdef object ARGTYPES_INTS = array.array('b', [typespecs.LO_INT64, typespecs.LO_INT32])
-    cdef object ARGTYPES_FLOATS = array.array('b', [typespecs.LO_FLOAT, typespecs.LO_DOUBLE])
-    cdef object ARGTYPES_STRINGS = array.array('b', [typespecs.LO_STRING, typespecs.LO_SYMBOL, typespecs.LO_CHAR])
-ELSE:
+IF not PYPY:
     cdef array.array BLOB_ARRAY_TEMPLATE = array.array('b')
-    cdef array.array ARGTYPES = array.array('b', _ARGTYPES)
-    cdef array.array ARGTYPES_INTS = array.array('b', [typespecs.LO_INT64, typespecs.LO_INT32])
-    cdef array.array ARGTYPES_FLOATS = array.array('b', [typespecs.LO_FLOAT, typespecs.LO_DOUBLE])
-    cdef array.array ARGTYPES_STRINGS = array.array('b', [typespecs.LO_STRING, typespecs.LO_SYMBOL, typespecs.LO_CHAR])
+    cdef array.array FLOAT_ARRAY_TEMPLATE = array.array('f')
+    cdef array.array DOUBLE_ARRAY_TEMPLATE = array.array('d')
+    cdef array.array INT32_ARRAY_TEMPLATE = array.array('i')
+    cdef array.array INT64_ARRAY_TEMPLATE = array.array('q')
+    cdef array.array UINT32_ARRAY_TEMPLATE = array.array('I')
 
 
-cdef list unpack_args(typespecs.TypeSpec typespec, lo.lo_arg ** argv, int argc):
-    cdef:
+# array.array typecodes for the types which may be packed from or unpacked to an array
+ARRAY_TYPECODES = {
+    typespecs.LO_FLOAT: 'f',
+    typespecs.LO_DOUBLE: 'd',
+    typespecs.LO_INT32: 'i',
+    typespecs.LO_INT64: 'q',
+}
+
+# Plans for typespecs which are not kept, such as those of messages received by ANY_ARGS routes
+PLAN_CACHE = {}
+PLAN_CACHE_SIZE = 1024
+
+
+cdef class Plan:
+    """
+    The packer and unpacker for each argument of a TypeSpec, so that packing and unpacking a message is a single
+    pass without dispatching on type.
+    """
+    def __cinit__(Plan self, typespecs.TypeSpec typespec):
+        cdef:
+            Py_ssize_t i
+            char argtype
+        self.argtypes = b'' if typespec.none else typespec.as_bytes
+        self.length = len(self.argtypes)
+        self.packers = <pack_fn*>PyMem_Malloc(max(self.length, 1) * sizeof(pack_fn))
+        self.unpackers = <unpack_fn*>PyMem_Malloc(max(self.length, 1) * sizeof(unpack_fn))
+        if self.packers is NULL or self.unpackers is NULL:
+            raise MemoryError
+        self.array_type = 0
+        for i in range(self.length):
+            argtype = self.argtypes[i]
+            self.packers[i] = packer_for(argtype)
+            self.unpackers[i] = unpacker_for(argtype)
+            if i == 0:
+                if argtype == typespecs.LO_FLOAT or argtype == typespecs.LO_DOUBLE \
+                        or argtype == typespecs.LO_INT32 or argtype == typespecs.LO_INT64 \
+                        or argtype == typespecs.LO_MIDI:
+                    self.array_type = argtype
+            elif argtype != self.array_type:
+                self.array_type = 0
+
+    def __dealloc__(Plan self):
+        PyMem_Free(self.packers)
+        PyMem_Free(self.unpackers)
+
+    def __repr__(Plan self):
+        return 'Plan(%r)' % self.argtypes.decode('utf8')
+
+
+cdef Plan get_plan(typespecs.TypeSpec typespec):
+    cdef Plan plan
+    if typespec.plan is not None:
+        return <Plan>typespec.plan
+    key = typespec.as_bytes
+    try:
+        plan = PLAN_CACHE[key]
+    except KeyError:
+        if len(PLAN_CACHE) >= PLAN_CACHE_SIZE:
+            PLAN_CACHE.clear()
+        plan = PLAN_CACHE[key] = Plan(typespec)
+    typespec.plan = plan
+    return plan
+
+
+cpdef char numeric_array_type(typespecs.TypeSpec typespec):
+    """
+    If typespec is one or more of a single numeric or MIDI type (f, d, i, h or m), return that type, otherwise 0.
+    """
+    if typespec.none:
+        return 0
+    return get_plan(typespec).array_type
+
+
+cdef inline int check_added(int result) except -1:
+    if result != 0:
+        raise MemoryError
+    return 0
+
+
+cdef object as_chars(object arg):
+    # A str or array.array as an object whose data may be used as a char *, or None
+    if isinstance(arg, str):
+        return arg.encode('utf8')
+    elif isinstance(arg, array.array):
         IF PYPY:
-            object typespec_array = typespec.array
+            return arg.tobytes()
         ELSE:
-            array.array typespec_array = typespec.array
-        int i = 0
-        int j
-        uint32_t blobsize
-        lo.lo_arg * arg
-        void * raw_blob
+            return arg
+    return None
+
+
+cdef inline char * chars_ptr(object chars):
+    IF PYPY:
+        return <char*><bytes>chars
+    ELSE:
+        if isinstance(chars, bytes):
+            return <char*><bytes>chars
+        return (<array.array>chars).data.as_chars
+
+
+cdef int pack_int32(lo.lo_message lo_message, object arg) except -1:
+    if not isinstance(arg, int):
+        raise TypeError('Invalid type for INT32: %s' % repr(arg))
+    if not (INT32_MIN <= arg <= INT32_MAX):
+        raise OverflowError('Invalid value for INT32: %s (overflow)' % repr(arg))
+    return check_added(lo.lo_message_add_int32(lo_message, int(arg)))
+
+
+cdef int pack_int64(lo.lo_message lo_message, object arg) except -1:
+    if not isinstance(arg, int):
+        raise TypeError('Invalid type for INT64: %s' % repr(arg))
+    if not (INT64_MIN <= arg <= INT64_MAX):
+        raise OverflowError('Invalid value for INT64: %s (overflow)' % repr(arg))
+    return check_added(lo.lo_message_add_int64(lo_message, arg))
+
+
+cdef int pack_float(lo.lo_message lo_message, object arg) except -1:
+    cdef double value
+    if not isinstance(arg, float):
+        raise TypeError('Invalid type for FLOAT: %s' % repr(arg))
+    value = arg
+    if isinf(value):
+        raise ValueError('Invalid value for FLOAT: %s' % repr(arg))
+    if <double><float>value != value:
+        raise OverflowError('Invalid value for FLOAT: %s (overflow)' % repr(arg))
+    return check_added(lo.lo_message_add_float(lo_message, <float>value))
+
+
+cdef int pack_double(lo.lo_message lo_message, object arg) except -1:
+    cdef double value
+    if not isinstance(arg, float):
+        raise TypeError('Invalid type for DOUBLE: %s' % repr(arg))
+    value = arg
+    if isinf(value):
+        raise ValueError('Invalid value for DOUBLE: %s' % repr(arg))
+    if value != value:
+        raise OverflowError('Invalid value for DOUBLE: %s (overflow)' % repr(arg))
+    return check_added(lo.lo_message_add_double(lo_message, value))
+
+
+cdef int pack_string(lo.lo_message lo_message, object arg) except -1:
+    chars = as_chars(arg)
+    if chars is None:
+        raise TypeError('Invalid type for STRING: %s' % repr(arg))
+    return check_added(lo.lo_message_add_string(lo_message, chars_ptr(chars)))
+
+
+cdef int pack_symbol(lo.lo_message lo_message, object arg) except -1:
+    chars = as_chars(arg)
+    if chars is None:
+        raise TypeError('Invalid type for SYMBOL: %s' % repr(arg))
+    return check_added(lo.lo_message_add_symbol(lo_message, chars_ptr(chars)))
+
+
+cdef int pack_char(lo.lo_message lo_message, object arg) except -1:
+    if isinstance(arg, int):
+        return check_added(lo.lo_message_add_char(lo_message, arg))
+    chars = as_chars(arg)
+    if chars is None:
+        raise TypeError('Invalid type for CHAR: %s' % repr(arg))
+    if len(arg) != 1:
+        raise OverflowError('Invalid value for CHAR: %s (must be a single char)' % repr(arg))
+    return check_added(lo.lo_message_add_char(lo_message, chars_ptr(chars)[0]))
+
+
+cdef int pack_blob(lo.lo_message lo_message, object arg) except -1:
+    cdef:
+        const unsigned char[::1] view
+        const char * data
+        lo.lo_blob lo_blob
+        int32_t size
+        int result
+    if isinstance(arg, bytes):
+        data = <bytes>arg
+        size = <int32_t>len(<bytes>arg)
+    elif isinstance(arg, array.array):
+        # Viewed in place, on PyPy as well as CPython, rather than copied out with tobytes()
+        view = memoryview(arg).cast('B')
+        size = <int32_t>view.shape[0]
+        data = <const char *>&view[0] if size else NULL
+    else:
+        raise TypeError('Invalid type for BLOB: %s' % (repr(arg)))
+    if not size:
+        raise ValueError('Invalid value for BLOB: %s (must have length >= 1)' % repr(arg))
+    lo_blob = lo.lo_blob_new(size, <void*>data)
+    if lo_blob is NULL:
+        raise MemoryError
+    result = lo.lo_message_add_blob(lo_message, lo_blob)
+    lo.lo_blob_free(lo_blob)
+    return check_added(result)
+
+
+cdef int pack_timetag(lo.lo_message lo_message, object arg) except -1:
+    if isinstance(arg, timetags.TimeTag):
+        timetag = arg
+    elif isinstance(arg, (float, int, datetime.datetime)):
+        timetag = timetags.TimeTag(arg)
+    else:
+        raise TypeError('Invalid type for TIMETAG: %s' % (repr(arg)))
+    return check_added(lo.lo_message_add_timetag(lo_message, (<timetags.TimeTag>timetag).lo_timetag))
+
+
+cdef int pack_midi(lo.lo_message lo_message, object arg) except -1:
+    if isinstance(arg, array.array):
+        arg = midis.Midi(*arg)
+    elif not isinstance(arg, midis.Midi):
+        raise TypeError('Invalid type for MIDI: %s' % (repr(arg)))
+    return check_added(lo.lo_message_add_midi(lo_message, (<midis.Midi>arg).data))
+
+
+cdef int pack_true(lo.lo_message lo_message, object arg) except -1:
+    if not isinstance(arg, (int, bool)):
+        raise TypeError('Invalid type for TRUE: %s' % repr(arg))
+    if arg not in ARGVALS_TRUE:
+        raise ValueError('Invalid value for TRUE: %s' % repr(arg))
+    return check_added(lo.lo_message_add_true(lo_message))
+
+
+cdef int pack_false(lo.lo_message lo_message, object arg) except -1:
+    if not isinstance(arg, (int, bool)):
+        raise TypeError('Invalid type for FALSE: %s' % repr(arg))
+    if arg not in ARGVALS_FALSE:
+        raise ValueError('Invalid value for FALSE: %s' % repr(arg))
+    return check_added(lo.lo_message_add_false(lo_message))
+
+
+cdef int pack_nil(lo.lo_message lo_message, object arg) except -1:
+    if arg is not None:
+        raise TypeError('Invalid type for NIL: %s' % repr(arg))
+    return check_added(lo.lo_message_add_nil(lo_message))
+
+
+cdef int pack_infinitum(lo.lo_message lo_message, object arg) except -1:
+    if not isinstance(arg, float):
+        raise TypeError('Invalid type for INFINITUM: %s' % repr(arg))
+    if arg != INFINITY:
+        raise ValueError('Invalid value for INFINITUM: %s' % repr(arg))
+    return check_added(lo.lo_message_add_infinitum(lo_message))
+
+
+cdef int pack_invalid(lo.lo_message lo_message, object arg) except -1:
+    raise ValueError('Invalid argtype for %s' % repr(arg))
+
+
+cdef pack_fn packer_for(char argtype):
+    if argtype == typespecs.LO_INT32:
+        return pack_int32
+    elif argtype == typespecs.LO_FLOAT:
+        return pack_float
+    elif argtype == typespecs.LO_STRING:
+        return pack_string
+    elif argtype == typespecs.LO_BLOB:
+        return pack_blob
+    elif argtype == typespecs.LO_INT64:
+        return pack_int64
+    elif argtype == typespecs.LO_TIMETAG:
+        return pack_timetag
+    elif argtype == typespecs.LO_DOUBLE:
+        return pack_double
+    elif argtype == typespecs.LO_SYMBOL:
+        return pack_symbol
+    elif argtype == typespecs.LO_CHAR:
+        return pack_char
+    elif argtype == typespecs.LO_MIDI:
+        return pack_midi
+    elif argtype == typespecs.LO_TRUE:
+        return pack_true
+    elif argtype == typespecs.LO_FALSE:
+        return pack_false
+    elif argtype == typespecs.LO_NIL:
+        return pack_nil
+    elif argtype == typespecs.LO_INFINITUM:
+        return pack_infinitum
+    return pack_invalid
+
+
+cdef object unpack_int32(lo.lo_arg * arg):
+    return arg.i32
+
+
+cdef object unpack_int64(lo.lo_arg * arg):
+    return arg.i64
+
+
+cdef object unpack_float(lo.lo_arg * arg):
+    return <float>arg.f
+
+
+cdef object unpack_double(lo.lo_arg * arg):
+    return arg.d
+
+
+cdef object unpack_string(lo.lo_arg * arg):
+    return (<bytes>&arg.s).decode('utf8')
+
+
+cdef object unpack_symbol(lo.lo_arg * arg):
+    return (<bytes>&arg.S).decode('utf8')
+
+
+cdef object unpack_char(lo.lo_arg * arg):
+    return (<bytes>arg.c).decode('utf8')
+
+
+cdef object unpack_blob(lo.lo_arg * arg):
+    cdef:
+        uint32_t blobsize = lo.lo_blob_datasize(<lo.lo_blob>&(arg.blob))
         IF PYPY:
             object blob
         ELSE:
             array.array blob
+    IF PYPY:
+        blob = array.array('b', (<char*>lo.lo_blob_dataptr(<lo.lo_blob>&(arg.blob)))[:blobsize])
+    ELSE:
+        blob = array.clone(BLOB_ARRAY_TEMPLATE, blobsize, zero=True)
+        memcpy(<void*>blob.data.as_voidptr, lo.lo_blob_dataptr(<lo.lo_blob>&(arg.blob)), blobsize)
+    return blob
+
+
+cdef object unpack_timetag(lo.lo_arg * arg):
+    return timetags.lo_timetag_to_timetag(<lo.lo_timetag>arg.t)
+
+
+cdef object unpack_midi(lo.lo_arg * arg):
+    return midis.new_midi(arg.m)
+
+
+cdef object unpack_true(lo.lo_arg * arg):
+    return True
+
+
+cdef object unpack_false(lo.lo_arg * arg):
+    return False
+
+
+cdef object unpack_nil(lo.lo_arg * arg):
+    return None
+
+
+cdef object unpack_infinitum(lo.lo_arg * arg):
+    return INFINITY
+
+
+cdef object unpack_invalid(lo.lo_arg * arg):
+    raise ValueError('Unknown type')
+
+
+cdef unpack_fn unpacker_for(char argtype):
+    if argtype == typespecs.LO_INT32:
+        return unpack_int32
+    elif argtype == typespecs.LO_FLOAT:
+        return unpack_float
+    elif argtype == typespecs.LO_STRING:
+        return unpack_string
+    elif argtype == typespecs.LO_BLOB:
+        return unpack_blob
+    elif argtype == typespecs.LO_INT64:
+        return unpack_int64
+    elif argtype == typespecs.LO_TIMETAG:
+        return unpack_timetag
+    elif argtype == typespecs.LO_DOUBLE:
+        return unpack_double
+    elif argtype == typespecs.LO_SYMBOL:
+        return unpack_symbol
+    elif argtype == typespecs.LO_CHAR:
+        return unpack_char
+    elif argtype == typespecs.LO_MIDI:
+        return unpack_midi
+    elif argtype == typespecs.LO_TRUE:
+        return unpack_true
+    elif argtype == typespecs.LO_FALSE:
+        return unpack_false
+    elif argtype == typespecs.LO_NIL:
+        return unpack_nil
+    elif argtype == typespecs.LO_INFINITUM:
+        return unpack_infinitum
+    return unpack_invalid
+
+
+cdef object unpack_midi_array(lo.lo_arg ** argv, int argc):
+    # The packed 32 bit value of each MIDI event
+    cdef:
+        int i
+        IF not PYPY:
+            array.array arr
+    IF PYPY:
+        return array.array('I', [midis.packed(argv[i].m) for i in range(argc)])
+    ELSE:
+        arr = array.clone(UINT32_ARRAY_TEMPLATE, argc, zero=False)
+        for i in range(argc):
+            arr.data.as_uints[i] = midis.packed(argv[i].m)
+        return arr
+
+
+cdef object unpack_array(char argtype, lo.lo_arg ** argv, int argc):
+    cdef:
+        int i
+        size_t itemsize = 8 if argtype == typespecs.LO_DOUBLE or argtype == typespecs.LO_INT64 else 4
+        bint contiguous = argc == 0 or <char*>argv[argc - 1] == <char*>argv[0] + (argc - 1) * itemsize
+        IF not PYPY:
+            array.array arr
+    if argtype == typespecs.LO_MIDI:
+        return unpack_midi_array(argv, argc)
+    typecode = ARRAY_TYPECODES[argtype]
+    IF PYPY:
+        arr = array.array(typecode)
+        if contiguous:
+            if argc:
+                arr.frombytes((<char*>argv[0])[:argc * itemsize])
+        else:
+            for i in range(argc):
+                arr.frombytes((<char*>argv[i])[:itemsize])
+    ELSE:
+        if argtype == typespecs.LO_FLOAT:
+            arr = array.clone(FLOAT_ARRAY_TEMPLATE, argc, zero=False)
+        elif argtype == typespecs.LO_DOUBLE:
+            arr = array.clone(DOUBLE_ARRAY_TEMPLATE, argc, zero=False)
+        elif argtype == typespecs.LO_INT32:
+            arr = array.clone(INT32_ARRAY_TEMPLATE, argc, zero=False)
+        else:
+            arr = array.clone(INT64_ARRAY_TEMPLATE, argc, zero=False)
+        if contiguous:
+            if argc:
+                memcpy(arr.data.as_voidptr, argv[0], argc * itemsize)
+        else:
+            for i in range(argc):
+                memcpy(arr.data.as_chars + i * itemsize, argv[i], itemsize)
+    return arr
+
+
+cdef lo.lo_message pack_lo_message_array(typespecs.TypeSpec typespec, char argtype, object arg) except NULL:
+    cdef:
+        Py_ssize_t i
+        Py_ssize_t length = len(typespec.array)
+        const float[:] floats
+        const double[:] doubles
+        const int32_t[:] int32s
+        const int64_t[:] int64s
+        const uint32_t[:] uint32s
+        uint8_t midi[4]
+        lo.lo_message lo_message
+        int result = 0
+
+    try:
+        if argtype == typespecs.LO_FLOAT:
+            floats = arg
+            size = floats.shape[0]
+        elif argtype == typespecs.LO_DOUBLE:
+            doubles = arg
+            size = doubles.shape[0]
+        elif argtype == typespecs.LO_INT32:
+            int32s = arg
+            size = int32s.shape[0]
+        elif argtype == typespecs.LO_INT64:
+            int64s = arg
+            size = int64s.shape[0]
+        else:
+            # MIDI events, as packed 32 bit values
+            uint32s = arg
+            size = uint32s.shape[0]
+    except ValueError as exc:
+        raise TypeError('Invalid array for typespec %r: %s' % (typespec.as_str, exc)) from exc
+    if size != length:
+        raise ValueError(
+            'Argument length does not match typespec %r (length %s), got array of length %s' % (
+                typespec.as_str, length, size))
+
+    lo_message = lo.lo_message_new()
+    if lo_message is NULL:
+        raise MemoryError
+    if argtype == typespecs.LO_FLOAT:
+        for i in range(length):
+            if isinf(floats[i]):
+                lo.lo_message_free(lo_message)
+                raise ValueError('Invalid value for FLOAT: %r' % floats[i])
+            if isnan(floats[i]):
+                # As pack_float() rejects it
+                lo.lo_message_free(lo_message)
+                raise OverflowError('Invalid value for FLOAT: %r (overflow)' % floats[i])
+            result |= lo.lo_message_add_float(lo_message, floats[i])
+    elif argtype == typespecs.LO_DOUBLE:
+        for i in range(length):
+            if isinf(doubles[i]):
+                lo.lo_message_free(lo_message)
+                raise ValueError('Invalid value for DOUBLE: %r' % doubles[i])
+            if isnan(doubles[i]):
+                lo.lo_message_free(lo_message)
+                raise OverflowError('Invalid value for DOUBLE: %r (overflow)' % doubles[i])
+            result |= lo.lo_message_add_double(lo_message, doubles[i])
+    elif argtype == typespecs.LO_INT32:
+        for i in range(length):
+            result |= lo.lo_message_add_int32(lo_message, int32s[i])
+    elif argtype == typespecs.LO_INT64:
+        for i in range(length):
+            result |= lo.lo_message_add_int64(lo_message, int64s[i])
+    else:
+        for i in range(length):
+            midis.set_packed(midi, uint32s[i])
+            result |= lo.lo_message_add_midi(lo_message, midi)
+    if result != 0:
+        lo.lo_message_free(lo_message)
+        raise MemoryError
+    return lo_message
+
+
+cdef list unpack_args(typespecs.TypeSpec typespec, lo.lo_arg ** argv, int argc):
+    cdef:
+        Plan plan = get_plan(typespec)
+        int i
         list data = []
 
-    if len(typespec_array) != argc:
+    if plan.length != argc:
         raise ValueError(
             '%r: argument length does not match typespec length %s, got length %s' % (
-                typespec, len(typespec_array), argc))
-
-    while i < argc:
-        arg = argv[i]
-        if typespec_array[i] == typespecs.LO_INT32:
-            data.append(arg.i32)
-        elif typespec_array[i] == typespecs.LO_FLOAT:
-            data.append(<float>arg.f)
-        elif typespec_array[i] == typespecs.LO_STRING:
-            s = <bytes>&arg.s
-            data.append(s.decode('utf8'))
-        elif typespec_array[i] == typespecs.LO_BLOB:
-            blobsize = lo.lo_blob_datasize(<lo.lo_blob>&(arg.blob))
-            IF PYPY:
-                blob = array.array('b')
-                raw_blob = malloc(blobsize)
-                memcpy(raw_blob, lo.lo_blob_dataptr(<lo.lo_blob>&(arg.blob)), blobsize)
-                for j in range(blobsize):
-                    blob.append((<char*>raw_blob)[j])
-                free(raw_blob)
-            ELSE:
-                blob = array.clone(BLOB_ARRAY_TEMPLATE, blobsize, zero=True)
-                memcpy(<void*>blob.data.as_voidptr, lo.lo_blob_dataptr(<lo.lo_blob>&(arg.blob)), blobsize)
-            data.append(blob)
-        elif typespec_array[i] == typespecs.LO_INT64:
-            data.append(arg.i64)
-        elif typespec_array[i] == typespecs.LO_TIMETAG:
-            timestamp = timetags.lo_timetag_to_unix_timestamp(<lo.lo_timetag>arg.t)
-            data.append(timetags.TimeTag(timestamp))
-        elif typespec_array[i] == typespecs.LO_DOUBLE:
-            data.append(arg.d)
-        elif typespec_array[i] == typespecs.LO_SYMBOL:
-            s = <bytes>&arg.S
-            data.append(s.decode('utf8'))
-        elif typespec_array[i] == typespecs.LO_CHAR:
-            data.append((<bytes>arg.c).decode('utf8'))
-        elif typespec_array[i] == typespecs.LO_MIDI:
-            data.append(midis.Midi(arg.m[0], arg.m[1], arg.m[2], arg.m[3]))
-        elif typespec_array[i] == typespecs.LO_TRUE:
-            data.append(True)
-        elif typespec_array[i] == typespecs.LO_FALSE:
-            data.append(False)
-        elif typespec_array[i] == typespecs.LO_NIL:
-            data.append(None)
-        elif typespec_array[i] == typespecs.LO_INFINITUM:
-            data.append(float('inf'))
-        else:
-            raise ValueError('Unknown type %r' % typespec.as_str[i])
-        i += 1
+                typespec, plan.length, argc))
+
+    for i in range(argc):
+        data.append(plan.unpackers[i](argv[i]))
     return data
 
-cdef lo.lo_message pack_lo_message(typespecs.TypeSpec typespec, object args: Iterable[types.MessageTypes]) except NULL:
+
+cdef object unpack_record(typespecs.TypeSpec typespec, object record_type, lo.lo_arg ** argv, int argc):
     cdef:
+        Plan plan = get_plan(typespec)
+        int i
+
+    IF PYPY:
+        return record_type._make(unpack_args(typespec, argv, argc))
+    ELSE:
+        if plan.length != argc:
+            raise ValueError(
+                '%r: argument length does not match typespec length %s, got length %s' % (
+                    typespec, plan.length, argc))
+        # Allocate the record at its final size through its type and fill its slots, rather than building a tuple
+        # for _make() to copy
+        record = alloc_record(record_type, argc)
+        for i in range(argc):
+            value = plan.unpackers[i](argv[i])
+            Py_INCREF(value)
+            PyTuple_SET_ITEM(record, i, value)
+        return record
+
+
+cdef list new_columns(typespecs.TypeSpec typespec, Py_ssize_t rows):
+    cdef list columns = []
+    for argtype in typespec.array:
+        typecode = ARRAY_TYPECODES.get(argtype)
+        if typecode is None:
+            columns.append([None] * rows)
+            continue
         IF PYPY:
-            object typespec_array = typespec.array
+            columns.append(array.array(typecode, bytes(rows * array.array(typecode).itemsize)))
         ELSE:
-            array.array typespec_array = typespec.array
+            if argtype == typespecs.LO_FLOAT:
+                columns.append(array.clone(FLOAT_ARRAY_TEMPLATE, rows, zero=False))
+            elif argtype == typespecs.LO_DOUBLE:
+                columns.append(array.clone(DOUBLE_ARRAY_TEMPLATE, rows, zero=False))
+            elif argtype == typespecs.LO_INT32:
+                columns.append(array.clone(INT32_ARRAY_TEMPLATE, rows, zero=False))
+            else:
+                columns.append(array.clone(INT64_ARRAY_TEMPLATE, rows, zero=False))
+    return columns
+
+
+cdef int unpack_message_into(list columns, typespecs.TypeSpec typespec, lo.lo_message lo_message, Py_ssize_t row) except -1:
+    cdef:
+        Plan plan = get_plan(typespec)
+        bytes types = <bytes>lo.lo_message_get_types(lo_message)
+        lo.lo_arg ** argv = lo.lo_message_get_argv(lo_message)
+        Py_ssize_t i
+        char argtype
+
+    if types != plan.argtypes:
+        raise ValueError('Message at row %s has typespec %r, expected %r' % (row, types.decode('utf8'), typespec.as_str))
+    for i in range(plan.length):
+        IF PYPY:
+            columns[i][row] = plan.unpackers[i](argv[i])
+        ELSE:
+            argtype = plan.argtypes[i]
+            if argtype == typespecs.LO_FLOAT:
+                (<float*>(<array.array>columns[i]).data.as_voidptr)[row] = argv[i].f
+            elif argtype == typespecs.LO_DOUBLE:
+                (<double*>(<array.array>columns[i]).data.as_voidptr)[row] = argv[i].d
+            elif argtype == typespecs.LO_INT32:
+                (<int32_t*>(<array.array>columns[i]).data.as_voidptr)[row] = argv[i].i32
+            elif argtype == typespecs.LO_INT64:
+                (<int64_t*>(<array.array>columns[i]).data.as_voidptr)[row] = argv[i].i64
+            else:
+                (<list>columns[i])[row] = plan.unpackers[i](argv[i])
+    return 0
+
+
+cdef int unpack_values_into(list columns, typespecs.TypeSpec typespec, object values, Py_ssize_t row) except -1:
+    cdef Py_ssize_t i
+    if len(values) != len(columns):
+        raise ValueError('Args at row %s do not match typespec %r (length %s), got length %s' % (
+            row, typespec.as_str, len(columns), len(values)))
+    for i, value in enumerate(values):
+        columns[i][row] = value
+    return 0
+
+
+cdef bint is_uint32_buffer(object arg):
+    view = memoryview(arg)
+    return view.itemsize == 4 and view.format[-1:] in ('I', 'L')
+
+
+cdef bint is_flat(object args, Py_ssize_t length):
+    # Whether args may be packed as is, without flattening
+    if not isinstance(args, (tuple, list)) or len(args) != length:
+        return False
+    for arg in args:
+        if not (PyFloat_CheckExact(arg) or PyLong_CheckExact(arg) or PyUnicode_CheckExact(arg)
+                or isinstance(arg, BASIC_TYPES)):
+            return False
+    return True
+
+
+cdef lo.lo_message pack_lo_message(typespecs.TypeSpec typespec, object args: Iterable[types.MessageTypes]) except NULL:
+    cdef:
+        Plan plan = get_plan(typespec)
         lo.lo_message lo_message
-        lo.lo_blob lo_blob
-        uint8_t * midi_p
-        bytes byarg
-        char * charg
-        int32_t size
+        Py_ssize_t i
 
-    flat = []
-    typespecs.flatten_args_into(args, flat)
-    args = flat
+    if plan.array_type and len(args) == 1 and PyObject_CheckBuffer(args[0]) and not isinstance(args[0], (bytes, str)):
+        # Fast path for a single array-like argument packed into a homogeneous numeric typespec. For MIDI, only
+        # arrays of packed 32 bit values; a single array of 4 bytes is one event.
+        if plan.array_type != typespecs.LO_MIDI or is_uint32_buffer(args[0]):
+            return pack_lo_message_array(typespec, plan.array_type, args[0])
 
-    if len(typespec_array) != len(args):
-        raise ValueError(
-            'Argument length does not match typespec %r (length %s), got %r (length %s)' % (
-                typespec.as_str, len(typespec_array), args, len(args)))
+    if not is_flat(args, plan.length):
+        flat = []
+        typespecs.flatten_args_into(args, flat)
+        args = flat
+        if plan.length != len(args):
+            raise ValueError(
+                'Argument length does not match typespec %r (length %s), got %r (length %s)' % (
+                    typespec.as_str, plan.length, args, len(args)))
 
     lo_message = lo.lo_message_new()
     if lo_message is NULL:
         raise MemoryError
-    for i, (argtype, arg) in enumerate(zip(typespec_array, args)):
-        if argtype in ARGTYPES_INTS and isinstance(arg, int):
-            if argtype == typespecs.LO_INT64:
-                if not (INT64_MIN <= arg <= INT64_MAX):
-                    raise OverflowError('Invalid value for INT32: %s (overflow)' % repr(arg))
-                if lo.lo_message_add_int64(lo_message, arg) != 0:
-                    raise MemoryError
-            else:
-                if not (INT32_MIN <= arg <= INT32_MAX):
-                    raise OverflowError('Invalid value for INT32: %s (overflow)' % repr(arg))
-                if lo.lo_message_add_int32(lo_message, int(arg)) != 0:
-                    raise MemoryError
-        elif argtype in ARGTYPES_FLOATS and isinstance(arg, float):
-            if arg in INFINITIES:
-                raise ValueError('Invalid value for %s: %s' % (ARGTYPE_NAMES[argtype], repr(arg)))
-            if argtype == typespecs.LO_FLOAT:
-                if float(<float>arg) != arg:
-                    raise OverflowError('Invalid value for FLOAT: %s (overflow)' % repr(arg))
-                elif lo.lo_message_add_float(lo_message, arg) != 0:
-                    raise MemoryError
-            else:
-                if float(<double>arg) != arg:
-                    raise OverflowError('Invalid value for DOUBLE: %s (overflow)' % repr(arg))
-                elif lo.lo_message_add_double(lo_message, arg) != 0:
-                    raise MemoryError
-        elif argtype in ARGTYPES_STRINGS:
-            byarg = None
-            charg = NULL
-            if isinstance(arg, array.array):
-                IF PYPY:
-                    byarg = arg.tobytes()
-                    charg = <char*>byarg
-                ELSE:
-                    charg = (<array.array>arg).data.as_chars
-            elif isinstance(arg, str):
-                byarg = arg.encode('utf8')
-                charg = <char*>byarg
-            if argtype == typespecs.LO_STRING:
-                if charg is NULL:
-                    raise TypeError('Invalid type for STRING: %s' % repr(arg))
-                elif lo.lo_message_add_string(lo_message, charg) != 0:
-                    raise MemoryError
-            elif argtype == typespecs.LO_SYMBOL:
-                if charg is NULL:
-                    raise TypeError('Invalid type for SYMBOL: %s' % repr(arg))
-                elif lo.lo_message_add_symbol(lo_message, charg) != 0:
-                    raise MemoryError
-
-            # CHAR below
-            elif isinstance(arg, int):
-                if lo.lo_message_add_char(lo_message, arg) != 0:
-                    raise MemoryError
-            elif charg is NULL:
-                raise TypeError('Invalid type for CHAR: %s' % repr(arg))
-            elif len(arg) != 1:
-                raise OverflowError('Invalid value for CHAR: %s (must be a single char)' % repr(arg))
-            else:
-                if lo.lo_message_add_char(lo_message, charg[0]) != 0:
-                    raise MemoryError
-        elif argtype == typespecs.LO_BLOB:
-            byarg = None
-            charg = NULL
-            size = 0
-            if isinstance(arg, array.array):
-                size = <int32_t>len(arg)
-                IF PYPY:
-                    byarg = arg.tobytes()
-                    charg = <char*>byarg
-                ELSE:
-                    charg = (<array.array>arg).data.as_chars
-            elif isinstance(arg, bytes):
-                byarg = arg
-                size = <int32_t>len(byarg)
-                charg = <char*>byarg
-            else:
-                raise TypeError('Invalid type for BLOB: %s' % (repr(arg)))
-            if not size:
-                raise ValueError('Invalid value for BLOB: %s (must have length >= 1)' % repr(arg))
-            lo_blob = lo.lo_blob_new(size, <void*>charg)
-            if lo_blob is NULL:
-                raise MemoryError
-            if lo.lo_message_add_blob(lo_message, lo_blob) != 0:
-                raise MemoryError
-            lo.lo_blob_free(lo_blob)
-        elif argtype == typespecs.LO_TIMETAG:
-            if isinstance(arg, timetags.TimeTag):
-                timetag = arg
-            elif isinstance(arg, (float, int)):
-                timetag = timetags.TimeTag(arg)
-            elif isinstance(arg, datetime.datetime):
-                timetag = timetags.TimeTag(arg)
-            else:
-                raise TypeError('Invalid type for TIMETAG: %s' % (repr(arg)))
-            if lo.lo_message_add_timetag(lo_message, (<timetags.TimeTag>timetag).lo_timetag) != 0:
-                raise MemoryError
-        elif argtype == typespecs.LO_MIDI:
-            if isinstance(arg, array.array):
-                arg = midis.Midi(*arg)
-            elif not isinstance(arg, midis.Midi):
-                raise TypeError('Invalid type for MIDI: %s' % (repr(arg)))
-            if lo.lo_message_add_midi(lo_message, (<midis.Midi>arg).data) != 0:
-                raise MemoryError
-        elif argtype == typespecs.LO_NIL and arg is None:
-            if lo.lo_message_add_nil(lo_message) != 0:
-                raise MemoryError
-        elif argtype == typespecs.LO_TRUE and isinstance(arg, (int, bool)):
-            if arg not in ARGVALS_TRUE:
-                raise ValueError('Invalid value for TRUE: %s' % repr(arg))
-            if lo.lo_message_add_true(lo_message) != 0:
-                raise MemoryError
-        elif argtype == typespecs.LO_FALSE and isinstance(arg, (int, bool)):
-            if arg not in ARGVALS_FALSE:
-                raise ValueError('Invalid value for FALSE: %s' % repr(arg))
-            if lo.lo_message_add_false(lo_message) != 0:
-                raise MemoryError
-        elif argtype == typespecs.LO_INFINITUM and isinstance(arg, float):
-            if arg != float('inf'):
-                raise ValueError('Invalid value for INFINITUM: %s' % repr(arg))
-            if lo.lo_message_add_infinitum(lo_message) != 0:
-                raise MemoryError
-        elif argtype not in ARGTYPES:
-            raise ValueError('Invalid argtype %s' % repr(argtype))
-        else:
-            raise TypeError('Invalid type for %s: %s' % (ARGTYPE_NAMES[argtype], repr(arg)))
+    try:
+        for i in range(plan.length):
+            plan.packers[i](lo_message, args[i])
+    except:
+        lo.lo_message_free(lo_message)
+        raise
     return lo_message
@@ -0,0 +1,26 @@
+# cython: language_level=3
+
+
+cdef size_t _DEFAULT_READ_SIZE
+cdef size_t _DEFAULT_MAX_PACKET_SIZE
+
+
+cdef bytes slip_decode(const unsigned char * p, size_t length)
+
+
+cdef class StreamDecoder:
+    cdef readonly int framing
+    cdef readonly size_t read_size
+    cdef readonly size_t max_packet_size
+    cdef readonly unsigned long long packets
+    cdef readonly unsigned long long nbytes
+
+    # private
+    cdef char * data
+    cdef size_t capacity
+    cdef size_t start
+    cdef size_t end
+    cdef size_t scan
+
+    cdef int reserve(self, size_t size) except -1
+    cdef int next_packet(self, char ** packet, size_t * size) except -1
@@ -0,0 +1,345 @@
+# cython: language_level=3
+
+import array
+from typing import Any, Iterable, Iterator, List, Union
+
+from cpython.buffer cimport PyBUF_WRITE
+from cpython.memoryview cimport PyMemoryView_FromMemory
+from libc.stdlib cimport free, realloc
+from libc.string cimport memchr, memcpy, memmove
+
+from . import transports, types
+from . cimport lo, messages, pack, typespecs
+
+
+__all__ = [
+    'decode_columns', 'iter_packets', 'parse_packet', 'StreamDecoder', 'FRAMING_NONE', 'FRAMING_LENGTH',
+    'FRAMING_SLIP', 'DEFAULT_READ_SIZE', 'DEFAULT_MAX_PACKET_SIZE']
+
+
+# A single packet, as read from a datagram
+FRAMING_NONE = 0
+# Packets each preceded by a 32 bit big-endian length, as sent over TCP by OSC 1.0
+FRAMING_LENGTH = 1
+# Packets delimited by double-ended SLIP, as sent over TCP by OSC 1.1
+FRAMING_SLIP = 2
+
+# Bytes a StreamDecoder makes room for per read
+cdef size_t _DEFAULT_READ_SIZE = 65536
+DEFAULT_READ_SIZE = _DEFAULT_READ_SIZE
+# The largest packet a StreamDecoder accepts, which bounds its buffer
+cdef size_t _DEFAULT_MAX_PACKET_SIZE = 1 << 20
+DEFAULT_MAX_PACKET_SIZE = _DEFAULT_MAX_PACKET_SIZE
+
+cdef unsigned char SLIP_END = transports.SLIP_END
+cdef unsigned char SLIP_ESC = transports.SLIP_ESC
+cdef unsigned char SLIP_ESC_END = transports.SLIP_ESC_END
+cdef unsigned char SLIP_ESC_ESC = transports.SLIP_ESC_ESC
+
+
+def parse_packet(data: Any) -> Union[messages.Message, messages.Bundle]:
+    """
+    Parse a single serialized OSC packet, which may be a message or a bundle.
+    """
+    cdef const unsigned char[::1] view = messages.as_bytes_view(data)
+    if not len(view):
+        raise ValueError('Invalid OSC packet: empty')
+    return messages.packet_from_ptr(<char*>&view[0], len(view))
+
+
+def iter_packets(
+    data: Any,
+    framing: int = FRAMING_NONE,
+    flatten: bool = False,
+) -> Iterator[Union[messages.Message, messages.Bundle]]:
+    """
+    Parse the OSC packets in a bytes-like object, such as a capture of a TCP stream, without copying it.
+
+    framing is one of FRAMING_NONE, FRAMING_LENGTH or FRAMING_SLIP. When flatten is True, the messages in bundles
+    (and nested bundles) are yielded in place of the bundles.
+    """
+    cdef:
+        const unsigned char[::1] view = messages.as_bytes_view(data)
+        size_t size = len(view)
+        size_t offset = 0
+        size_t length
+        const unsigned char * p
+        const unsigned char * end
+
+    if framing not in (FRAMING_NONE, FRAMING_LENGTH, FRAMING_SLIP):
+        raise ValueError('Invalid framing %r' % framing)
+    if not size:
+        return
+
+    if framing == FRAMING_NONE:
+        yield from flattened(messages.packet_from_ptr(<char*>&view[0], size), flatten)
+
+    elif framing == FRAMING_LENGTH:
+        while offset < size:
+            if size - offset < 4:
+                raise ValueError('Invalid OSC stream: truncated length at offset %s' % offset)
+            p = &view[offset]
+            length = (<size_t>p[0] << 24) | (<size_t>p[1] << 16) | (<size_t>p[2] << 8) | <size_t>p[3]
+            offset += 4
+            if length > size - offset:
+                raise ValueError('Invalid OSC stream: packet of %s bytes at offset %s is truncated' % (length, offset))
+            if length:
+                yield from flattened(messages.packet_from_ptr(<char*>&view[offset], length), flatten)
+            offset += length
+
+    else:
+        while offset < size:
+            p = &view[offset]
+            end = <const unsigned char *>memchr(p, SLIP_END, size - offset)
+            length = (size - offset) if end is NULL else <size_t>(end - p)
+            # Double-ended SLIP puts END on both sides of a packet, so skip the empty frames between them
+            if length:
+                if memchr(p, SLIP_ESC, length) is NULL:
+                    packet = messages.packet_from_ptr(<char*>p, length)
+                else:
+                    unescaped = slip_decode(p, length)
+                    packet = messages.packet_from_ptr(<char*>unescaped, len(unescaped))
+                yield from flattened(packet, flatten)
+            offset += length + 1
+
+
+def decode_columns(
+    packets: Iterable[Any],
+    typespec: types.TypeSpecTypes,
+) -> List[Union[array.array, list]]:
+    """
+    Decode many messages which share a typespec into one column per argument position: an array.array for f, d,
+    i and h arguments, and a list for any others.
+
+    Each packet is a serialized OSC message, a Message, or a list of already unpacked args, such as the items
+    returned by Sub.drain_nowait().
+    """
+    cdef:
+        typespecs.TypeSpec spec = typespec if isinstance(typespec, typespecs.TypeSpec) else typespecs.TypeSpec(typespec)
+        const unsigned char[::1] view
+        lo.lo_message lo_message
+        Py_ssize_t row
+        int result = 0
+
+    if spec.matches_any:
+        raise ValueError('decode_columns() requires a specific typespec')
+    if not isinstance(packets, (list, tuple)):
+        packets = list(packets)
+    columns = pack.new_columns(spec, len(packets))
+    for row, packet in enumerate(packets):
+        if isinstance(packet, messages.Message):
+            pack.unpack_message_into(columns, spec, (<messages.Message>packet).lo_message, row)
+        elif isinstance(packet, (list, tuple, array.array)):
+            pack.unpack_values_into(columns, spec, packet, row)
+        else:
+            view = messages.as_bytes_view(packet)
+            if not len(view) or messages.is_bundle_ptr(<char*>&view[0], len(view)):
+                raise ValueError('Invalid OSC message at row %s' % row)
+            lo_message = lo.lo_message_deserialise(<char*>&view[0], len(view), &result)
+            if lo_message is NULL:
+                raise ValueError('Invalid OSC message at row %s: liblo error %s' % (row, result))
+            try:
+                pack.unpack_message_into(columns, spec, lo_message, row)
+            finally:
+                lo.lo_message_free(lo_message)
+    return columns
+
+
+cdef bytes slip_decode(const unsigned char * p, size_t length):
+    cdef bytearray decoded = bytearray(p[:length])
+    return bytes(decoded[:slip_unescape(<unsigned char*><char*>decoded, length)])
+
+
+cdef size_t slip_unescape(unsigned char * p, size_t length) except? 0:
+    """
+    Undo SLIP escapes in place, returning the unescaped length.
+    """
+    cdef:
+        size_t i = 0
+        size_t j = 0
+        unsigned char c
+    while i < length:
+        c = p[i]
+        if c == SLIP_ESC:
+            i += 1
+            if i == length:
+                raise ValueError('Invalid SLIP frame: ends with an escape')
+            c = p[i]
+            if c == SLIP_ESC_END:
+                c = SLIP_END
+            elif c == SLIP_ESC_ESC:
+                c = SLIP_ESC
+            else:
+                raise ValueError('Invalid SLIP frame: bad escape 0x%02x' % c)
+        p[j] = c
+        i += 1
+        j += 1
+    return j
+
+
+cdef class StreamDecoder:
+    """
+    Splits a stream of packets framed by FRAMING_LENGTH or FRAMING_SLIP, as it arrives in chunks of any size.
+
+    Chunks are read straight into the decoder's buffer through get_buffer() and feed(), as by an
+    asyncio.BufferedProtocol, or copied in with write(). Complete packets are then taken in order by iterating,
+    with SLIP escapes undone in place. When framing is None it is detected from the first byte, since a SLIP stream
+    starts with END. A packet larger than max_packet_size raises ValueError, so the buffer stays bounded.
+    """
+
+    def __cinit__(
+        self,
+        framing: Union[int, None] = None,
+        *,
+        read_size: int = DEFAULT_READ_SIZE,
+        max_packet_size: int = DEFAULT_MAX_PACKET_SIZE,
+    ):
+        if framing not in (None, FRAMING_LENGTH, FRAMING_SLIP):
+            raise ValueError('Invalid framing %r' % framing)
+        if read_size < 1:
+            raise ValueError('read_size must be >= 1, got %r' % read_size)
+        if max_packet_size < 1:
+            raise ValueError('max_packet_size must be >= 1, got %r' % max_packet_size)
+        self.framing = FRAMING_NONE if framing is None else framing
+        self.read_size = read_size
+        self.max_packet_size = max_packet_size
+        self.data = NULL
+
+    def __init__(
+        self,
+        framing: Union[int, None] = None,
+        *,
+        read_size: int = DEFAULT_READ_SIZE,
+        max_packet_size: int = DEFAULT_MAX_PACKET_SIZE,
+    ):
+        pass
+
+    def __dealloc__(self):
+        free(self.data)
+        self.data = NULL
+
+    def __repr__(self):
+        return 'StreamDecoder(%r)' % self.framing
+
+    def __len__(self):
+        """
+        Bytes buffered, which have not yet been taken as packets.
+        """
+        return self.end - self.start
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        cdef:
+            char * packet
+            size_t size
+        if not self.next_packet(&packet, &size):
+            raise StopIteration
+        return packet[:size]
+
+    def get_buffer(self, sizehint: int = -1) -> memoryview:
+        """
+        Return writable space for at least read_size (or sizehint) bytes, valid until the next call to feed().
+        """
+        self.reserve(max(self.read_size, sizehint))
+        return PyMemoryView_FromMemory(&self.data[self.end], self.capacity - self.end, PyBUF_WRITE)
+
+    def feed(self, nbytes: int):
+        """
+        Add nbytes which have been written to the space returned by get_buffer().
+        """
+        if nbytes < 0 or <size_t>nbytes > self.capacity - self.end:
+            raise ValueError('nbytes %r exceeds the buffer' % nbytes)
+        if not nbytes:
+            return
+        if self.framing == FRAMING_NONE:
+            self.framing = FRAMING_SLIP if <unsigned char>self.data[self.end] == SLIP_END else FRAMING_LENGTH
+        self.end += nbytes
+
+    def write(self, data: Any):
+        """
+        Copy a chunk of the stream into the buffer.
+        """
+        cdef:
+            const unsigned char[::1] view = messages.as_bytes_view(data)
+            size_t size = len(view)
+        if size:
+            self.reserve(size)
+            memcpy(&self.data[self.end], &view[0], size)
+            self.feed(size)
+
+    cdef int reserve(self, size_t size) except -1:
+        cdef:
+            size_t capacity
+            char * data
+        if self.capacity - self.end >= size:
+            return 0
+        if self.start:
+            # Move the partial packet to the front, rather than growing
+            memmove(self.data, &self.data[self.start], self.end - self.start)
+            self.end -= self.start
+            self.scan -= self.start
+            self.start = 0
+        if self.capacity - self.end < size:
+            capacity = max(self.capacity * 2, self.end + size)
+            data = <char*>realloc(self.data, capacity)
+            if data is NULL:
+                raise MemoryError()
+            self.data = data
+            self.capacity = capacity
+        return 0
+
+    cdef int next_packet(self, char ** packet, size_t * size) except -1:
+        """
+        Take the next complete packet, returning 0 if there is none. It stays valid until more data is added.
+        """
+        cdef:
+            unsigned char * p
+            unsigned char * found
+            size_t length
+        while self.start < self.end:
+            p = <unsigned char*>&self.data[self.start]
+            if self.framing == FRAMING_LENGTH:
+                if self.end - self.start < 4:
+                    return 0
+                length = (<size_t>p[0] << 24) | (<size_t>p[1] << 16) | (<size_t>p[2] << 8) | <size_t>p[3]
+                if length > self.max_packet_size:
+                    raise ValueError('Invalid OSC stream: packet of %s bytes exceeds %s' % (length, self.max_packet_size))
+                if self.end - self.start - 4 < length:
+                    return 0
+                p += 4
+                self.start += 4 + length
+            else:
+                # Carry on from where the last search for END stopped
+                found = <unsigned char*>memchr(&self.data[self.scan], SLIP_END, self.end - self.scan)
+                if found is NULL:
+                    self.scan = self.end
+                    if self.end - self.start > self.max_packet_size:
+                        raise ValueError('Invalid OSC stream: SLIP frame exceeds %s bytes' % self.max_packet_size)
+                    return 0
+                length = found - p
+                self.start += length + 1
+                self.scan = self.start
+                if length and memchr(p, SLIP_ESC, length) is not NULL:
+                    length = slip_unescape(p, length)
+                if length > self.max_packet_size:
+                    raise ValueError('Invalid OSC stream: SLIP frame exceeds %s bytes' % self.max_packet_size)
+            # Double-ended SLIP puts END on both sides of a packet, and an empty frame carries nothing
+            if length:
+                self.packets += 1
+                self.nbytes += length
+                packet[0] = <char*>p
+                size[0] = length
+                return 1
+        # Everything has been taken, so start again from the front of the buffer
+        self.start = self.end = self.scan = 0
+        return 0
+
+
+def flattened(packet: Union[messages.Message, messages.Bundle], flatten: bool):
+    if flatten and isinstance(packet, messages.Bundle):
+        for item in packet:
+            yield from flattened(item, flatten)
+    else:
+        yield packet
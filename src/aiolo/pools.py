@@ -0,0 +1,173 @@
+import asyncio
+import weakref
+from typing import Tuple, Union
+
+from . import logs, protos, transports
+
+
+__all__ = ['TransportPool', 'get_default_pool', 'DEFAULT_MAX_PER_DESTINATION', 'DEFAULT_IDLE_TIMEOUT']
+
+
+DEFAULT_MAX_PER_DESTINATION = 4
+
+# Seconds a pooled transport may sit unused before it is closed
+DEFAULT_IDLE_TIMEOUT = 60.0
+
+# One default pool per event loop, since transports cannot outlive or move between loops
+_DEFAULT_POOLS = weakref.WeakKeyDictionary()
+
+
+PoolKey = Tuple[int, str, str, bool]
+
+
+def get_default_pool(loop: Union[asyncio.AbstractEventLoop, None] = None) -> 'TransportPool':
+    """
+    Get the process-wide TransportPool for the given (or current) event loop.
+    """
+    loop = loop or asyncio.get_event_loop()
+    try:
+        return _DEFAULT_POOLS[loop]
+    except KeyError:
+        pool = _DEFAULT_POOLS[loop] = TransportPool(loop=loop)
+        return pool
+
+
+class TransportPool:
+    """
+    Shares warm, already-connected Transports between Addresses which send to the same destination.
+
+    Transports are keyed by (proto, host, port, stream_slip). Up to max_per_destination connections are
+    opened per key; a new one is only opened when every existing connection is applying backpressure.
+    Connections which have errored or been closed by the peer are discarded, and connections which have
+    been idle for idle_timeout seconds are closed.
+    """
+    __slots__ = (
+        'max_per_destination', 'idle_timeout', 'check_interval', 'high', 'low', 'loop',
+        '_transports', '_connecting', '_sweep_handle')
+
+    def __init__(
+        self,
+        *,
+        max_per_destination: int = DEFAULT_MAX_PER_DESTINATION,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+        check_interval: Union[float, None] = None,
+        high: Union[int, None] = None,
+        low: Union[int, None] = None,
+        loop: Union[asyncio.AbstractEventLoop, None] = None,
+    ):
+        if max_per_destination < 1:
+            raise ValueError('max_per_destination must be >= 1, got %r' % max_per_destination)
+        if idle_timeout <= 0:
+            raise ValueError('idle_timeout must be > 0, got %r' % idle_timeout)
+        self.max_per_destination = max_per_destination
+        self.idle_timeout = idle_timeout
+        self.check_interval = idle_timeout / 2 if check_interval is None else check_interval
+        self.high = high
+        self.low = low
+        self.loop = loop or asyncio.get_event_loop()
+        self._transports = {}
+        self._connecting = {}
+        self._sweep_handle = None
+
+    def __repr__(self):
+        return 'TransportPool(max_per_destination=%r, idle_timeout=%r)' % (
+            self.max_per_destination, self.idle_timeout)
+
+    def __len__(self):
+        return sum(len(ts) for ts in self._transports.values())
+
+    @staticmethod
+    def key(proto: Union[int, str], host: Union[str, None], port: Union[str, int], stream_slip: bool = False) -> PoolKey:
+        proto = protos.get_proto_id(proto)
+        if proto == protos.PROTO_DEFAULT:
+            proto = protos.PROTO_UDP
+        # Framing only applies to streams
+        return proto, host or 'localhost', str(port), bool(stream_slip) and proto == protos.PROTO_TCP
+
+    async def acquire(
+        self,
+        proto: Union[int, str],
+        host: Union[str, None],
+        port: Union[str, int],
+        *,
+        stream_slip: bool = False,
+        no_delay: bool = False,
+        ttl: int = -1,
+    ) -> transports.Transport:
+        """
+        Get a connected transport for the destination, opening a new one if needed and allowed.
+
+        The transport remains owned by the pool and may be shared; callers should not close it.
+        """
+        key = self.key(proto, host, port, stream_slip)
+        pooled = self._transports.setdefault(key, [])
+        pooled[:] = [t for t in pooled if self._check(t)]
+
+        connecting = self._connecting.get(key)
+        best = min(pooled, key=lambda t: t.write_buffer_size, default=None)
+        if best is not None:
+            at_limit = len(pooled) + (connecting is not None) >= self.max_per_destination
+            if not best.paused or at_limit:
+                return best
+
+        if connecting is None:
+            connecting = self._connecting[key] = self.loop.create_task(self._connect(key, no_delay, ttl))
+        # Concurrent callers share the connection being opened rather than each opening their own, and one caller
+        # being cancelled does not cancel it for the others
+        return await asyncio.shield(connecting)
+
+    async def _connect(self, key: PoolKey, no_delay: bool, ttl: int) -> transports.Transport:
+        transport = transports.Transport(
+            key[0], key[1], key[2],
+            stream_slip=key[3], no_delay=no_delay, ttl=ttl, high=self.high, low=self.low, loop=self.loop)
+        try:
+            await transport.connect()
+        finally:
+            del self._connecting[key]
+        self._transports.setdefault(key, []).append(transport)
+        logs.logger.debug('%r: opened %r', self, transport)
+        self._schedule_sweep()
+        return transport
+
+    def _check(self, transport: transports.Transport) -> bool:
+        if transport.healthy:
+            return True
+        logs.logger.debug('%r: discarding unhealthy %r', self, transport)
+        transport.close()
+        return False
+
+    def _schedule_sweep(self):
+        if self._sweep_handle is None:
+            self._sweep_handle = self.loop.call_later(self.check_interval, self.sweep)
+
+    def sweep(self):
+        """
+        Close idle or unhealthy transports. This is called periodically while the pool is not empty.
+        """
+        self._sweep_handle = None
+        cutoff = self.loop.time() - self.idle_timeout
+        for key, pooled in list(self._transports.items()):
+            kept = []
+            for transport in pooled:
+                if transport.last_used < cutoff and not transport.write_buffer_size:
+                    logs.logger.debug('%r: closing idle %r', self, transport)
+                    transport.close()
+                elif self._check(transport):
+                    kept.append(transport)
+            if kept:
+                pooled[:] = kept
+            else:
+                del self._transports[key]
+        if self._transports:
+            self._schedule_sweep()
+
+    def close(self):
+        if self._sweep_handle is not None:
+            self._sweep_handle.cancel()
+            self._sweep_handle = None
+        for connecting in list(self._connecting.values()):
+            connecting.cancel()
+        for pooled in self._transports.values():
+            for transport in pooled:
+                transport.close()
+        self._transports.clear()
@@ -0,0 +1,21 @@
+# cython: language_level=3
+
+from . cimport abstractservers
+
+
+cdef class ProtocolServer(abstractservers.AbstractServer):
+    cdef readonly set connections
+    cdef readonly size_t read_size
+    cdef readonly size_t max_packet_size
+    cdef readonly unsigned int max_burst
+
+    # private
+    cdef object sock
+    cdef int sock_proto
+    cdef object endpoint
+    cdef object transport
+
+    cdef int lo_server_start(self) except -1
+    cdef int lo_server_stop(self) except -1
+    cdef int schedule_pending(self) except -1
+    cdef int socket_fd(self)
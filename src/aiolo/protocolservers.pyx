@@ -0,0 +1,390 @@
+# cython: language_level=3
+
+import asyncio
+import os
+import socket
+import sys
+import urllib.parse
+from typing import Any, Dict, Union
+
+from . import exceptions, logs, protos
+from . cimport lo, multicasts, packets
+
+
+from .abstractservers cimport on_error, pop_server_start_error, AbstractServer
+
+
+__all__ = ['ProtocolServer', 'Connection']
+
+
+cdef class ProtocolServer(AbstractServer):
+    """
+    A server whose sockets are owned by the event loop, through create_datagram_endpoint() and create_server(),
+    rather than by liblo; packets are handed to liblo only to be dispatched. Loops with their own transports, such
+    as uvloop, serve it natively. Each open TCP connection is a Connection in connections, which can be paused and
+    resumed.
+
+    TCP connections are read read_size bytes at a time into a StreamDecoder, which frames packets natively, and
+    every complete packet is dispatched in one pass. A connection which sends a packet larger than max_packet_size
+    is closed. When max_burst is > 0, at most that many packets are dispatched from a connection before the loop
+    serves others; until the rest have been dispatched, the connection is not read from.
+
+    osc.unix servers are datagram sockets, as with liblo.
+    """
+
+    def __cinit__(
+        self,
+        *,
+        read_size: int = packets._DEFAULT_READ_SIZE,
+        max_packet_size: int = packets._DEFAULT_MAX_PACKET_SIZE,
+        max_burst: int = 0,
+        **kwargs,
+    ):
+        if read_size < 1:
+            raise ValueError('read_size must be >= 1, got %r' % read_size)
+        if max_packet_size < 1:
+            raise ValueError('max_packet_size must be >= 1, got %r' % max_packet_size)
+        if max_burst < 0:
+            raise ValueError('max_burst must be >= 0, got %r' % max_burst)
+        self.read_size = read_size
+        self.max_packet_size = max_packet_size
+        self.max_burst = max_burst
+        self.sock_proto = protos.PROTO_DEFAULT
+        self.connections = set()
+
+    def __init__(
+        self,
+        *,
+        url: Union[str, None] = None,
+        port: Union[str, int, None] = None,
+        proto: Union[str, int, None] = None,
+        multicast: Union[multicasts.MultiCast, None] = None,
+        read_size: int = packets._DEFAULT_READ_SIZE,
+        max_packet_size: int = packets._DEFAULT_MAX_PACKET_SIZE,
+        max_burst: int = 0,
+        **kwargs,
+    ):
+        pass
+
+    def __dealloc__(self):
+        if self.lo_server is not NULL:
+            lo.lo_server_free(self.lo_server)
+            self.lo_server = NULL
+
+    @property
+    def url(self):
+        if not self.running:
+            return AbstractServer.url.__get__(self)
+        if self.sock_proto == protos.PROTO_UNIX:
+            return '%s://%s' % (protos.PROTOS[self.sock_proto], self.port)
+        return '%s://%s:%s/' % (protos.PROTOS[self.sock_proto], socket.gethostname(), self.port)
+
+    @url.setter
+    def url(self, url):
+        AbstractServer.url.__set__(self, url)
+
+    @property
+    def proto(self) -> int:
+        if self.running:
+            return self.sock_proto
+        return AbstractServer.proto.__get__(self)
+
+    @proto.setter
+    def proto(self, proto: Union[str, int, None]):
+        AbstractServer.proto.__set__(self, proto)
+
+    @property
+    def port(self) -> str:
+        if self.running:
+            if self.sock_proto == protos.PROTO_UNIX:
+                return self.sock.getsockname()
+            return str(self.sock.getsockname()[1])
+        return AbstractServer.port.__get__(self)
+
+    @port.setter
+    def port(self, port: Union[str, int, None]):
+        AbstractServer.port.__set__(self, port)
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        stats = AbstractServer.stats.__get__(self)
+        stats['connections'] = len(self.connections)
+        stats['errors'] = sum(connection.errors for connection in self.connections)
+        return stats
+
+    def pause_reading(self):
+        """
+        Stop reading from every TCP connection, so that senders are held back by TCP flow control.
+        """
+        for connection in self.connections:
+            connection.pause_reading()
+
+    def resume_reading(self):
+        for connection in self.connections:
+            connection.resume_reading()
+
+    cdef int lo_server_start(self) except -1:
+        cdef lo.lo_server lo_server = NULL
+
+        try:
+            proto = self.proto
+        except ValueError as exc:
+            raise exceptions.StartError('%r: %s' % (self, exc)) from exc
+        host = ''
+        port = self._port
+        if proto == protos.PROTO_DEFAULT:
+            # As with liblo, a path is a unix socket
+            proto = protos.PROTO_UNIX if port and port.startswith('/') else protos.PROTO_UDP
+        if self._url:
+            parts = urllib.parse.urlsplit(self._url)
+            if proto == protos.PROTO_UNIX:
+                port = parts.path
+            else:
+                host = parts.hostname or ''
+                port = str(parts.port or 0)
+        elif self._multicast:
+            port = self._multicast.port
+
+        try:
+            sock = self._bind(proto, host, port or '0')
+        except (OSError, ValueError) as exc:
+            raise exceptions.StartError('%r: could not bind: %s' % (self, exc)) from exc
+
+        # liblo needs a server to dispatch to, though its own socket goes unused
+        lo_server = lo.lo_server_new_with_proto(NULL, protos.PROTO_UDP, on_error)
+        if lo_server is NULL:
+            sock.close()
+            server_error = pop_server_start_error()
+            if server_error is not None:
+                raise exceptions.StartError('%r: %s' % (self, server_error))
+            raise exceptions.StartError('Unknown error')
+
+        self.lo_server = lo_server
+        self.sock = sock
+        self.sock_proto = proto
+        loop = asyncio.get_event_loop()
+        if proto == protos.PROTO_TCP:
+            coro = loop.create_server(lambda: Connection(self), sock=sock)
+        else:
+            coro = loop.create_datagram_endpoint(lambda: _DatagramProtocol(self), sock=sock)
+        # The socket is already bound, so nothing is missed while the loop attaches to it
+        self.endpoint = loop.create_task(coro)
+        self.endpoint.add_done_callback(self._on_endpoint)
+        IF DEBUG: logs.logger.debug('%r: started, serving on loop', self)
+
+    def _bind(self, proto: int, host: str, port: str) -> socket.socket:
+        if proto == protos.PROTO_UNIX:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        else:
+            family = socket.AF_INET6 if ':' in host else socket.AF_INET
+            kind = socket.SOCK_STREAM if proto == protos.PROTO_TCP else socket.SOCK_DGRAM
+            sock = socket.socket(family, kind)
+        try:
+            if proto == protos.PROTO_UNIX:
+                sock.bind(port)
+            elif self._multicast:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                sock.bind(('', int(port)))
+                membership = socket.inet_aton(self._multicast.group)
+                membership += socket.inet_aton(self._multicast.ip or '0.0.0.0')
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+            else:
+                if proto == protos.PROTO_TCP:
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                sock.bind((host, socket.getservbyname(port) if not port.isdigit() else int(port)))
+            if proto == protos.PROTO_TCP:
+                sock.listen()
+            sock.setblocking(False)
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    def _on_endpoint(self, task: asyncio.Task):
+        if task.cancelled():
+            return
+        exc = task.exception()
+        if exc is not None:
+            logs.logger.error('%r: could not serve: %s', self, exc)
+            return
+        endpoint = task.result() if self.sock_proto == protos.PROTO_TCP else task.result()[0]
+        if task is not self.endpoint:
+            # Stopped before the loop had attached
+            endpoint.close()
+        elif self.sock_proto == protos.PROTO_TCP:
+            self.endpoint = endpoint
+        else:
+            self.transport = endpoint
+
+    def _dispatch_stream(self, connection: 'Connection') -> bool:
+        """
+        Dispatch the complete packets buffered by a connection, up to max_burst, returning whether any may remain.
+        """
+        cdef:
+            packets.StreamDecoder decoder = connection.decoder
+            char * packet
+            size_t size
+            unsigned int count = 0
+            int result
+        if self.lo_server is NULL:
+            return False
+        try:
+            while not self.max_burst or count < self.max_burst:
+                if not decoder.next_packet(&packet, &size):
+                    return False
+                count += 1
+                result = lo.lo_server_dispatch_data(self.lo_server, packet, size)
+                if result < 0:
+                    logs.logger.error('%r: could not dispatch packet: liblo error %s', connection, -result)
+                    connection.errors += 1
+            return True
+        finally:
+            if count:
+                self.schedule_pending()
+
+    def _received(self, data: Any) -> bool:
+        try:
+            self.dispatch(data)
+        except ValueError as exc:
+            logs.logger.error(exc)
+            return False
+        return True
+
+    cdef int lo_server_stop(self) except -1:
+        endpoint, self.endpoint = self.endpoint, None
+        if isinstance(endpoint, asyncio.Task):
+            endpoint.cancel()
+        elif endpoint is not None:
+            endpoint.close()
+        for connection in list(self.connections):
+            connection.close()
+        self.connections.clear()
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+        if self.sock is not None:
+            if self.sock_proto == protos.PROTO_UNIX:
+                try:
+                    os.unlink(self.sock.getsockname())
+                except OSError:
+                    pass
+            self.sock.close()
+            self.sock = None
+        if self.lo_server is not NULL:
+            lo.lo_server_free(self.lo_server)
+            self.lo_server = NULL
+
+    cdef int schedule_pending(self) except -1:
+        # Nothing is received on liblo's socket, so a loop timer services bundles when they come due
+        return self.arm_pending()
+
+    cdef int socket_fd(self):
+        # TCP connections inherit the listening socket's buffer sizes
+        if self.sock is None:
+            return -1
+        return self.sock.fileno()
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    __slots__ = ('server',)
+
+    def __init__(self, server: ProtocolServer):
+        self.server = server
+
+    def datagram_received(self, data: bytes, addr: Any):
+        self.server._received(data)
+
+    def error_received(self, exc: Exception):
+        logs.logger.error('%r: %s', self.server, exc)
+
+
+# Loops read straight into the decoder's buffer through BufferedProtocol, new in Python 3.7; before that, each chunk
+# is copied in by data_received()
+_ConnectionProtocol = asyncio.BufferedProtocol if sys.version_info[:2] >= (3, 7) else asyncio.Protocol
+
+
+class Connection(_ConnectionProtocol):
+    """
+    A TCP connection to a ProtocolServer. Packets may be framed by a 32 bit length (OSC 1.0) or by SLIP (OSC 1.1),
+    which is detected from the first byte.
+    """
+    __slots__ = ('server', 'decoder', 'transport', 'peername', 'errors', 'paused', '_throttled', '_handle')
+
+    def __init__(self, server: ProtocolServer):
+        self.server = server
+        self.decoder = packets.StreamDecoder(read_size=server.read_size, max_packet_size=server.max_packet_size)
+        self.transport = None
+        self.peername = None
+        self.errors = 0
+        self.paused = False
+        self._throttled = False
+        self._handle = None
+
+    def __repr__(self):
+        return 'Connection(%r)' % (self.peername,)
+
+    @property
+    def packets(self) -> int:
+        return self.decoder.packets
+
+    @property
+    def bytes(self) -> int:
+        return self.decoder.nbytes
+
+    def connection_made(self, transport: asyncio.BaseTransport):
+        self.transport = transport
+        self.peername = transport.get_extra_info('peername')
+        self.server.connections.add(self)
+
+    def connection_lost(self, exc: Union[Exception, None]):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self.server.connections.discard(self)
+
+    def pause_reading(self):
+        if self.transport is not None and not self.paused:
+            if not self._throttled:
+                self.transport.pause_reading()
+            self.paused = True
+
+    def resume_reading(self):
+        if self.transport is not None and self.paused:
+            if not self._throttled:
+                self.transport.resume_reading()
+            self.paused = False
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        return self.decoder.get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes: int):
+        self.decoder.feed(nbytes)
+        self._dispatch()
+
+    def data_received(self, data: bytes):
+        self.decoder.write(data)
+        self._dispatch()
+
+    def _dispatch(self):
+        self._handle = None
+        try:
+            more = self.server._dispatch_stream(self)
+        except ValueError as exc:
+            logs.logger.error('%r: %s, closing', self, exc)
+            self.errors += 1
+            self.close()
+            return
+        if more:
+            # Let the loop serve other connections first, without reading more from this one meanwhile
+            if not self._throttled and not self.paused:
+                self.transport.pause_reading()
+            self._throttled = True
+            self._handle = asyncio.get_event_loop().call_soon(self._dispatch)
+        elif self._throttled:
+            self._throttled = False
+            if not self.paused:
+                self.transport.resume_reading()
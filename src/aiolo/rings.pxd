@@ -0,0 +1,38 @@
+# cython: language_level=3
+
+from libc.stdint cimport uint64_t
+
+
+# Producer and consumer positions sit on their own cache lines, so the two threads do not contend for them
+ctypedef struct ring_header:
+    uint64_t head
+    char _pad_head[56]
+    uint64_t tail
+    char _pad_tail[56]
+    uint64_t pending
+    uint64_t dropped
+    uint64_t capacity
+
+
+ctypedef struct ring_t:
+    ring_header * header
+    char * data
+    uint64_t mask
+    # Producer only, the position of the reserved record
+    uint64_t reserved
+
+
+cdef char * ring_reserve(ring_t * ring, size_t size) nogil
+cdef void ring_commit(ring_t * ring, size_t size) nogil
+cdef const char * ring_peek(ring_t * ring, size_t * size) nogil
+cdef void ring_consume(ring_t * ring) nogil
+cdef bint ring_set_pending(ring_t * ring) nogil
+cdef void ring_clear_pending(ring_t * ring) nogil
+cdef uint64_t ring_used(ring_t * ring) nogil
+
+
+cdef class Ring:
+    cdef ring_t ring
+
+    # private
+    cdef void * memory
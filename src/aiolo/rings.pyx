@@ -0,0 +1,192 @@
+# cython: language_level=3
+
+from typing import Any, Union
+
+from libc.stdint cimport uint32_t, uint64_t
+from libc.stdlib cimport calloc, free
+from libc.string cimport memcpy
+
+from . cimport messages
+
+
+__all__ = ['Ring', 'DEFAULT_RING_SIZE']
+
+
+# Bytes of packet data a Ring holds by default
+DEFAULT_RING_SIZE = 1 << 20
+
+# Marks the unused end of the buffer, when a record did not fit before it wrapped
+cdef uint32_t WRAP = 0xffffffff
+
+# Records are a 32 bit length followed by the packet, padded to 4 bytes
+cdef size_t RECORD_HEADER_SIZE = 4
+
+
+cdef extern from *:
+    """
+    static inline uint64_t aiolo_load_acquire(uint64_t *p) { return __atomic_load_n(p, __ATOMIC_ACQUIRE); }
+    static inline void aiolo_store_release(uint64_t *p, uint64_t v) { __atomic_store_n(p, v, __ATOMIC_RELEASE); }
+    static inline uint64_t aiolo_exchange(uint64_t *p, uint64_t v) { return __atomic_exchange_n(p, v, __ATOMIC_ACQ_REL); }
+    """
+    uint64_t load_acquire "aiolo_load_acquire"(uint64_t * p) nogil
+    void store_release "aiolo_store_release"(uint64_t * p, uint64_t v) nogil
+    uint64_t exchange "aiolo_exchange"(uint64_t * p, uint64_t v) nogil
+
+
+cdef inline size_t record_size(size_t size) nogil:
+    return RECORD_HEADER_SIZE + ((size + 3) & ~(<size_t>3))
+
+
+cdef char * ring_reserve(ring_t * ring, size_t size) nogil:
+    """
+    Reserve space for a packet of size bytes, returning NULL and counting a drop if the ring is full.
+    """
+    cdef:
+        uint64_t capacity = ring.header.capacity
+        uint64_t head = ring.header.head
+        uint64_t used = head - load_acquire(&ring.header.tail)
+        uint64_t position = head & ring.mask
+        uint64_t contiguous = capacity - position
+        size_t need = record_size(size)
+
+    if contiguous < need:
+        # Skip the rest of the buffer and start again from the beginning
+        if used + contiguous + need > capacity:
+            ring.header.dropped += 1
+            return NULL
+        (<uint32_t*>&ring.data[position])[0] = WRAP
+        head += contiguous
+        position = 0
+    elif used + need > capacity:
+        ring.header.dropped += 1
+        return NULL
+    ring.reserved = head
+    return &ring.data[position + RECORD_HEADER_SIZE]
+
+
+cdef void ring_commit(ring_t * ring, size_t size) nogil:
+    """
+    Publish the packet written to the space returned by ring_reserve().
+    """
+    (<uint32_t*>&ring.data[ring.reserved & ring.mask])[0] = <uint32_t>size
+    store_release(&ring.header.head, ring.reserved + record_size(size))
+
+
+cdef const char * ring_peek(ring_t * ring, size_t * size) nogil:
+    """
+    Return the oldest packet and its size, or NULL if the ring is empty. It stays valid until ring_consume().
+    """
+    cdef:
+        uint64_t tail = ring.header.tail
+        uint64_t head = load_acquire(&ring.header.head)
+        uint64_t position
+        uint32_t length
+    while tail != head:
+        position = tail & ring.mask
+        length = (<uint32_t*>&ring.data[position])[0]
+        if length == WRAP:
+            tail += ring.header.capacity - position
+            store_release(&ring.header.tail, tail)
+            continue
+        size[0] = length
+        return &ring.data[position + RECORD_HEADER_SIZE]
+    return NULL
+
+
+cdef void ring_consume(ring_t * ring) nogil:
+    cdef uint64_t tail = ring.header.tail
+    cdef uint32_t length = (<uint32_t*>&ring.data[tail & ring.mask])[0]
+    store_release(&ring.header.tail, tail + record_size(length))
+
+
+cdef bint ring_set_pending(ring_t * ring) nogil:
+    """
+    Flag that packets are waiting, returning True if they were not already flagged, when the consumer needs waking.
+    """
+    return exchange(&ring.header.pending, 1) == 0
+
+
+cdef void ring_clear_pending(ring_t * ring) nogil:
+    # Clear before draining, so that packets pushed during the drain flag the ring again
+    exchange(&ring.header.pending, 0)
+
+
+cdef uint64_t ring_used(ring_t * ring) nogil:
+    return load_acquire(&ring.header.head) - load_acquire(&ring.header.tail)
+
+
+cdef class Ring:
+    """
+    A single-producer, single-consumer ring of packets, which one thread can push to and another can pop from
+    without holding the GIL or a lock. size is in bytes, and is rounded up to a power of two.
+    """
+
+    def __cinit__(self, size: int = DEFAULT_RING_SIZE):
+        cdef uint64_t capacity = 64
+        if size < 1:
+            raise ValueError('size must be >= 1, got %r' % size)
+        while capacity < <uint64_t>size:
+            capacity <<= 1
+        self.memory = calloc(1, sizeof(ring_header) + capacity)
+        if self.memory is NULL:
+            raise MemoryError()
+        self.ring.header = <ring_header*>self.memory
+        self.ring.header.capacity = capacity
+        self.ring.data = <char*>self.memory + sizeof(ring_header)
+        self.ring.mask = capacity - 1
+
+    def __init__(self, size: int = DEFAULT_RING_SIZE):
+        pass
+
+    def __dealloc__(self):
+        free(self.memory)
+        self.memory = NULL
+
+    def __repr__(self):
+        return 'Ring(%r)' % self.capacity
+
+    def __len__(self):
+        """
+        Bytes in use, including record headers and padding.
+        """
+        return ring_used(&self.ring)
+
+    @property
+    def capacity(self) -> int:
+        return self.ring.header.capacity
+
+    @property
+    def dropped(self) -> int:
+        """
+        Packets which were not pushed because the ring was full.
+        """
+        return self.ring.header.dropped
+
+    def push(self, data: Any) -> bool:
+        """
+        Push a packet, returning False if the ring is full. Only one thread may push.
+        """
+        cdef:
+            const unsigned char[::1] view = messages.as_bytes_view(data)
+            size_t size = len(view)
+            char * to
+        to = ring_reserve(&self.ring, size)
+        if to is NULL:
+            return False
+        if size:
+            memcpy(to, &view[0], size)
+        ring_commit(&self.ring, size)
+        return True
+
+    def pop(self) -> Union[bytes, None]:
+        """
+        Remove and return the oldest packet, or None if the ring is empty. Only one thread may pop.
+        """
+        cdef:
+            size_t size
+            const char * data = ring_peek(&self.ring, &size)
+        if data is NULL:
+            return None
+        packet = data[:size]
+        ring_consume(&self.ring)
+        return packet
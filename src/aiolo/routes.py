@@ -1,10 +1,12 @@
 import asyncio
-from typing import Union, Iterable
+import collections
+import re
+from typing import Any, List, NamedTuple, Tuple, Union, Iterable, Sequence
 
-from . import exceptions, subs, types, typespecs, paths
+from . import exceptions, pack, subs, types, typespecs, paths
 
 
-__all__ = ['Route', 'ANY_ROUTE']
+__all__ = ['Route', 'BundleRoute', 'ReceivedBundle', 'ANY_ROUTE']
 
 
 class Route:
@@ -12,10 +14,30 @@ class Route:
         self,
         path: types.PathTypes,
         typespec: types.TypeSpecTypes = None,
+        *,
+        as_array: bool = False,
+        fields: Union[Sequence[str], str, None] = None,
     ):
+        """
+        When as_array is True, messages whose args are all one numeric type (f, d, i or h) are received as an
+        array.array rather than a list. For MIDI-only typespecs, the array holds the packed 32 bit value of each
+        event (see Midi.packed).
+
+        When fields are given, messages are received as instances of a namedtuple class with those field names,
+        available as Route.record.
+        """
         self._subs = set()
         self.path = path if isinstance(path, paths.Path) else paths.Path(path)
         self.typespec = typespec if isinstance(typespec, typespecs.TypeSpec) else typespecs.TypeSpec(typespec)
+        if as_array and not self.matches_any_args and not pack.numeric_array_type(self.typespec):
+            raise ValueError(
+                'as_array requires a typespec of a single numeric or MIDI type, got %r' % self.typespec.as_str)
+        self.as_array = as_array
+        self.record = None
+        if fields is not None:
+            if as_array:
+                raise ValueError('Cannot provide as_array and fields together')
+            self.record = make_record(self.path, self.typespec, fields)
         try:
             self.loop = asyncio.get_event_loop()
         except RuntimeError:
@@ -97,4 +119,48 @@ class Route:
             await sub.pub(exceptions.Unsubscribed())
 
 
+class ReceivedBundle(NamedTuple):
+    """
+    The messages of a bundle, as the (route, data) of each message which matched a route, in order.
+    """
+    timetag: Any
+    items: List[Tuple[Route, Any]]
+
+
+class BundleRoute(Route):
+    """
+    Receives each bundle dispatched by a server created with bundled=True as a single ReceivedBundle, rather than
+    its messages being published to their routes one by one.
+    """
+    def __init__(self):
+        super().__init__(paths.ANY_PATH, typespecs.ANY_ARGS)
+
+    def __repr__(self):
+        return 'BundleRoute()'
+
+    __hash__ = Route.__hash__
+
+    def __eq__(self, other: Route) -> bool:
+        if not isinstance(other, Route):
+            raise TypeError('Invalid value for BundleRoute.__eq__: %s' % repr(other))
+        return other is self
+
+
+def make_record(path: paths.Path, typespec: typespecs.TypeSpec, fields: Union[Sequence[str], str]) -> type:
+    """
+    Create a namedtuple class for the args of messages with the given path and typespec.
+    """
+    if isinstance(fields, str):
+        fields = fields.replace(',', ' ').split()
+    fields = tuple(fields)
+    if typespec.matches_any:
+        raise ValueError('fields require a typespec')
+    if len(fields) != len(typespec):
+        raise ValueError('fields %r do not match typespec %r (length %s)' % (fields, typespec.as_str, len(typespec)))
+    name = ''.join(part.capitalize() for part in re.split(r'\W+', path.as_str or '') if part)
+    if not name.isidentifier():
+        name = 'Record'
+    return collections.namedtuple(name, fields)
+
+
 ANY_ROUTE = Route(paths.ANY_PATH, typespecs.ANY_ARGS)
@@ -0,0 +1,502 @@
+import asyncio
+import datetime
+import heapq
+import itertools
+import math
+import time
+from typing import Any, List, NamedTuple, Tuple, Union
+
+from . import addresses, logs, messages, routes, timetags, types
+
+
+__all__ = [
+    'TimerWheel', 'Scheduler', 'DeliveryQueue', 'Late', 'DEFAULT_RESOLUTION', 'DEFAULT_LOOKAHEAD', 'DEFAULT_MAX_BATCH',
+    'DEFAULT_LATE_TOLERANCE', 'LATE_DELIVER', 'LATE_DROP', 'LATE_FLAG']
+
+
+# Seconds per timer wheel tick
+DEFAULT_RESOLUTION = 0.001
+
+# Seconds ahead of their due time that scheduled messages are sent
+DEFAULT_LOOKAHEAD = 0.002
+
+# Messages per bundle when batching, keeps bundles well under the maximum UDP datagram size
+DEFAULT_MAX_BATCH = 64
+
+# Seconds past its due time after which a delivery counts as late
+DEFAULT_LATE_TOLERANCE = 0.002
+
+# What a DeliveryQueue does with late deliveries: publish them as usual, discard them, or publish them as Late
+LATE_DELIVER = 'deliver'
+LATE_DROP = 'drop'
+LATE_FLAG = 'flag'
+
+# Marks a cancelled entry, which is skipped rather than removed from its bucket
+_CANCELLED = object()
+
+# Entries are lists of [when, seq, item, tick], so that they sort by when, then by insertion order
+_WHEN = 0
+_ITEM = 2
+_TICK = 3
+
+
+Entry = List[Any]
+
+
+class TimerWheel:
+    """
+    A hierarchical timing wheel, with O(1) push and cancel.
+
+    Time is divided into ticks of resolution seconds. Each level has 2**bits buckets, and each bucket of a level
+    spans all the buckets of the level below, so levels=4 and bits=8 cover 2**32 ticks (~50 days at 1ms);
+    entries further in the future wait in an overflow heap. Entries are cascaded down a level as their time
+    approaches, and are released with the tick they fall in, but never popped before they are due.
+    """
+    __slots__ = (
+        'resolution', 'bits', 'levels',
+        '_mask', '_span', '_wheels', '_counts', '_overflow', '_due', '_tick', '_len', '_seq')
+
+    def __init__(self, resolution: float = DEFAULT_RESOLUTION, *, bits: int = 8, levels: int = 4, start: float = 0.):
+        if resolution <= 0:
+            raise ValueError('resolution must be > 0, got %r' % resolution)
+        if bits < 1 or levels < 1:
+            raise ValueError('bits and levels must be >= 1, got %r and %r' % (bits, levels))
+        self.resolution = resolution
+        self.bits = bits
+        self.levels = levels
+        self._mask = (1 << bits) - 1
+        self._span = 1 << (bits * levels)
+        self._wheels = [[[] for _ in range(1 << bits)] for _ in range(levels)]
+        self._counts = [0] * levels
+        self._overflow = []
+        self._due = []
+        self._tick = math.floor(start / resolution)
+        self._len = 0
+        self._seq = itertools.count()
+
+    def __repr__(self):
+        return 'TimerWheel(resolution=%r, bits=%r, levels=%r)' % (self.resolution, self.bits, self.levels)
+
+    def __len__(self):
+        return self._len
+
+    def push(self, when: float, item: Any) -> Entry:
+        """
+        Add an item which is due at when. The returned entry may be passed to cancel().
+        """
+        # Filed under the tick it falls in, and held back by pop_due() until it is due
+        entry = [when, next(self._seq), item, math.floor(when / self.resolution)]
+        self._insert(entry)
+        self._len += 1
+        return entry
+
+    def cancel(self, entry: Entry) -> bool:
+        if entry[_ITEM] is _CANCELLED:
+            return False
+        entry[_ITEM] = _CANCELLED
+        self._len -= 1
+        return True
+
+    def _insert(self, entry: Entry):
+        tick = entry[_TICK]
+        delta = tick - self._tick
+        if delta <= 0:
+            self._due.append(entry)
+            return
+        for level in range(self.levels):
+            if delta < 1 << (self.bits * (level + 1)):
+                self._wheels[level][(tick >> (self.bits * level)) & self._mask].append(entry)
+                self._counts[level] += 1
+                return
+        heapq.heappush(self._overflow, entry)
+
+    def _cascade(self, tick: int):
+        # Find the levels whose index wrapped, then re-insert their current buckets from the top down
+        wrapped = []
+        for level in range(1, self.levels):
+            index = (tick >> (self.bits * level)) & self._mask
+            wrapped.append((level, index))
+            if index:
+                break
+        for level, index in reversed(wrapped):
+            bucket = self._wheels[level][index]
+            if bucket:
+                self._wheels[level][index] = []
+                self._counts[level] -= len(bucket)
+                for entry in bucket:
+                    self._insert(entry)
+        self._pull_overflow()
+
+    def _pull_overflow(self):
+        while self._overflow and self._overflow[0][_TICK] - self._tick < self._span:
+            self._insert(heapq.heappop(self._overflow))
+
+    def _advance(self, target: int):
+        wheel = self._wheels[0]
+        counts = self._counts
+        mask = self._mask
+        while self._tick < target:
+            if not any(counts):
+                # The wheels are empty, so jump straight to the target or the next overflow entry
+                if self._overflow and self._overflow[0][_TICK] <= target:
+                    self._tick = max(self._tick, self._overflow[0][_TICK] - self._span + 1)
+                    self._pull_overflow()
+                    continue
+                self._tick = target
+                break
+            if counts[0]:
+                tick = self._tick + 1
+            else:
+                # Nothing at the lowest level, skip to where it next wraps
+                tick = min(target, (self._tick | mask) + 1)
+            self._tick = tick
+            index = tick & mask
+            if not index:
+                self._cascade(tick)
+            bucket = wheel[index]
+            if bucket:
+                wheel[index] = []
+                counts[0] -= len(bucket)
+                self._due.extend(bucket)
+
+    def pop_due(self, now: float) -> List[Tuple[float, Any]]:
+        """
+        Remove and return (when, item) for every item due at or before now, in order.
+        """
+        self._advance(math.floor(now / self.resolution))
+        if not self._due:
+            return []
+        # Only entries in the current tick can be pending, so this stays short
+        due = []
+        pending = []
+        for entry in self._due:
+            (due if entry[_WHEN] <= now else pending).append(entry)
+        self._due = pending
+        due.sort()
+        popped = [(entry[_WHEN], entry[_ITEM]) for entry in due if entry[_ITEM] is not _CANCELLED]
+        self._len -= len(popped)
+        return popped
+
+    def next_due(self) -> Union[float, None]:
+        """
+        The time of the earliest pending item, or None if there are none.
+        """
+        if not self._len:
+            return None
+        candidates = [entry[_WHEN] for entry in self._due if entry[_ITEM] is not _CANCELLED]
+        size = 1 << self.bits
+        for level in range(self.levels):
+            if not self._counts[level]:
+                continue
+            wheel = self._wheels[level]
+            current = (self._tick >> (self.bits * level)) & self._mask
+            # Scan forward from the current bucket, ending with the current bucket itself, which is a lap ahead
+            for offset in range(1, size + 1):
+                bucket = wheel[(current + offset) & self._mask]
+                pending = [entry[_WHEN] for entry in bucket if entry[_ITEM] is not _CANCELLED]
+                if pending:
+                    candidates.append(min(pending))
+                    break
+        overflow = self._overflow
+        # Cancelled entries are dropped lazily, as they reach the top of the heap
+        while overflow and overflow[0][_ITEM] is _CANCELLED:
+            heapq.heappop(overflow)
+        if overflow:
+            candidates.append(overflow[0][_WHEN])
+        return min(candidates) if candidates else None
+
+
+class Scheduler:
+    """
+    Holds future messages locally and sends them through an Address just ahead of their due time.
+
+    Unlike Address.delay(), which relies on the receiver to queue each message until its timetag, messages are
+    kept in a TimerWheel on the event loop clock, so scheduling is O(1) regardless of how many are pending. When
+    batch is True, messages which come due together are sent as a single bundle. When timestamped is True, each
+    bundle carries the due time as its timetag, so the receiver can absorb the lookahead and network jitter.
+    """
+    __slots__ = (
+        'address', 'lookahead', 'batch', 'max_batch', 'timestamped', 'loop', 'wheel', 'sent',
+        '_handle', '_handle_when', '_drained')
+
+    def __init__(
+        self,
+        address: addresses.Address,
+        *,
+        lookahead: float = DEFAULT_LOOKAHEAD,
+        batch: bool = True,
+        max_batch: int = DEFAULT_MAX_BATCH,
+        timestamped: bool = False,
+        resolution: float = DEFAULT_RESOLUTION,
+        loop: Union[asyncio.AbstractEventLoop, None] = None,
+    ):
+        if lookahead < 0:
+            raise ValueError('lookahead must be >= 0, got %r' % lookahead)
+        if max_batch < 1:
+            raise ValueError('max_batch must be >= 1, got %r' % max_batch)
+        self.address = address
+        self.lookahead = lookahead
+        self.batch = batch
+        self.max_batch = max_batch
+        self.timestamped = timestamped
+        self.loop = loop or asyncio.get_event_loop()
+        self.wheel = TimerWheel(resolution, start=self.loop.time())
+        self.sent = 0
+        self._handle = None
+        self._handle_when = None
+        self._drained = None
+
+    def __repr__(self):
+        return 'Scheduler(%r, lookahead=%r)' % (self.address, self.lookahead)
+
+    def __len__(self):
+        return len(self.wheel)
+
+    def time(self) -> float:
+        """
+        The current time on the scheduler's clock, which is the event loop's clock.
+        """
+        return self.loop.time()
+
+    def at(self, when: float, item: Union[messages.Message, messages.Bundle]) -> Entry:
+        """
+        Schedule a message or bundle to be sent at when, in the event loop's time. Returns a handle for cancel().
+        """
+        if isinstance(item, messages.Message) and item.route.path.matches_any:
+            raise ValueError('Message must be sent to a specific path or pattern')
+        entry = self.wheel.push(when, item)
+        self._arm(when)
+        return entry
+
+    def delay(
+        self,
+        delay: Union[int, float, datetime.timedelta],
+        route: types.RouteTypes,
+        *args: types.MessageTypes
+    ) -> Entry:
+        """
+        Schedule a message to be sent after delay, which is seconds or a timedelta.
+        """
+        if isinstance(delay, datetime.timedelta):
+            delay = delay.total_seconds()
+        return self.at(self.loop.time() + delay, messages.Message(route, *args))
+
+    def cancel(self, handle: Entry) -> bool:
+        return self.wheel.cancel(handle)
+
+    def _arm(self, when: float):
+        when -= self.lookahead
+        if self._handle is not None:
+            if self._handle_when <= when:
+                return
+            self._handle.cancel()
+        self._handle_when = when
+        self._handle = self.loop.call_at(when, self._fire)
+
+    def _fire(self):
+        self._handle = None
+        # Some loops (uvloop) round timers to the millisecond and may fire slightly early, so treat the time the
+        # handle was armed for as reached
+        now = max(self.loop.time(), self._handle_when)
+        due = self.wheel.pop_due(now + self.lookahead)
+        if due:
+            self._send(due)
+        when = self.wheel.next_due()
+        if when is not None:
+            self._arm(when)
+        elif self._drained is not None:
+            drained, self._drained = self._drained, None
+            if not drained.done():
+                drained.set_result(None)
+
+    def _send(self, due: List[Tuple[float, Any]]):
+        if not self.batch:
+            for _, item in due:
+                self._send_one(item)
+            return
+        if self.timestamped:
+            groups = [list(group) for _, group in itertools.groupby(due, key=lambda d: d[0])]
+        else:
+            groups = [due]
+        offset = time.time() - self.loop.time()
+        for group in groups:
+            timetag = timetags.TimeTag(group[0][0] + offset) if self.timestamped else None
+            for start in range(0, len(group), self.max_batch):
+                chunk = group[start:start + self.max_batch]
+                if len(chunk) == 1 and timetag is None:
+                    self._send_one(chunk[0][1])
+                else:
+                    self._send_one(messages.Bundle([item for _, item in chunk], timetag))
+
+    def _send_one(self, item: Union[messages.Message, messages.Bundle]):
+        try:
+            if isinstance(item, messages.Message):
+                self.address.message(item)
+            else:
+                self.address.bundle(item)
+        except Exception as exc:
+            logs.logger.exception(exc)
+        else:
+            self.sent += 1
+
+    async def drain(self):
+        """
+        Wait until every scheduled message has been sent.
+        """
+        if not len(self.wheel):
+            return
+        if self._drained is None:
+            self._drained = self.loop.create_future()
+        await asyncio.shield(self._drained)
+
+    def close(self):
+        """
+        Stop sending, discarding any messages which are still scheduled.
+        """
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self.wheel = TimerWheel(self.wheel.resolution, start=self.loop.time())
+        if self._drained is not None and not self._drained.done():
+            self._drained.set_result(None)
+        self._drained = None
+
+
+class Late(NamedTuple):
+    """
+    Published in place of a message's data when it is delivered late and the late policy is LATE_FLAG.
+    """
+    data: Any
+    lateness: float
+
+
+class DeliveryQueue:
+    """
+    Holds the messages of bundles a server receives with a future timetag, and publishes them to their routes
+    when they come due on the event loop clock.
+
+    A server given a DeliveryQueue disables liblo's own queue, whose insertion cost is linear and whose size is
+    unbounded, and unpacks each message on arrival into a TimerWheel instead. When max_pending is set, messages
+    arriving at a full queue are dropped and counted as overflowed. Messages delivered more than tolerance seconds
+    after their timetag, including those which arrive already due, are handled according to late_policy.
+    """
+    __slots__ = (
+        'max_pending', 'late_policy', 'tolerance', 'loop', 'wheel',
+        'delivered', 'late', 'dropped', 'overflowed', 'max_lateness', '_total_lateness', '_handle', '_handle_when')
+
+    def __init__(
+        self,
+        *,
+        max_pending: Union[int, None] = None,
+        late_policy: str = LATE_DELIVER,
+        tolerance: float = DEFAULT_LATE_TOLERANCE,
+        resolution: float = DEFAULT_RESOLUTION,
+        loop: Union[asyncio.AbstractEventLoop, None] = None,
+    ):
+        if max_pending is not None and max_pending < 1:
+            raise ValueError('max_pending must be >= 1, got %r' % max_pending)
+        if late_policy not in (LATE_DELIVER, LATE_DROP, LATE_FLAG):
+            raise ValueError('Invalid late_policy %r' % late_policy)
+        if tolerance < 0:
+            raise ValueError('tolerance must be >= 0, got %r' % tolerance)
+        self.max_pending = max_pending
+        self.late_policy = late_policy
+        self.tolerance = tolerance
+        self.loop = loop or asyncio.get_event_loop()
+        self.wheel = TimerWheel(resolution, start=self.loop.time())
+        self._handle = None
+        self._handle_when = None
+        self.reset_stats()
+
+    def __repr__(self):
+        return 'DeliveryQueue(max_pending=%r, late_policy=%r)' % (self.max_pending, self.late_policy)
+
+    def __len__(self):
+        return len(self.wheel)
+
+    @property
+    def stats(self) -> dict:
+        """
+        Counts of messages, and the lateness of those delivered in seconds.
+        """
+        return {
+            'pending': len(self.wheel),
+            'delivered': self.delivered,
+            'late': self.late,
+            'dropped': self.dropped,
+            'overflowed': self.overflowed,
+            'max_lateness': self.max_lateness,
+            'mean_lateness': self._total_lateness / self.delivered if self.delivered else 0.,
+        }
+
+    def reset_stats(self):
+        self.delivered = 0
+        self.late = 0
+        self.dropped = 0
+        self.overflowed = 0
+        self.max_lateness = 0.
+        self._total_lateness = 0.
+
+    def push(self, when: float, route: routes.Route, data: Any) -> bool:
+        """
+        Publish data to route at when, in the event loop's time. Returns False if it was dropped.
+        """
+        now = self.loop.time()
+        if when <= now:
+            return self._deliver(when, route, data, now)
+        if self.max_pending is not None and len(self.wheel) >= self.max_pending:
+            self.overflowed += 1
+            logs.logger.debug('%r: queue full, dropped message for %r', self, route)
+            return False
+        self.wheel.push(when, (route, data))
+        self._arm(when)
+        return True
+
+    def push_threadsafe(self, when: float, route: routes.Route, data: Any):
+        self.loop.call_soon_threadsafe(self.push, when, route, data)
+
+    def _arm(self, when: float):
+        if self._handle is not None:
+            if self._handle_when <= when:
+                return
+            self._handle.cancel()
+        self._handle_when = when
+        self._handle = self.loop.call_at(when, self._fire)
+
+    def _fire(self):
+        self._handle = None
+        # As with Scheduler, treat the time the handle was armed for as reached
+        now = max(self.loop.time(), self._handle_when)
+        for when, (route, data) in self.wheel.pop_due(now):
+            self._deliver(when, route, data, self.loop.time())
+        when = self.wheel.next_due()
+        if when is not None:
+            self._arm(when)
+
+    def _deliver(self, when: float, route: routes.Route, data: Any, now: float) -> bool:
+        lateness = max(0., now - when)
+        if lateness > self.tolerance:
+            self.late += 1
+            if self.late_policy == LATE_DROP:
+                self.dropped += 1
+                return False
+            elif self.late_policy == LATE_FLAG:
+                data = Late(data, lateness)
+        self.delivered += 1
+        self._total_lateness += lateness
+        if lateness > self.max_lateness:
+            self.max_lateness = lateness
+        try:
+            route.pub_nowait(data)
+        except Exception as exc:
+            logs.logger.exception(exc)
+        return True
+
+    def close(self):
+        """
+        Discard every pending message.
+        """
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self.wheel = TimerWheel(self.wheel.resolution, start=self.loop.time())
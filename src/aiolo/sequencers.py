@@ -0,0 +1,193 @@
+import asyncio
+import time
+from typing import Iterable, Sequence, Union
+
+from . import addresses, logs, messages, timetags
+
+
+__all__ = ['Sequencer', 'DEFAULT_BPM', 'DEFAULT_STEPS_PER_BEAT', 'DEFAULT_SEQUENCER_LOOKAHEAD']
+
+
+DEFAULT_BPM = 120.
+
+# 16th notes
+DEFAULT_STEPS_PER_BEAT = 4
+
+# Seconds ahead of their play time that steps are sent
+DEFAULT_SEQUENCER_LOOKAHEAD = 0.1
+
+
+Step = Union[None, messages.Message, messages.Bundle, Iterable[Union[messages.Message, messages.Bundle]]]
+
+
+class Sequencer:
+    """
+    Streams a looping pattern of steps to an Address, as bundles timetagged with the time each step should play.
+
+    Rather than sending a whole sequence up front, the sequencer wakes every interval seconds and sends the steps
+    which fall within the next lookahead seconds, so that the receiver only ever queues a short window. Each step
+    is None (a rest), a Message or Bundle, or an iterable of them. Changes to pattern and bpm take effect from the
+    next step which has not yet been sent; steps already sent are left as they are.
+    """
+    __slots__ = (
+        'address', 'steps_per_beat', 'lookahead', 'interval', 'repeat', 'loop',
+        'position', 'steps', 'late', 'min_slack', 'max_jitter', '_jitter_total', '_ticks',
+        '_pattern', '_bpm', '_next_time', '_tick_when', '_handle', '_done')
+
+    def __init__(
+        self,
+        address: addresses.Address,
+        pattern: Sequence[Step] = (),
+        *,
+        bpm: float = DEFAULT_BPM,
+        steps_per_beat: int = DEFAULT_STEPS_PER_BEAT,
+        lookahead: float = DEFAULT_SEQUENCER_LOOKAHEAD,
+        interval: Union[float, None] = None,
+        repeat: Union[int, None] = None,
+        loop: Union[asyncio.AbstractEventLoop, None] = None,
+    ):
+        if lookahead <= 0:
+            raise ValueError('lookahead must be > 0, got %r' % lookahead)
+        self.address = address
+        self.pattern = pattern
+        self.bpm = bpm
+        self.steps_per_beat = steps_per_beat
+        self.lookahead = lookahead
+        self.interval = lookahead / 4 if interval is None else interval
+        if not (0 < self.interval <= lookahead):
+            raise ValueError('interval must be > 0 and <= lookahead, got %r' % interval)
+        self.repeat = repeat
+        self.loop = loop or asyncio.get_event_loop()
+        self.position = 0
+        self._next_time = None
+        self._tick_when = None
+        self._handle = None
+        self._done = None
+        self.reset_stats()
+
+    def __repr__(self):
+        return 'Sequencer(%r, bpm=%r, lookahead=%r)' % (self.address, self.bpm, self.lookahead)
+
+    @property
+    def pattern(self) -> Sequence[Step]:
+        return self._pattern
+
+    @pattern.setter
+    def pattern(self, pattern: Sequence[Step]):
+        self._pattern = tuple(pattern)
+
+    @property
+    def bpm(self) -> float:
+        return self._bpm
+
+    @bpm.setter
+    def bpm(self, bpm: float):
+        if bpm <= 0:
+            raise ValueError('bpm must be > 0, got %r' % bpm)
+        self._bpm = bpm
+
+    @property
+    def step_duration(self) -> float:
+        return 60. / self._bpm / self.steps_per_beat
+
+    @property
+    def running(self) -> bool:
+        return self._handle is not None
+
+    @property
+    def stats(self) -> dict:
+        """
+        Steps sent, how many were sent after their play time, the least time ahead that a step was sent, and the
+        mean and max lateness of the sequencer's wakeups.
+        """
+        return {
+            'steps': self.steps,
+            'late': self.late,
+            'min_slack': self.min_slack,
+            'mean_jitter': self._jitter_total / self._ticks if self._ticks else 0.,
+            'max_jitter': self.max_jitter,
+        }
+
+    def reset_stats(self):
+        self.steps = 0
+        self.late = 0
+        self.min_slack = None
+        self.max_jitter = 0.
+        self._jitter_total = 0.
+        self._ticks = 0
+
+    def start(self, at: Union[float, None] = None):
+        """
+        Start playing from the current position. at is the play time of the first step, in the event loop's time,
+        and defaults to lookahead seconds from now.
+        """
+        if self.running:
+            raise RuntimeError('%r is already running' % self)
+        now = self.loop.time()
+        self._next_time = now + self.lookahead if at is None else at
+        if self._done is None or self._done.done():
+            self._done = self.loop.create_future()
+        self._tick_when = now
+        self._handle = self.loop.call_soon(self._tick)
+
+    def stop(self):
+        """
+        Stop sending steps. Steps which have already been sent will still play.
+        """
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._done is not None and not self._done.done():
+            self._done.set_result(None)
+
+    async def wait(self):
+        """
+        Wait until the sequencer is stopped or has sent every repeat of the pattern.
+        """
+        if self._done is not None:
+            await asyncio.shield(self._done)
+
+    @property
+    def finished(self) -> bool:
+        return self.repeat is not None and self.position >= self.repeat * len(self._pattern)
+
+    def _tick(self):
+        now = self.loop.time()
+        jitter = max(0., now - self._tick_when)
+        self._jitter_total += jitter
+        self._ticks += 1
+        if jitter > self.max_jitter:
+            self.max_jitter = jitter
+
+        horizon = now + self.lookahead
+        offset = time.time() - now
+        while self._next_time < horizon and not self.finished:
+            self._send_step(self._next_time, now, offset)
+            self._next_time += self.step_duration
+
+        if self.finished:
+            self._handle = None
+            self.stop()
+            return
+        self._tick_when = now + self.interval
+        self._handle = self.loop.call_at(self._tick_when, self._tick)
+
+    def _send_step(self, when: float, now: float, offset: float):
+        pattern = self._pattern
+        step = pattern[self.position % len(pattern)] if pattern else None
+        self.position += 1
+        if step is None:
+            return
+        slack = when - now
+        if slack < 0:
+            self.late += 1
+        if self.min_slack is None or slack < self.min_slack:
+            self.min_slack = slack
+        if isinstance(step, (messages.Message, messages.Bundle)):
+            step = [step]
+        try:
+            self.address.bundle(messages.Bundle(step, timetags.TimeTag(when + offset)))
+        except Exception as exc:
+            logs.logger.exception(exc)
+        else:
+            self.steps += 1
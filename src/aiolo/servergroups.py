@@ -0,0 +1,363 @@
+import asyncio
+import inspect
+import multiprocessing
+import os
+import socket
+import time
+from typing import Any, Callable, Dict, List, Sequence, Union
+
+from . import aioservers, exceptions, logs, packets, protos, routes, types
+
+
+__all__ = ['ServerGroup', 'DEFAULT_CHECK_INTERVAL', 'DEFAULT_MAX_PACKET_SIZE', 'DEFAULT_MAX_BATCH']
+
+
+# Seconds between checks for workers which have died
+DEFAULT_CHECK_INTERVAL = 1.
+
+# Largest datagram a worker reads, the maximum UDP payload
+DEFAULT_MAX_PACKET_SIZE = 65507
+
+# Datagrams a worker reads before letting its handlers run
+DEFAULT_MAX_BATCH = 64
+
+# Seconds a restarted worker has to start receiving before it is terminated
+RESTART_TIMEOUT = 5.
+
+
+Handler = Callable[[Any], Any]
+
+
+class ServerGroup:
+    """
+    Receives on one UDP or TCP port from several worker processes, so that receiving scales across cores.
+
+    Each worker binds its own socket to the port with SO_REUSEPORT, and the kernel balances datagrams (or, for TCP,
+    connections) between them; packets from a single sender stay on one worker. Routes and their handlers are
+    declared once, before start(), and are inherited by the workers, which run each handler with the data of each
+    matching message, in the worker process. Handlers may be plain functions or coroutine functions. Workers which
+    exit are restarted when restart is True, without blocking the event loop: each check starts the new worker, and
+    later checks terminate it if it is not receiving within RESTART_TIMEOUT seconds. UDP workers read at most
+    max_batch datagrams before yielding to their handlers. Requires a platform with fork() and SO_REUSEPORT.
+    """
+    __slots__ = (
+        'host', 'port', 'proto', 'workers', 'restart', 'check_interval', 'max_packet_size', 'max_batch', 'loop',
+        'restarts', '_handlers', '_context', '_processes', '_starting', '_packets', '_bytes', '_errors', '_handle',
+        '_probe')
+
+    def __init__(
+        self,
+        port: Union[str, int, None] = None,
+        *,
+        host: str = '',
+        proto: Union[str, int, None] = None,
+        workers: Union[int, None] = None,
+        restart: bool = True,
+        check_interval: float = DEFAULT_CHECK_INTERVAL,
+        max_packet_size: int = DEFAULT_MAX_PACKET_SIZE,
+        max_batch: int = DEFAULT_MAX_BATCH,
+        loop: Union[asyncio.AbstractEventLoop, None] = None,
+    ):
+        if not hasattr(socket, 'SO_REUSEPORT') or not hasattr(os, 'fork'):
+            raise NotImplementedError('ServerGroup requires fork() and SO_REUSEPORT')
+        if proto is not None:
+            proto = protos.get_proto_id(proto)
+        if proto in (None, protos.PROTO_DEFAULT):
+            proto = protos.PROTO_UDP
+        if proto not in (protos.PROTO_UDP, protos.PROTO_TCP):
+            raise ValueError('ServerGroup supports PROTO_UDP and PROTO_TCP, got %r' % proto)
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers < 1:
+            raise ValueError('workers must be >= 1, got %r' % workers)
+        if max_batch < 1:
+            raise ValueError('max_batch must be >= 1, got %r' % max_batch)
+        self.host = host
+        self.port = int(port) if port is not None else 0
+        self.proto = proto
+        self.workers = workers
+        self.restart = restart
+        self.check_interval = check_interval
+        self.max_packet_size = max_packet_size
+        self.max_batch = max_batch
+        self.loop = loop or asyncio.get_event_loop()
+        self.restarts = 0
+        self._handlers = []
+        self._context = multiprocessing.get_context('fork')
+        # Counters live in shared memory, and each worker only writes its own slot
+        self._packets = self._context.Array('Q', workers, lock=False)
+        self._bytes = self._context.Array('Q', workers, lock=False)
+        self._errors = self._context.Array('Q', workers, lock=False)
+        self._processes = [None] * workers
+        # Ready events and deadlines of restarted workers which have not yet started receiving, by index
+        self._starting = {}
+        self._handle = None
+        self._probe = None
+
+    def __repr__(self):
+        return 'ServerGroup(port=%r, proto=%r, workers=%r)' % (self.port, protos.PROTOS[self.proto], self.workers)
+
+    @property
+    def running(self) -> bool:
+        return any(process is not None for process in self._processes)
+
+    @property
+    def alive(self) -> int:
+        return sum(1 for process in self._processes if process is not None and process.is_alive())
+
+    @property
+    def pids(self) -> List[Union[int, None]]:
+        return [None if process is None else process.pid for process in self._processes]
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """
+        Packets and bytes dispatched and packets which could not be dispatched, summed over every worker (including
+        workers since restarted), and per worker.
+        """
+        return {
+            'workers': self.workers,
+            'alive': self.alive,
+            'restarts': self.restarts,
+            'packets': sum(self._packets),
+            'bytes': sum(self._bytes),
+            'errors': sum(self._errors),
+            'per_worker': list(self._packets),
+        }
+
+    def route(
+        self,
+        route: types.PathTypes,
+        typespec: types.TypeSpecTypes = '',
+        handler: Union[Handler, None] = None,
+        *,
+        as_array: bool = False,
+        fields: Union[Sequence[str], str, None] = None,
+    ) -> Union[Handler, Callable[[Handler], Handler]]:
+        """
+        Declare a route and the handler which each worker runs for its messages. Without handler, returns a
+        decorator.
+        """
+        if self.running:
+            raise exceptions.RouteError('%r already running, cannot add routes' % self)
+        # Validate in the parent, so mistakes raise here rather than in every worker
+        routes.Route(route, typespec, as_array=as_array, fields=fields)
+
+        def decorator(func: Handler) -> Handler:
+            self._handlers.append((route, typespec, as_array, fields, func))
+            return func
+
+        if handler is None:
+            return decorator
+        return decorator(handler)
+
+    def start(self, timeout: float = 5.):
+        """
+        Fork the workers, and wait until each is receiving.
+        """
+        if self.running:
+            raise exceptions.StartError('%r already running, cannot start again' % self)
+        if not self._handlers:
+            raise exceptions.StartError('%r has no routes' % self)
+        # Hold the port while the workers bind it, so that a port of 0 picks one port for all of them
+        self._probe = self._bind()
+        try:
+            self.port = self._probe.getsockname()[1]
+            deadline = time.monotonic() + timeout
+            for index in range(self.workers):
+                self._spawn(index, deadline)
+                self._wait_started(index)
+        except BaseException:
+            self.stop()
+            raise
+        finally:
+            self._probe.close()
+            self._probe = None
+        self._handle = self.loop.call_later(self.check_interval, self._check)
+        logs.logger.debug('%r: started', self)
+
+    def stop(self, timeout: float = 3.):
+        """
+        Terminate the workers, killing any which have not exited after timeout seconds.
+        """
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        processes = [process for process in self._processes if process is not None]
+        self._processes = [None] * self.workers
+        self._starting.clear()
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in processes:
+            process.join(max(0., deadline - time.monotonic()))
+            if process.is_alive():
+                process.kill()
+                process.join()
+
+    def check(self) -> int:
+        """
+        Restart any workers which have exited, returning how many were restarted. Restarted workers are not waited
+        for; any which are not receiving by RESTART_TIMEOUT are terminated, and restarted by a later check.
+        """
+        restarted = 0
+        for index, process in enumerate(self._processes):
+            if process is None:
+                continue
+            if process.is_alive():
+                self._check_started(index, process)
+                continue
+            logs.logger.warning('%r: worker %s exited with code %s', self, index, process.exitcode)
+            self._processes[index] = None
+            self._starting.pop(index, None)
+            if self.restart:
+                self._spawn(index, time.monotonic() + RESTART_TIMEOUT)
+                self.restarts += 1
+                restarted += 1
+        return restarted
+
+    def _check_started(self, index: int, process: Any):
+        if index not in self._starting:
+            return
+        ready, deadline = self._starting[index]
+        if ready.is_set():
+            del self._starting[index]
+        elif time.monotonic() > deadline:
+            logs.logger.warning('%r: worker %s did not start in time, terminating', self, index)
+            del self._starting[index]
+            process.terminate()
+
+    def _check(self):
+        try:
+            self.check()
+        except Exception as exc:
+            logs.logger.exception(exc)
+        self._handle = self.loop.call_later(self.check_interval, self._check)
+
+    def _bind(self) -> socket.socket:
+        family = socket.AF_INET6 if ':' in self.host else socket.AF_INET
+        kind = socket.SOCK_DGRAM if self.proto == protos.PROTO_UDP else socket.SOCK_STREAM
+        sock = socket.socket(family, kind)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind((self.host, self.port))
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    def _spawn(self, index: int, deadline: float):
+        ready = self._context.Event()
+        process = self._context.Process(
+            target=self._run_worker, args=(index, ready), name='%r worker %s' % (self, index), daemon=True)
+        process.start()
+        self._processes[index] = process
+        self._starting[index] = ready, deadline
+
+    def _wait_started(self, index: int):
+        process = self._processes[index]
+        ready, deadline = self._starting.pop(index)
+        while not ready.wait(0.01):
+            if not process.is_alive():
+                raise exceptions.StartError(
+                    '%r: worker %s exited with code %s while starting' % (self, index, process.exitcode))
+            if time.monotonic() > deadline:
+                raise exceptions.StartError('%r: timed out waiting for worker %s to start' % (self, index))
+
+    def _run_worker(self, index: int, ready: Any):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self._serve(index, ready))
+        finally:
+            loop.close()
+
+    async def _serve(self, index: int, ready: Any):
+        loop = asyncio.get_event_loop()
+        # The workers' server only dispatches, it receives on its own socket nothing but what is sent there
+        server = aioservers.AioServer()
+        tasks = []
+        for route, typespec, as_array, fields, handler in self._handlers:
+            sub = server.route(routes.Route(route, typespec, as_array=as_array, fields=fields)).sub()
+            tasks.append(loop.create_task(self._handle_sub(sub, handler)))
+        server.start()
+        sock = self._bind()
+        sock.setblocking(False)
+        if self._probe is not None:
+            # A forked copy of the parent's socket would otherwise be balanced a share of packets, unread
+            self._probe.close()
+        if self.proto == protos.PROTO_UDP:
+            loop.add_reader(sock, self._on_datagrams, server, sock, index)
+        else:
+            sock.listen()
+            await asyncio.start_server(
+                lambda reader, writer: self._on_connection(server, reader, writer, index), sock=sock)
+        ready.set()
+        await asyncio.gather(*tasks)
+
+    async def _handle_sub(self, sub: Any, handler: Handler):
+        async for data in sub:
+            try:
+                result = handler(data)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as exc:
+                logs.logger.exception(exc)
+
+    def _on_datagrams(self, server: aioservers.AioServer, sock: socket.socket, index: int):
+        count = nbytes = errors = 0
+        # Bounded, so that a busy socket does not starve the handlers; the loop calls again while it is readable
+        for _ in range(self.max_batch):
+            try:
+                data = sock.recv(self.max_packet_size)
+            except (BlockingIOError, InterruptedError):
+                break
+            try:
+                server.dispatch(data)
+            except ValueError as exc:
+                logs.logger.error(exc)
+                errors += 1
+            else:
+                count += 1
+                nbytes += len(data)
+        self._count(index, count, nbytes, errors)
+
+    async def _on_connection(
+        self,
+        server: aioservers.AioServer,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        index: int,
+    ):
+        # Clients may frame packets by length, as liblo does, or by SLIP
+        decoder = packets.StreamDecoder()
+        try:
+            while True:
+                chunk = await reader.read(packets.DEFAULT_READ_SIZE)
+                if not chunk:
+                    break
+                decoder.write(chunk)
+                count = nbytes = errors = 0
+                for data in decoder:
+                    try:
+                        server.dispatch(data)
+                    except ValueError as exc:
+                        logs.logger.error(exc)
+                        errors += 1
+                    else:
+                        count += 1
+                        nbytes += len(data)
+                self._count(index, count, nbytes, errors)
+        except ValueError as exc:
+            logs.logger.error('%r: %s, closing', self, exc)
+            self._count(index, 0, 0, 1)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def _count(self, index: int, packets: int, nbytes: int, errors: int):
+        self._packets[index] += packets
+        self._bytes[index] += nbytes
+        self._errors[index] += errors
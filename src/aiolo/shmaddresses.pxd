@@ -0,0 +1,10 @@
+# cython: language_level=3
+
+from . cimport messages, shmrings
+
+
+cdef class ShmAddress:
+    cdef readonly shmrings.ShmRing ring
+
+    cdef int _message(self, messages.Message message) except -1
+    cdef int _bundle(self, messages.Bundle bundle) except -1
@@ -0,0 +1,87 @@
+# cython: language_level=3
+
+from typing import Union
+
+from libc.string cimport memcpy
+
+from . import logs, types
+from . cimport lo, messages, paths, shmrings
+
+
+__all__ = ['ShmAddress']
+
+
+cdef class ShmAddress:
+    """
+    Sends to a ShmServer on the same host, by serializing each packet once, straight into its ShmRing. Sends return
+    the number of bytes written, or 0 when the ring is full, which is counted by ring.dropped.
+    """
+
+    def __init__(self, *, url: str, size: int = shmrings._DEFAULT_SHM_SIZE):
+        self.ring = shmrings.ShmRing(shmrings.shm_name_from_url(url), size)
+
+    def __repr__(self):
+        return '%s(url=%r)' % (self.__class__.__name__, self.url)
+
+    @property
+    def url(self) -> str:
+        return self.ring.url
+
+    def close(self):
+        self.ring.close()
+
+    def send(self, route: Union[types.RouteTypes], *data: types.MessageTypes) -> int:
+        message = messages.Message(route, *data)
+        return self.message(message)
+
+    def message(self, message: messages.Message) -> int:
+        if message.route.path.matches_any:
+            raise ValueError('Message must be sent to a specific path or pattern')
+        return self._message(message)
+
+    def bundle(self, bundle: types.BundleTypes, timetag: types.TimeTagTypes = None) -> int:
+        if not isinstance(bundle, messages.Bundle):
+            bundle = messages.Bundle(bundle, timetag)
+        elif timetag is not None:
+            raise ValueError('Cannot provide Bundle instance and timetag together')
+        return self._bundle(bundle)
+
+    cdef int _message(self, messages.Message message) except -1:
+        path = (<paths.Path>message.route.path).as_bytes
+        raw = message._raw
+        cdef:
+            char * p = path
+            lo.lo_message lo_message = message.lo_message
+            size_t length = lo.lo_message_length(lo_message, p)
+            char * to
+
+        IF DEBUG: logs.logger.debug('%r: sending %r', self, message)
+        self.ring._check()
+        with nogil:
+            to = self.ring.reserve(length)
+        if to is NULL:
+            return 0
+        if raw is not None:
+            memcpy(to, <char*>raw, length)
+        else:
+            lo.lo_message_serialise(lo_message, p, to, &length)
+        self.ring.commit(length)
+        IF DEBUG: logs.logger.debug('%r: sent %s bytes', self, length)
+        return length
+
+    cdef int _bundle(self, messages.Bundle bundle) except -1:
+        cdef:
+            lo.lo_bundle lo_bundle = bundle.lo_bundle
+            size_t length = lo.lo_bundle_length(lo_bundle)
+            char * to
+
+        IF DEBUG: logs.logger.debug('%r: sending %r', self, bundle)
+        self.ring._check()
+        with nogil:
+            to = self.ring.reserve(length)
+        if to is NULL:
+            return 0
+        lo.lo_bundle_serialise(lo_bundle, to, &length)
+        self.ring.commit(length)
+        IF DEBUG: logs.logger.debug('%r: sent %s bytes', self, length)
+        return length
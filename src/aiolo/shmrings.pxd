@@ -0,0 +1,38 @@
+# cython: language_level=3
+
+from libc.stdint cimport uint64_t
+
+from . cimport rings
+
+
+# Precedes the ring's own header in the mapping, padded to a cache line
+ctypedef struct shm_header:
+    uint64_t magic
+    # The pid of the producer writing, since rings only support one producer at a time
+    uint64_t lock
+    # The pid of the consumer, since rings only support one
+    uint64_t consumer
+    char _pad[40]
+
+
+cdef class ShmRing:
+    cdef readonly str name
+    cdef readonly str path
+    cdef rings.ring_t ring
+
+    # private
+    cdef shm_header * header
+    cdef void * memory
+    cdef size_t size
+    cdef int wakeup_fd
+    cdef bint listening
+
+    cdef char * reserve(self, size_t size) nogil
+    cdef void commit(self, size_t size) nogil
+    cdef void wake(self) nogil
+    cdef int clear_wakeups(self) except -1
+
+
+cdef size_t _DEFAULT_SHM_SIZE
+
+cdef str shm_name_from_url(str url)
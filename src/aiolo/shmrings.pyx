@@ -0,0 +1,351 @@
+# cython: language_level=3
+
+import os
+import tempfile
+import time
+import urllib.parse
+from typing import Any, Union
+
+from libc.errno cimport errno, EPIPE
+from libc.stdint cimport uint32_t, uint64_t
+from libc.string cimport memcpy
+from posix.mman cimport mmap, munmap, MAP_FAILED, MAP_SHARED, PROT_READ, PROT_WRITE
+from posix.unistd cimport close, write
+
+from . cimport messages, rings
+
+
+__all__ = ['ShmRing', 'SHM_SCHEME', 'DEFAULT_SHM_SIZE']
+
+
+SHM_SCHEME = 'osc.shm'
+
+# Bytes of packet data a shared-memory ring holds by default
+cdef size_t _DEFAULT_SHM_SIZE = 1 << 22
+DEFAULT_SHM_SIZE = _DEFAULT_SHM_SIZE
+
+# Ring files live on tmpfs where there is one, so they are never written to disk
+SHM_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+# 'osc.shm1', set last by the process which creates a ring
+cdef uint64_t MAGIC = 0x316d68732e63736f
+
+# Seconds to wait for another process to finish creating a ring
+cdef double OPEN_TIMEOUT = 1.
+
+
+cdef extern from *:
+    """
+    #include <errno.h>
+    #include <sched.h>
+    #include <signal.h>
+    #include <unistd.h>
+    /* The lock holds its owner's pid, so that a lock left by a producer which died holding it can be taken over */
+    static inline void aiolo_shm_lock(uint64_t *p) {
+        uint64_t pid = (uint64_t)getpid();
+        uint64_t owner = 0;
+        unsigned int spins = 0;
+        while (!__atomic_compare_exchange_n(p, &owner, pid, 0, __ATOMIC_ACQUIRE, __ATOMIC_RELAXED)) {
+            if (++spins % 1024 == 0 && kill((pid_t)owner, 0) < 0 && errno == ESRCH) {
+                if (__atomic_compare_exchange_n(p, &owner, pid, 0, __ATOMIC_ACQUIRE, __ATOMIC_RELAXED)) return;
+            } else {
+                sched_yield();
+            }
+            owner = 0;
+        }
+    }
+    static inline void aiolo_shm_unlock(uint64_t *p) { __atomic_store_n(p, 0, __ATOMIC_RELEASE); }
+    /* Claim a slot for this process unless a live process holds it, returning 0 or the live owner's pid */
+    static inline uint64_t aiolo_shm_claim(uint64_t *p) {
+        uint64_t pid = (uint64_t)getpid();
+        uint64_t owner = 0;
+        while (!__atomic_compare_exchange_n(p, &owner, pid, 0, __ATOMIC_ACQ_REL, __ATOMIC_ACQUIRE)) {
+            if (kill((pid_t)owner, 0) == 0 || errno != ESRCH) return owner;
+        }
+        return 0;
+    }
+    /* Release a slot if this process still holds it */
+    static inline void aiolo_shm_release(uint64_t *p) {
+        uint64_t pid = (uint64_t)getpid();
+        __atomic_compare_exchange_n(p, &pid, 0, 0, __ATOMIC_ACQ_REL, __ATOMIC_RELAXED);
+    }
+    static inline uint64_t aiolo_shm_load(uint64_t *p) { return __atomic_load_n(p, __ATOMIC_ACQUIRE); }
+    static inline void aiolo_shm_store(uint64_t *p, uint64_t v) { __atomic_store_n(p, v, __ATOMIC_RELEASE); }
+    """
+    void shm_lock "aiolo_shm_lock"(uint64_t * p) nogil
+    void shm_unlock "aiolo_shm_unlock"(uint64_t * p) nogil
+    uint64_t shm_claim "aiolo_shm_claim"(uint64_t * p) nogil
+    void shm_release "aiolo_shm_release"(uint64_t * p) nogil
+    uint64_t shm_load "aiolo_shm_load"(uint64_t * p) nogil
+    void shm_store "aiolo_shm_store"(uint64_t * p, uint64_t v) nogil
+
+
+cdef inline size_t data_offset():
+    # The ring's data starts on a cache line after both headers
+    return (sizeof(shm_header) + sizeof(rings.ring_header) + 63) & ~(<size_t>63)
+
+
+cdef str shm_name_from_url(str url):
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme != SHM_SCHEME:
+        raise ValueError('Invalid shm url %r, expected %s://name' % (url, SHM_SCHEME))
+    return parts.netloc or parts.path.lstrip('/')
+
+
+cdef class ShmRing:
+    """
+    A ring of packets in shared memory, which processes on the same host open by name. Any number of processes may
+    push, one at a time under a spinlock in the ring, and a single process pops, without a lock. The ring is created
+    by whichever process opens it first, and persists until unlink().
+
+    The spinlock records the pid of the producer holding it, and is taken over if that process has died, since a
+    reservation is only published by its commit. Producers must therefore share a pid namespace.
+
+    The consumer calls listen(), which claims the ring for its process unless another live process has, after which
+    pushes which find the ring idle write a byte to a FIFO beside it, whose fileno() can be polled.
+    """
+
+    def __cinit__(self, name: str, size: int = DEFAULT_SHM_SIZE):
+        self.memory = NULL
+        self.wakeup_fd = -1
+        if not name or '/' in name or name.startswith('.'):
+            raise ValueError('Invalid shm name %r' % name)
+        if size < 1:
+            raise ValueError('size must be >= 1, got %r' % size)
+        self.name = name
+        self.path = os.path.join(SHM_DIR, 'aiolo.%s' % name)
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            fd = os.open(self.path, os.O_RDWR)
+            try:
+                self._attach(fd)
+            finally:
+                os.close(fd)
+        else:
+            try:
+                self._create(fd, size)
+            except BaseException:
+                os.unlink(self.path)
+                raise
+            finally:
+                os.close(fd)
+
+    def __init__(self, name: str, size: int = DEFAULT_SHM_SIZE):
+        pass
+
+    def __dealloc__(self):
+        if self.wakeup_fd >= 0:
+            close(self.wakeup_fd)
+            self.wakeup_fd = -1
+        if self.memory is not NULL:
+            if self.listening:
+                shm_release(&self.header.consumer)
+            munmap(self.memory, self.size)
+            self.memory = NULL
+
+    def __repr__(self):
+        return 'ShmRing(%r)' % self.name
+
+    def __len__(self):
+        """
+        Bytes in use, including record headers and padding.
+        """
+        self._check()
+        return rings.ring_used(&self.ring)
+
+    @property
+    def url(self) -> str:
+        return '%s://%s' % (SHM_SCHEME, self.name)
+
+    @property
+    def capacity(self) -> int:
+        self._check()
+        return self.ring.header.capacity
+
+    @property
+    def dropped(self) -> int:
+        """
+        Packets which were not pushed because the ring was full, by any process.
+        """
+        self._check()
+        return self.ring.header.dropped
+
+    def _check(self):
+        if self.memory is NULL:
+            raise ValueError('%r is closed' % self)
+
+    def _map(self, fd: int, size: int):
+        cdef void * memory = mmap(NULL, size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0)
+        if memory == MAP_FAILED:
+            raise OSError(errno, os.strerror(errno))
+        self.memory = memory
+        self.size = size
+        self.header = <shm_header*>memory
+        self.ring.header = <rings.ring_header*>(<char*>memory + sizeof(shm_header))
+        self.ring.data = <char*>memory + data_offset()
+
+    def _create(self, fd: int, size: int):
+        cdef uint64_t capacity = 64
+        while capacity < <uint64_t>size:
+            capacity <<= 1
+        # A new file reads as zeroes, so the ring starts empty and unlocked
+        os.ftruncate(fd, data_offset() + capacity)
+        self._map(fd, data_offset() + capacity)
+        self.ring.header.capacity = capacity
+        self.ring.mask = capacity - 1
+        shm_store(&self.header.magic, MAGIC)
+
+    def _attach(self, fd: int):
+        deadline = time.monotonic() + OPEN_TIMEOUT
+        while True:
+            size = os.fstat(fd).st_size
+            if size > data_offset():
+                self._map(fd, size)
+                if shm_load(&self.header.magic) == MAGIC:
+                    break
+                munmap(self.memory, self.size)
+                self.memory = NULL
+            if time.monotonic() > deadline:
+                raise ValueError('%s is not a shm ring' % self.path)
+            time.sleep(0.001)
+        if data_offset() + self.ring.header.capacity != self.size:
+            self.close()
+            raise ValueError('%s is not a shm ring of %s bytes' % (self.path, size))
+        self.ring.mask = self.ring.header.capacity - 1
+
+    def listen(self):
+        """
+        Become the ring's consumer, creating the FIFO which wakes it. Raises ValueError if another live process, or
+        another ShmRing in this one, is the consumer.
+        """
+        cdef uint64_t owner
+        self._check()
+        if self.listening:
+            return
+        owner = shm_claim(&self.header.consumer)
+        if owner:
+            raise ValueError('%r already has a consumer, pid %s' % (self, owner))
+        try:
+            self._open_fifo()
+        except BaseException:
+            shm_release(&self.header.consumer)
+            raise
+        self.listening = True
+        self.clear_wakeups()
+
+    def _open_fifo(self):
+        wakeup_path = self.path + '.wake'
+        try:
+            os.mkfifo(wakeup_path, 0o600)
+        except FileExistsError:
+            pass
+        if self.wakeup_fd >= 0:
+            os.close(self.wakeup_fd)
+        # Opened for writing too, so that it does not read as closed whenever no producer has it open
+        self.wakeup_fd = os.open(wakeup_path, os.O_RDWR | os.O_NONBLOCK)
+
+    def fileno(self) -> int:
+        if not self.listening:
+            raise ValueError('%r is not listening' % self)
+        return self.wakeup_fd
+
+    def push(self, data: Any) -> bool:
+        """
+        Push a packet, returning False if the ring is full.
+        """
+        cdef:
+            const unsigned char[::1] view = messages.as_bytes_view(data)
+            size_t size = len(view)
+            char * to
+        self._check()
+        with nogil:
+            to = self.reserve(size)
+        if to is NULL:
+            return False
+        if size:
+            memcpy(to, &view[0], size)
+        self.commit(size)
+        return True
+
+    def pop(self) -> Union[bytes, None]:
+        """
+        Remove and return the oldest packet, or None if the ring is empty. Only the consumer may pop.
+        """
+        cdef:
+            size_t size
+            const char * data
+        self._check()
+        data = rings.ring_peek(&self.ring, &size)
+        if data is NULL:
+            return None
+        packet = data[:size]
+        rings.ring_consume(&self.ring)
+        return packet
+
+    def close(self):
+        if self.wakeup_fd >= 0:
+            os.close(self.wakeup_fd)
+            self.wakeup_fd = -1
+        if self.memory is not NULL:
+            if self.listening:
+                shm_release(&self.header.consumer)
+            munmap(self.memory, self.size)
+            self.memory = NULL
+        self.listening = False
+
+    def unlink(self):
+        """
+        Remove the ring's name, so that the next process to open it creates a new ring.
+        """
+        for path in (self.path, self.path + '.wake'):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def _open_wakeup(self):
+        try:
+            self.wakeup_fd = os.open(self.path + '.wake', os.O_WRONLY | os.O_NONBLOCK)
+        except OSError:
+            # No consumer is listening, it will find the packets when it does
+            pass
+
+    cdef char * reserve(self, size_t size) nogil:
+        """
+        Lock the ring and reserve space for a packet, returning NULL, unlocked, if it is full.
+        """
+        cdef char * to
+        shm_lock(&self.header.lock)
+        to = rings.ring_reserve(&self.ring, size)
+        if to is NULL:
+            shm_unlock(&self.header.lock)
+        return to
+
+    cdef void commit(self, size_t size) nogil:
+        rings.ring_commit(&self.ring, size)
+        shm_unlock(&self.header.lock)
+        if rings.ring_set_pending(&self.ring):
+            self.wake()
+
+    cdef void wake(self) nogil:
+        cdef char byte = 0
+        if self.wakeup_fd < 0:
+            with gil:
+                self._open_wakeup()
+            if self.wakeup_fd < 0:
+                return
+        if write(self.wakeup_fd, &byte, 1) < 0 and errno == EPIPE:
+            # The consumer has gone, reopen when it is back
+            close(self.wakeup_fd)
+            self.wakeup_fd = -1
+
+    cdef int clear_wakeups(self) except -1:
+        try:
+            while os.read(self.wakeup_fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        # Clear before draining, so that packets pushed during the drain wake the consumer again
+        rings.ring_clear_pending(&self.ring)
+        return 0
@@ -0,0 +1,17 @@
+# cython: language_level=3
+
+from . cimport abstractservers, shmrings
+
+
+cdef class ShmServer(abstractservers.AbstractServer):
+    cdef readonly shmrings.ShmRing ring
+
+    # private
+    cdef size_t ring_size
+    cdef bint drain_on_loop
+
+    cdef int lo_server_start(self) except -1
+    cdef int lo_server_stop(self) except -1
+    cdef int schedule_pending(self) except -1
+    cdef int drain(self, bint on_loop) except -1
+    cdef int socket_fd(self)
@@ -0,0 +1,179 @@
+# cython: language_level=3
+
+import asyncio
+from typing import Any, Dict, Union
+
+from . import exceptions, logs, protos
+from . cimport lo, rings, shmrings
+
+from .abstractservers cimport on_error, pop_server_start_error, AbstractServer
+
+
+__all__ = ['ShmServer']
+
+
+cdef class ShmServer(AbstractServer):
+    """
+    A server for processes on the same host, which receives packets from a ShmRing named by its url, such as
+    osc.shm://name, rather than from a socket. Packets are handed to liblo straight from shared memory, with no
+    intermediate read buffer; liblo still deserializes each message into its own copy. Producers send with a
+    ShmAddress for the same url. Only one server, in any process, may run for a url at a time; start() raises
+    StartError while another is running.
+
+    Packets are drained on the event loop, woken once per batch, or when drain_on_loop is False, by calls to
+    drain_ring() from a consumer thread, each of which also delivers any queued bundles which have come due.
+    """
+
+    def __cinit__(
+        self,
+        *,
+        url: Union[str, None] = None,
+        size: int = shmrings._DEFAULT_SHM_SIZE,
+        drain_on_loop: bool = True,
+        **kwargs
+    ):
+        if url is None:
+            raise ValueError('ShmServer requires an osc.shm://name url')
+        shmrings.shm_name_from_url(url)
+        if size < 1:
+            raise ValueError('size must be >= 1, got %r' % size)
+        if kwargs.get('rcvbuf') or kwargs.get('sndbuf') or kwargs.get('busy_poll'):
+            raise ValueError('ShmServer has no socket to tune')
+        self.ring_size = size
+        self.drain_on_loop = drain_on_loop
+
+    def __init__(
+        self,
+        *,
+        url: Union[str, None] = None,
+        size: int = shmrings._DEFAULT_SHM_SIZE,
+        drain_on_loop: bool = True,
+        **kwargs
+    ):
+        pass
+
+    def __dealloc__(self):
+        if self.lo_server is not NULL:
+            lo.lo_server_free(self.lo_server)
+            self.lo_server = NULL
+
+    @property
+    def url(self):
+        return self._url
+
+    @url.setter
+    def url(self, url):
+        shmrings.shm_name_from_url(url)
+        AbstractServer.url.__set__(self, url)
+
+    @property
+    def proto(self) -> int:
+        return protos.PROTO_DEFAULT
+
+    @property
+    def port(self) -> None:
+        return None
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        stats = AbstractServer.stats.__get__(self)
+        if self.running:
+            stats['ring_used'] = len(self.ring)
+            stats['ring_dropped'] = self.ring.dropped
+        return stats
+
+    @property
+    def ring_fileno(self) -> int:
+        """
+        A file descriptor which becomes readable when packets are waiting in the ring, or -1 when not running.
+        """
+        return self.ring.fileno() if self.running else -1
+
+    def drain_ring(self) -> int:
+        """
+        Dispatch the packets waiting in the ring, returning how many there were. Only one thread may drain, and only
+        when drain_on_loop is False, since the loop is otherwise the ring's consumer.
+        """
+        if not self.running:
+            raise exceptions.RouteError('%r is not running' % self)
+        if self.drain_on_loop:
+            raise exceptions.RouteError('%r drains its ring on the loop' % self)
+        return self.drain(False)
+
+    def _on_ring_readable(self):
+        self.drain(True)
+
+    def _on_start(self):
+        # Packets pushed before the server started do not wake it
+        if self.running:
+            self.drain(True)
+
+    cdef int drain(self, bint on_loop) except -1:
+        cdef:
+            rings.ring_t * ring = &self.ring.ring
+            const char * data
+            size_t size
+            int result
+            int count = 0
+        self.ring.clear_wakeups()
+        while True:
+            data = rings.ring_peek(ring, &size)
+            if data is NULL:
+                break
+            with nogil:
+                result = lo.lo_server_dispatch_data(self.lo_server, <void*>data, size)
+            if result < 0:
+                logs.logger.error('%r: could not dispatch packet: liblo error %s', self, -result)
+            rings.ring_consume(ring)
+            count += 1
+        if on_loop:
+            self.schedule_pending()
+        else:
+            with nogil:
+                while lo.lo_server_recv_noblock(self.lo_server, 0):
+                    pass
+        return count
+
+    cdef int lo_server_start(self) except -1:
+        cdef lo.lo_server lo_server
+
+        try:
+            ring = shmrings.ShmRing(shmrings.shm_name_from_url(self._url), self.ring_size)
+            ring.listen()
+        except (OSError, ValueError) as exc:
+            raise exceptions.StartError('%r: %s' % (self, exc)) from exc
+
+        # liblo only dispatches, its socket is never read
+        lo_server = lo.lo_server_new_with_proto(NULL, protos.PROTO_UDP, on_error)
+        if lo_server is NULL:
+            ring.close()
+            server_error = pop_server_start_error()
+            if server_error is not None:
+                raise exceptions.StartError('%r: %s' % (self, server_error))
+            raise exceptions.StartError('Unknown error')
+
+        self.lo_server = lo_server
+        self.ring = ring
+        if self.drain_on_loop:
+            loop = asyncio.get_event_loop()
+            loop.add_reader(ring.fileno(), self._on_ring_readable)
+            loop.call_soon(self._on_start)
+        IF DEBUG: logs.logger.debug('%r: started, listening on %r', self, ring)
+
+    cdef int lo_server_stop(self) except -1:
+        # The ring's name is kept, so that producers carry on and a restarted server resumes where this one stopped
+        if self.ring is not None and self.ring.listening:
+            if self.drain_on_loop:
+                asyncio.get_event_loop().remove_reader(self.ring.fileno())
+            self.ring.close()
+        if self.lo_server is not NULL:
+            lo.lo_server_free(self.lo_server)
+            self.lo_server = NULL
+
+    cdef int socket_fd(self):
+        # liblo's socket is idle
+        return -1
+
+    cdef int schedule_pending(self) except -1:
+        # Nothing is received on liblo's socket, so a loop timer services bundles when they come due
+        return self.arm_pending()
@@ -1,7 +1,7 @@
 # cython: language_level=3
 
 import asyncio
-from typing import Union, Iterable, Iterator, TYPE_CHECKING
+from typing import Union, Iterable, Iterator, List, TYPE_CHECKING
 
 from . import exceptions, logs, subsasynciterators, types
 
@@ -58,6 +58,21 @@ class Sub:
         logs.logger.debug('%r: got item from inbox %r', self, msg)
         return msg
 
+    def drain_nowait(self) -> List[types.PubTypes]:
+        """
+        Remove and return every item waiting in the inbox, without waiting for more.
+        """
+        items = []
+        while not self.inbox.empty():
+            item = self.inbox.get_nowait()
+            self.inbox.task_done()
+            if isinstance(item, exceptions.Unsubscribed):
+                # Leave the unsubscription for next() to raise
+                self.inbox.put_nowait(item)
+                break
+            items.append(item)
+        return items
+
     async def pub(self, items: Iterable[types.PubTypes]):
         logs.logger.debug('%r: publishing %r', self, items)
         await self.inbox.put(items)
@@ -1,18 +1,43 @@
 # cython: language_level=3
 
 
-from . cimport abstractservers, lo
+from . cimport abstractservers, lo, rings
+
+
+# What the server thread needs to push to a ring without the GIL
+ctypedef struct ring_sink:
+    rings.ring_t * ring
+    int wakeup_fd
 
 
 cdef class ThreadedServer(abstractservers.AbstractServer):
+    cdef readonly rings.Ring ring
+
     # private
     cdef lo.lo_server_thread lo_server_thread
     cdef object initialized_event
+    cdef size_t ring_size
+    cdef bint drain_on_loop
+    cdef ring_sink sink
+    cdef object wakeup_fds
 
     cdef int lo_server_start(self) except -1
     cdef int lo_server_stop(self) except -1
+    cdef lo.lo_method_handler method_handler(self)
+    cdef void * method_user_data(self)
+    cdef int drain(self, bint threadsafe) except -1
+    cdef int close_ring(self) except -1
 
 
 cdef int server_thread_init(lo.lo_server_thread s, void* user_data) nogil
 
-cdef void server_thread_cleanup(lo.lo_server_thread s, void* user_data) nogil
\ No newline at end of file
+cdef void server_thread_cleanup(lo.lo_server_thread s, void* user_data) nogil
+
+cdef int ring_router(
+    const char *path,
+    const char *typespec,
+    lo.lo_arg ** argv,
+    int argc,
+    lo.lo_message raw_msg,
+    void *_sink
+) nogil
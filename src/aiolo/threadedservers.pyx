@@ -1,8 +1,11 @@
 # cython: language_level=3
+import asyncio
+import os
 import threading
-from typing import Union
+from typing import Any, Dict, Union
 
 from cpython.ref cimport Py_INCREF, Py_DECREF
+from posix.unistd cimport write
 
 # This unused cimport is necessary to initialize threads such that non-Python threads
 # can acquire the GIL
@@ -10,9 +13,9 @@ cimport cython.parallel
 
 
 from . import  exceptions, logs
-from . cimport lo, multicasts
+from . cimport lo, multicasts, rings
 
-from .abstractservers cimport on_error, pop_server_start_error, AbstractServer, NO_IFACE, NO_IP
+from .abstractservers cimport on_error, pop_server_start_error, route_message, AbstractServer, NO_IFACE, NO_IP
 
 
 __all__ = ['ThreadedServer']
@@ -27,9 +30,20 @@ cdef class ThreadedServer(AbstractServer):
         port: Union[str, int, None] = None,
         proto: Union[str, int, None] = None,
         multicast: Union[multicasts.MultiCast, None] = None,
+        ring_size: int = 0,
+        drain_on_loop: bool = True,
         **kwargs
     ):
+        if ring_size < 0:
+            raise ValueError('ring_size must be >= 0, got %r' % ring_size)
+        if ring_size and (kwargs.get('delivery') is not None or kwargs.get('bundled')):
+            # Messages are routed from the ring after their bundles have been dispatched, so bundles are lost
+            raise ValueError('ring_size is invalid with delivery or bundled')
         self.initialized_event = threading.Event()
+        self.ring_size = ring_size
+        self.drain_on_loop = drain_on_loop
+        self.sink.ring = NULL
+        self.sink.wakeup_fd = -1
 
     def __init__(
         self,
@@ -38,8 +52,16 @@ cdef class ThreadedServer(AbstractServer):
         port: Union[str, int, None] = None,
         proto: Union[str, int, None] = None,
         multicast: Union[multicasts.MultiCast, None] = None,
+        ring_size: int = 0,
+        drain_on_loop: bool = True,
         **kwargs,
     ):
+        """
+        When ring_size is > 0, the server thread copies each message into a Ring of that many bytes without taking
+        the GIL, and the messages are routed in batches: on the event loop, woken once per batch, or when
+        drain_on_loop is False, by calls to drain_ring() from a consumer thread. Messages which arrive while the
+        ring is full are dropped, and counted by ring.dropped.
+        """
         pass
 
     def __dealloc__(self):
@@ -49,6 +71,77 @@ cdef class ThreadedServer(AbstractServer):
             self.lo_server_thread = NULL
             self.lo_server = NULL
 
+    @property
+    def stats(self) -> Dict[str, Any]:
+        stats = AbstractServer.stats.__get__(self)
+        if self.ring is not None:
+            stats['ring_dropped'] = self.ring.dropped
+        return stats
+
+    @property
+    def ring_fileno(self) -> int:
+        """
+        A file descriptor which becomes readable when messages are waiting in the ring, or -1 without a ring.
+        """
+        return self.wakeup_fds[0] if self.wakeup_fds is not None else -1
+
+    def drain_ring(self) -> int:
+        """
+        Route the messages waiting in the ring, returning how many there were. Only one thread may drain, and only
+        when drain_on_loop is False, since the loop is otherwise the ring's consumer.
+        """
+        if self.wakeup_fds is None:
+            raise exceptions.RouteError('%r has no running ring' % self)
+        if self.drain_on_loop:
+            raise exceptions.RouteError('%r drains its ring on the loop' % self)
+        return self.drain(True)
+
+    def _on_ring_readable(self):
+        self.drain(False)
+
+    cdef int drain(self, bint threadsafe) except -1:
+        cdef:
+            size_t size
+            const char * data
+            lo.lo_message msg
+            int result = 0
+            int count = 0
+        try:
+            os.read(self.wakeup_fds[0], 64)
+        except BlockingIOError:
+            pass
+        rings.ring_clear_pending(self.sink.ring)
+        while True:
+            data = rings.ring_peek(self.sink.ring, &size)
+            if data is NULL:
+                break
+            msg = lo.lo_message_deserialise(<void*>data, size, &result)
+            if msg is NULL:
+                logs.logger.error('%r: could not deserialise message: liblo error %s', self, result)
+            else:
+                # A serialized message starts with its path
+                try:
+                    route_message(
+                        self, data, lo.lo_message_get_types(msg), lo.lo_message_get_argv(msg),
+                        lo.lo_message_get_argc(msg), threadsafe)
+                except Exception as exc:
+                    logs.logger.exception(exc)
+                finally:
+                    lo.lo_message_free(msg)
+            rings.ring_consume(self.sink.ring)
+            count += 1
+        return count
+
+    cdef lo.lo_method_handler method_handler(self):
+        if self.ring_size:
+            return <lo.lo_method_handler>ring_router
+        return AbstractServer.method_handler(self)
+
+    cdef void * method_user_data(self):
+        if self.ring_size:
+            return <void*>&self.sink
+        return <void*>self
+
     cdef int lo_server_start(self) except -1:
         cdef:
             char * iface
@@ -56,6 +149,16 @@ cdef class ThreadedServer(AbstractServer):
             multicasts.MultiCast multicast
             lo.lo_server_thread lo_server_thread = NULL
 
+        if self.ring_size:
+            self.ring = rings.Ring(self.ring_size)
+            self.sink.ring = &self.ring.ring
+            self.wakeup_fds = os.pipe()
+            for fd in self.wakeup_fds:
+                os.set_blocking(fd, False)
+            self.sink.wakeup_fd = self.wakeup_fds[1]
+            if self.drain_on_loop:
+                asyncio.get_event_loop().add_reader(self.wakeup_fds[0], self._on_ring_readable)
+
         if self._url:
             burl = self._url.encode('utf8')
             lo_server_thread = lo.lo_server_thread_new_from_url(burl, on_error)
@@ -90,6 +193,7 @@ cdef class ThreadedServer(AbstractServer):
             lo_server_thread = lo.lo_server_thread_new(NULL, on_error)
 
         if lo_server_thread is NULL:
+            self.close_ring()
             # Hackery, since the error is propagated to a callback which does not yet have a reference to
             # the server instance.
             server_error = pop_server_start_error()
@@ -127,6 +231,18 @@ cdef class ThreadedServer(AbstractServer):
                 lo.lo_server_thread_free(self.lo_server_thread)
             self.lo_server_thread = NULL
             self.lo_server = NULL
+        self.close_ring()
+
+    cdef int close_ring(self) except -1:
+        # The ring itself is kept, so that its counters can still be read
+        if self.wakeup_fds is not None:
+            if self.drain_on_loop:
+                asyncio.get_event_loop().remove_reader(self.wakeup_fds[0])
+            for fd in self.wakeup_fds:
+                os.close(fd)
+            self.wakeup_fds = None
+        self.sink.wakeup_fd = -1
+        return 0
 
 
 cdef int server_thread_init(lo.lo_server_thread s, void* user_data) nogil:
@@ -145,4 +261,26 @@ cdef void server_thread_cleanup(lo.lo_server_thread s, void* user_data) nogil:
             pass
         IF DEBUG: logs.logger.debug('%r: cleaned up thread', server_thread)
         server_thread.initialized_event.clear()
-        Py_DECREF(server_thread)
\ No newline at end of file
+        Py_DECREF(server_thread)
+
+
+cdef int ring_router(
+    const char *path,
+    const char *typespec,
+    lo.lo_arg ** argv,
+    int argc,
+    lo.lo_message raw_msg,
+    void *_sink
+) nogil:
+    cdef:
+        ring_sink * sink = <ring_sink*>_sink
+        size_t size = lo.lo_message_length(raw_msg, <char*>path)
+        char * to = rings.ring_reserve(sink.ring, size)
+        char wakeup = 1
+    if to is NULL:
+        return 0
+    lo.lo_message_serialise(raw_msg, <char*>path, to, &size)
+    rings.ring_commit(sink.ring, size)
+    if rings.ring_set_pending(sink.ring):
+        write(sink.wakeup_fd, &wakeup, 1)
+    return 0
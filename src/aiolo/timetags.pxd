@@ -9,16 +9,15 @@ cdef uint32_t _FRAC_PER_SEC
 
 
 cdef class TimeTag:
-    cdef lo.lo_timetag * lo_timetag_p
     cdef lo.lo_timetag lo_timetag
 
 
 # Not exported to Python
-cdef lo.lo_timetag * timetag_to_lo_timetag_ptr(object timetag) except NULL
+cdef TimeTag new_timetag(uint32_t sec, uint32_t frac)
 
-cdef lo.lo_timetag * timetag_parts_to_lo_timetag_ptr(uint32_t sec, uint32_t frac) except NULL
+cdef int set_lo_timetag(lo.lo_timetag * lo_timetag, object timetag) except -1
 
-cdef lo.lo_timetag * copy_lo_timetag_ptr(lo.lo_timetag * orig) except NULL
+cdef lo.lo_timetag osc_timestamp_to_lo_timetag(double osc_timestamp) except *
 
 cdef double lo_timetag_to_unix_timestamp(lo.lo_timetag lo_timetag)
 
@@ -4,8 +4,9 @@ import datetime
 import operator
 from typing import Tuple, Callable, Union
 
-from libc.stdint cimport uint32_t
-from libc.stdlib cimport malloc, free
+cimport cython
+from libc.math cimport floor
+from libc.stdint cimport uint32_t, uint64_t, UINT64_MAX
 
 
 from . import types
@@ -39,111 +40,142 @@ EPOCH_UTC = datetime.datetime.fromtimestamp(0, datetime.timezone.utc)
 EPOCH_OSC = datetime.datetime(1900, 1, 1, 0, 0, 0, 0, datetime.timezone.utc)
 
 
+@cython.freelist(64)
 cdef class TimeTag:
-    def __cinit__(self, timetag: types.TimeTagTypes = None):
-        cdef lo.lo_timetag lo_timetag
-        self.lo_timetag_p = timetag_to_lo_timetag_ptr(timetag)
-        self.lo_timetag = self.lo_timetag_p[0]
+    """
+    An OSC timetag: seconds since Jan 1 1900 UTC, and fractions of a second.
+
+    Comparisons with other TimeTags, (sec, frac) tuples, ints and datetimes are exact; comparisons with floats
+    are made on the OSC timestamp.
+    """
+    def __cinit__(TimeTag self, timetag: types.TimeTagTypes = None):
+        if timetag is None:
+            self.lo_timetag.sec = 0
+            self.lo_timetag.frac = 1
+        else:
+            set_lo_timetag(&self.lo_timetag, timetag)
 
-    def __init__(self, timestamp: types.TimeTagTypes = None):
+    def __init__(TimeTag self, timestamp: types.TimeTagTypes = None):
         pass
 
-    def __dealloc__(self):
-        free(self.lo_timetag_p)
-
-    def __repr__(self):
-        if self == TT_IMMEDIATE:
+    @staticmethod
+    def now() -> TimeTag:
+        """
+        The current time, from the system clock.
+        """
+        cdef TimeTag timetag = TimeTag.__new__(TimeTag)
+        lo.lo_timetag_now(&timetag.lo_timetag)
+        return timetag
+
+    def __repr__(TimeTag self):
+        if self.lo_timetag.sec == 0 and self.lo_timetag.frac == 1:
             return 'TT_IMMEDIATE'
         return '%s(%s)' % (self.__class__.__name__, repr(self.dt))
 
-    def __hash__(self):
-        return hash(repr(self))
+    def __hash__(TimeTag self):
+        return hash(ntp(self.lo_timetag))
 
-    def __int__(self) -> int:
-        return int(lo_timetag_to_osc_timestamp(self.lo_timetag))
+    def __int__(TimeTag self) -> int:
+        return self.lo_timetag.sec
 
-    def __float__(self) -> float:
+    def __float__(TimeTag self) -> float:
         return lo_timetag_to_osc_timestamp(self.lo_timetag)
 
-    def __getitem__(self, index) -> int:
+    def __getitem__(TimeTag self, index) -> int:
         if index == 0:
             return self.sec
         elif index == 1:
             return self.frac
         raise IndexError
 
-    def __iter__(self) -> Tuple[int, int]:
+    def __iter__(TimeTag self) -> Tuple[int, int]:
         return iter((self.sec, self.frac))
 
-    def operate(self, other: Union[int, float, datetime.timedelta], op: Callable) -> tuple:
-        cdef double delta
-        if isinstance(other, (int, float)):
-            delta = other
-        elif isinstance(other, datetime.timedelta):
-            delta = other.total_seconds()
+    def operate(TimeTag self, other: Union[int, float, datetime.timedelta], op: Callable) -> tuple:
+        if op is operator.add:
+            timetag = self + other
+        elif op is operator.sub:
+            timetag = self - other
         else:
             raise TypeError('Invalid value for %r operation %s: %r' % (self.__class__.__name__, op.__name__, other))
-        return osc_timestamp_to_timetag_parts(op(self.osc_timestamp, delta))
-
-    def compare(self, other: types.TimeTagTypes, op: Callable) -> bool:
-        cdef double osc_timestamp
-        if isinstance(other, tuple):
-            osc_timestamp = timetag_parts_to_osc_timestamp(other[0], other[1])
-        elif isinstance(other, TimeTag):
-            osc_timestamp = other.osc_timestamp
-        elif isinstance(other, (int, float)):
-            osc_timestamp = other
-        elif isinstance(other, datetime.datetime):
-            if not other.tzinfo:
-                raise ValueError('Cannot compare %r with naive datetime %r' % (self, other))
-            osc_timestamp = unix_timestamp_to_osc_timestamp(other.timestamp())
-        else:
-            raise TypeError('Invalid value for %r compare operation: %r' % (self.__class__.__name__, other))
-        return op(osc_timestamp_to_timetag_parts(self.osc_timestamp), osc_timestamp_to_timetag_parts(osc_timestamp))
+        return timetag.sec, timetag.frac
 
-    def __not__(self):
-        return bool(self.osc_timestamp)
+    def compare(TimeTag self, other: types.TimeTagTypes, op: Callable) -> bool:
+        if isinstance(other, float):
+            return op(self.osc_timestamp, other)
+        return op(ntp(self.lo_timetag), comparable_ntp(self, other))
 
-    def __abs__(self):
+    def __abs__(TimeTag self):
         return operator.abs(self.osc_timestamp)
 
-    def __lt__(self, other: types.TimeTagTypes) -> bool:
-        return (<TimeTag>self).compare(other, operator.lt)
-
-    def __le__(self, other: types.TimeTagTypes) -> bool:
-        return (<TimeTag>self).compare(other, operator.le)
-
-    def __eq__(self, other: types.TimeTagTypes) -> bool:
-        return (<TimeTag>self).compare(other, operator.eq)
-
-    def __ne__(self, other: types.TimeTagTypes) -> bool:
-        return (<TimeTag>self).compare(other, operator.ne)
-
-    def __gt__(self, other: types.TimeTagTypes) -> bool:
-        return (<TimeTag>self).compare(other, operator.gt)
-
-    def __ge__(self, other: types.TimeTagTypes) -> bool:
-        return (<TimeTag>self).compare(other, operator.ge)
-
-    def __add__(self, other: Union[int, float, datetime.timedelta]) -> TimeTag:
-        return TimeTag((<TimeTag>self).operate(other, operator.add))
-
-    def __sub__(self, other: Union[int, float, datetime.timedelta]) -> TimeTag:
-        return TimeTag((<TimeTag>self).operate(other, operator.sub))
-
-    __radd__ = __add__
-    __rsub__ = __sub__
+    def __lt__(TimeTag self, other: types.TimeTagTypes) -> bool:
+        if isinstance(other, float):
+            return self.osc_timestamp < other
+        if isinstance(other, TimeTag):
+            return ntp(self.lo_timetag) < ntp((<TimeTag>other).lo_timetag)
+        return ntp(self.lo_timetag) < comparable_ntp(self, other)
+
+    def __le__(TimeTag self, other: types.TimeTagTypes) -> bool:
+        if isinstance(other, float):
+            return self.osc_timestamp <= other
+        if isinstance(other, TimeTag):
+            return ntp(self.lo_timetag) <= ntp((<TimeTag>other).lo_timetag)
+        return ntp(self.lo_timetag) <= comparable_ntp(self, other)
+
+    def __eq__(TimeTag self, other: types.TimeTagTypes) -> bool:
+        if isinstance(other, float):
+            return self.osc_timestamp == other
+        if isinstance(other, TimeTag):
+            return ntp(self.lo_timetag) == ntp((<TimeTag>other).lo_timetag)
+        return ntp(self.lo_timetag) == comparable_ntp(self, other)
+
+    def __ne__(TimeTag self, other: types.TimeTagTypes) -> bool:
+        if isinstance(other, float):
+            return self.osc_timestamp != other
+        if isinstance(other, TimeTag):
+            return ntp(self.lo_timetag) != ntp((<TimeTag>other).lo_timetag)
+        return ntp(self.lo_timetag) != comparable_ntp(self, other)
+
+    def __gt__(TimeTag self, other: types.TimeTagTypes) -> bool:
+        if isinstance(other, float):
+            return self.osc_timestamp > other
+        if isinstance(other, TimeTag):
+            return ntp(self.lo_timetag) > ntp((<TimeTag>other).lo_timetag)
+        return ntp(self.lo_timetag) > comparable_ntp(self, other)
+
+    def __ge__(TimeTag self, other: types.TimeTagTypes) -> bool:
+        if isinstance(other, float):
+            return self.osc_timestamp >= other
+        if isinstance(other, TimeTag):
+            return ntp(self.lo_timetag) >= ntp((<TimeTag>other).lo_timetag)
+        return ntp(self.lo_timetag) >= comparable_ntp(self, other)
+
+    def __add__(left, right) -> TimeTag:
+        # Cython passes the operands in order, so the TimeTag may be on either side
+        if isinstance(left, TimeTag):
+            return offset_timetag(<TimeTag>left, right, 1)
+        return offset_timetag(<TimeTag>right, left, 1)
+
+    def __sub__(left, right) -> Union[TimeTag, float]:
+        """
+        A TimeTag minus seconds or a timedelta is a TimeTag; a TimeTag minus a TimeTag is the difference in seconds.
+        """
+        if not isinstance(left, TimeTag):
+            return NotImplemented
+        if isinstance(right, TimeTag):
+            return ntp_difference(ntp((<TimeTag>left).lo_timetag), ntp((<TimeTag>right).lo_timetag))
+        return offset_timetag(<TimeTag>left, right, -1)
 
     @property
-    def unix_timestamp(self) -> float:
+    def unix_timestamp(TimeTag self) -> float:
         return lo_timetag_to_unix_timestamp(self.lo_timetag)
 
     @property
-    def osc_timestamp(self) -> float:
+    def osc_timestamp(TimeTag self) -> float:
         return lo_timetag_to_osc_timestamp(self.lo_timetag)
 
     @property
-    def dt(self) -> datetime.datetime:
+    def dt(TimeTag self) -> datetime.datetime:
         # Note that this conversion loses precision, since OSC timetags have 1/32 second precision,
         # but Python datetimes only have microsecond precision.
         return datetime.datetime.fromtimestamp(
@@ -152,68 +184,126 @@ cdef class TimeTag:
         )
 
     @property
-    def sec(self) -> int:
+    def sec(TimeTag self) -> int:
         return self.lo_timetag.sec
 
     @property
-    def frac(self) -> int:
+    def frac(TimeTag self) -> int:
         return self.lo_timetag.frac
 
 
-cdef lo.lo_timetag * timetag_to_lo_timetag_ptr(object timetag) except NULL:
-    cdef:
-        uint32_t sec
-        uint32_t frac
-        object parts
+cdef inline uint64_t ntp(lo.lo_timetag lo_timetag):
+    return (<uint64_t>lo_timetag.sec << 32) | lo_timetag.frac
+
+
+cdef inline uint64_t seconds_to_ntp(double seconds):
+    # Split as osc_timestamp_to_timetag_parts() does, so that offsets agree with constructing from a timestamp.
+    # seconds must be in 0 <= seconds < 2 ** 32
+    cdef double whole = floor(seconds)
+    return (<uint64_t>whole << 32) + <uint64_t>((seconds - whole) * _FRAC_PER_SEC)
+
+
+cdef inline double ntp_to_seconds(uint64_t value):
+    return <double>(value >> 32) + <double>(value & 0xffffffff) / _FRAC_PER_SEC
 
-    if timetag is None:
-        # Optimization when None is passed, just copy from TT_IMMEDIATE
-        return copy_lo_timetag_ptr((<TimeTag>TT_IMMEDIATE).lo_timetag_p)
 
-    elif isinstance(timetag, (tuple, TimeTag)):
-        parts = timetag
+cdef inline double ntp_difference(uint64_t left, uint64_t right):
+    # Subtracted in the order which does not wrap, since the difference may not fit in an int64
+    if left >= right:
+        return ntp_to_seconds(left - right)
+    return -ntp_to_seconds(right - left)
+
+
+cdef TimeTag new_timetag(uint32_t sec, uint32_t frac):
+    cdef TimeTag timetag = TimeTag.__new__(TimeTag)
+    timetag.lo_timetag.sec = sec
+    timetag.lo_timetag.frac = frac
+    return timetag
+
+
+cdef TimeTag offset_timetag(TimeTag timetag, object delta, int sign):
+    cdef:
+        double seconds
+        uint64_t offset
+        uint64_t value = ntp(timetag.lo_timetag)
+    if isinstance(delta, (int, float)):
+        seconds = delta
+    elif isinstance(delta, datetime.timedelta):
+        seconds = delta.total_seconds()
+    else:
+        raise TypeError('Invalid value for %r operation: %r' % (timetag.__class__.__name__, delta))
+    seconds *= sign
+    # Checked as a double first, since no TimeTag is 2 ** 32 seconds or more from another
+    if not (-4294967296.0 < seconds < 4294967296.0):
+        raise OverflowError('TimeTag out of range: %r %s %r' % (timetag, '+' if sign > 0 else '-', delta))
+    offset = seconds_to_ntp(-seconds if seconds < 0 else seconds)
+    if (seconds < 0 and offset > value) or (seconds >= 0 and offset > UINT64_MAX - value):
+        raise OverflowError('TimeTag out of range: %r %s %r' % (timetag, '+' if sign > 0 else '-', delta))
+    if seconds < 0:
+        value -= offset
+    else:
+        value += offset
+    return new_timetag(<uint32_t>(value >> 32), <uint32_t>value)
+
+
+cdef object comparable_ntp(TimeTag timetag, object other):
+    # A Python int, so that ints and tuples outside the range of a timetag still compare rather than overflow
+    if isinstance(other, TimeTag):
+        return ntp((<TimeTag>other).lo_timetag)
+    elif isinstance(other, tuple):
+        return (int(other[0]) << 32) + int(other[1])
+    elif isinstance(other, int):
+        # ints are OSC timestamps, in whole seconds
+        return other << 32
+    elif isinstance(other, datetime.datetime):
+        if not other.tzinfo:
+            raise ValueError('Cannot compare %r with naive datetime %r' % (timetag, other))
+        osc_timestamp = unix_timestamp_to_osc_timestamp(other.timestamp())
+        if 0 <= osc_timestamp < 4294967296.0:
+            return ntp(osc_timestamp_to_lo_timetag(osc_timestamp))
+        return int(osc_timestamp * 4294967296.0)
+    raise TypeError('Invalid value for %r compare operation: %r' % (timetag.__class__.__name__, other))
+
+
+cdef lo.lo_timetag osc_timestamp_to_lo_timetag(double osc_timestamp) except *:
+    cdef lo.lo_timetag lo_timetag
+    if not (0 <= osc_timestamp < 4294967296.0):
+        raise OverflowError('Invalid OSC timestamp %r (out of range)' % osc_timestamp)
+    lo_timetag.sec = <uint32_t>osc_timestamp
+    lo_timetag.frac = <uint32_t>((osc_timestamp - lo_timetag.sec) * _FRAC_PER_SEC)
+    return lo_timetag
+
+
+cdef int set_lo_timetag(lo.lo_timetag * lo_timetag, object timetag) except -1:
+    if isinstance(timetag, TimeTag):
+        lo_timetag[0] = (<TimeTag>timetag).lo_timetag
+
+    elif isinstance(timetag, tuple):
+        lo_timetag.sec = timetag[0]
+        lo_timetag.frac = timetag[1]
+
+    elif isinstance(timetag, (int, float)):
+        lo_timetag[0] = osc_timestamp_to_lo_timetag(unix_timestamp_to_osc_timestamp(timetag))
 
     elif isinstance(timetag, datetime.timedelta):
         # Indicates a time in the future, relative to right now
-        delta = timetag
-        dt = delta + datetime.datetime.now(datetime.timezone.utc)
-        unix_timestamp = dt.astimezone(datetime.timezone.utc).timestamp()
-        parts = unix_timestamp_to_timetag_parts(unix_timestamp)
+        dt = timetag + datetime.datetime.now(datetime.timezone.utc)
+        lo_timetag[0] = osc_timestamp_to_lo_timetag(unix_timestamp_to_osc_timestamp(dt.timestamp()))
 
     elif isinstance(timetag, datetime.datetime):
         if not timetag.tzinfo:
             raise ValueError('datetime value for timetag must have tzinfo')
-        unix_timestamp = timetag.astimezone(datetime.timezone.utc).timestamp()
-        parts = unix_timestamp_to_timetag_parts(unix_timestamp)
-
-    elif isinstance(timetag, (int, float)):
-        unix_timestamp = timetag
-        parts = unix_timestamp_to_timetag_parts(unix_timestamp)
+        lo_timetag[0] = osc_timestamp_to_lo_timetag(unix_timestamp_to_osc_timestamp(timetag.timestamp()))
 
     else:
         raise TypeError('Invalid timetag value %s' % repr(timetag))
-
-    sec, frac = parts[0], parts[1]
-    return timetag_parts_to_lo_timetag_ptr(sec, frac)
-
-
-cdef lo.lo_timetag * timetag_parts_to_lo_timetag_ptr(uint32_t sec, uint32_t frac) except NULL:
-    lo_timetag_p = <lo.lo_timetag*>malloc(sizeof(lo.lo_timetag))
-    if lo_timetag_p is NULL:
-        raise MemoryError
-    lo_timetag_p[0].sec = sec
-    lo_timetag_p[0].frac = frac
-    return lo_timetag_p
-
-
-cdef lo.lo_timetag * copy_lo_timetag_ptr(lo.lo_timetag * orig) except NULL:
-    return timetag_parts_to_lo_timetag_ptr(orig.sec, orig.frac)
+    return 0
 
 
 cdef TimeTag lo_timetag_to_timetag(lo.lo_timetag lo_timetag):
     if lo_timetag.sec == 0 and lo_timetag.frac == 1:
         return TT_IMMEDIATE
-    return TimeTag(lo_timetag.sec, lo_timetag.frac)
+    return new_timetag(lo_timetag.sec, lo_timetag.frac)
 
 
 cdef double lo_timetag_to_unix_timestamp(lo.lo_timetag lo_timetag):
@@ -229,7 +319,7 @@ cpdef double timetag_parts_to_unix_timestamp(uint32_t sec, uint32_t frac):
 
 
 cpdef double timetag_parts_to_osc_timestamp(uint32_t sec, uint32_t frac):
-    return int(sec) + (float(frac) / _FRAC_PER_SEC)
+    return <double>sec + <double>frac / _FRAC_PER_SEC
 
 
 cpdef double osc_timestamp_to_unix_timestamp(double osc_timestamp):
@@ -0,0 +1,288 @@
+import asyncio
+import socket
+import struct
+from typing import Union
+
+from . import exceptions, logs, protos
+
+
+__all__ = [
+    'Transport', 'DEFAULT_WRITE_BUFFER_HIGH', 'DEFAULT_WRITE_BUFFER_LOW', 'SLIP_END', 'SLIP_ESC', 'SLIP_ESC_END',
+    'SLIP_ESC_ESC', 'slip_encode', 'length_prefix']
+
+
+# Same defaults as asyncio's own transports
+DEFAULT_WRITE_BUFFER_HIGH = 64 * 1024
+DEFAULT_WRITE_BUFFER_LOW = DEFAULT_WRITE_BUFFER_HIGH // 4
+
+# SLIP special bytes, see RFC 1055
+SLIP_END = 0o300
+SLIP_ESC = 0o333
+SLIP_ESC_END = 0o334
+SLIP_ESC_ESC = 0o335
+
+_SLIP_END = bytes([SLIP_END])
+_SLIP_ESC = bytes([SLIP_ESC])
+_SLIP_ESCAPED_END = bytes([SLIP_ESC, SLIP_ESC_END])
+_SLIP_ESCAPED_ESC = bytes([SLIP_ESC, SLIP_ESC_ESC])
+
+_LENGTH_PREFIX = struct.Struct('>I')
+
+
+def slip_encode(data: bytes) -> bytes:
+    """
+    Frame a packet using double-ended SLIP, as liblo does for stream_slip addresses (OSC 1.1).
+    """
+    data = bytes(data).replace(_SLIP_ESC, _SLIP_ESCAPED_ESC).replace(_SLIP_END, _SLIP_ESCAPED_END)
+    return _SLIP_END + data + _SLIP_END
+
+
+def length_prefix(data: bytes) -> bytes:
+    """
+    Frame a packet with a 32 bit big-endian length, as liblo does for TCP (OSC 1.0).
+    """
+    return _LENGTH_PREFIX.pack(len(data)) + bytes(data)
+
+
+class _Protocol(asyncio.Protocol, asyncio.DatagramProtocol):
+    """
+    Tracks the connection state and write flow control of a Transport.
+    """
+    __slots__ = ('transport', 'paused', 'exc', 'waiters', 'closed')
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.transport = None
+        self.paused = False
+        self.exc = None
+        self.waiters = []
+        self.closed = loop.create_future()
+
+    def connection_made(self, transport: asyncio.BaseTransport):
+        self.transport = transport
+
+    def connection_lost(self, exc: Union[Exception, None]):
+        self.exc = exc
+        if not self.closed.done():
+            self.closed.set_result(None)
+        self.paused = False
+        self.wake()
+
+    def error_received(self, exc: Exception):
+        # Datagram errors, such as ECONNREFUSED from ICMP port unreachable
+        self.exc = exc
+
+    def data_received(self, data: bytes):
+        pass
+
+    def datagram_received(self, data: bytes, addr):
+        pass
+
+    def eof_received(self):
+        return False
+
+    def pause_writing(self):
+        self.paused = True
+
+    def resume_writing(self):
+        self.paused = False
+        self.wake()
+
+    def wake(self):
+        waiters, self.waiters = self.waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def wait_writable(self):
+        while self.paused:
+            waiter = asyncio.get_event_loop().create_future()
+            self.waiters.append(waiter)
+            await waiter
+
+
+class Transport:
+    """
+    A non-blocking, event loop managed connection to a single OSC destination.
+
+    Writes are buffered by the event loop; drain() applies high/low watermark backpressure in the same manner
+    as asyncio's StreamWriter, so a slow peer suspends the writer rather than blocking the loop.
+    """
+    __slots__ = (
+        'proto', 'host', 'port', 'stream_slip', 'no_delay', 'ttl', 'high', 'low', 'loop', 'last_used',
+        '_protocol', '_transport', '_connecting')
+
+    def __init__(
+        self,
+        proto: int,
+        host: Union[str, None],
+        port: Union[str, int],
+        *,
+        stream_slip: bool = False,
+        no_delay: bool = False,
+        ttl: int = -1,
+        high: Union[int, None] = None,
+        low: Union[int, None] = None,
+        loop: Union[asyncio.AbstractEventLoop, None] = None,
+    ):
+        proto = protos.get_proto_id(proto)
+        if proto == protos.PROTO_DEFAULT:
+            proto = protos.PROTO_UDP
+        self.proto = proto
+        self.host = host or 'localhost'
+        self.port = str(port)
+        self.stream_slip = stream_slip
+        self.no_delay = no_delay
+        self.ttl = ttl
+        self.high = DEFAULT_WRITE_BUFFER_HIGH if high is None else high
+        self.low = (self.high // 4) if low is None else low
+        if not (0 <= self.low <= self.high):
+            raise ValueError('high (%r) must be >= low (%r) must be >= 0' % (self.high, self.low))
+        self.loop = loop or asyncio.get_event_loop()
+        self.last_used = self.loop.time()
+        self._protocol = None
+        self._transport = None
+        self._connecting = None
+
+    def __repr__(self):
+        return 'Transport(%s://%s:%s)' % (protos.PROTOS[self.proto], self.host, self.port)
+
+    @property
+    def connected(self) -> bool:
+        return self._transport is not None and not self._transport.is_closing()
+
+    @property
+    def healthy(self) -> bool:
+        """
+        Whether the transport is connected and has not seen an error since the last write.
+        """
+        return self.connected and self._protocol.exc is None
+
+    @property
+    def paused(self) -> bool:
+        """
+        Whether the write buffer is above the high watermark.
+        """
+        return self._protocol is not None and self._protocol.paused
+
+    @property
+    def write_buffer_size(self) -> int:
+        if self._transport is None:
+            return 0
+        return self._transport.get_write_buffer_size()
+
+    def set_write_buffer_limits(self, high: Union[int, None] = None, low: Union[int, None] = None):
+        high = DEFAULT_WRITE_BUFFER_HIGH if high is None else high
+        low = (high // 4) if low is None else low
+        if not (0 <= low <= high):
+            raise ValueError('high (%r) must be >= low (%r) must be >= 0' % (high, low))
+        self.high = high
+        self.low = low
+        if self._transport is not None:
+            self._set_limits()
+
+    async def connect(self) -> 'Transport':
+        if self.connected:
+            return self
+        if self._connecting is None:
+            self._connecting = self.loop.create_task(self._connect())
+        try:
+            await asyncio.shield(self._connecting)
+        finally:
+            if self._connecting is not None and self._connecting.done():
+                self._connecting = None
+        return self
+
+    async def _connect(self):
+        protocol = _Protocol(self.loop)
+        try:
+            if self.proto == protos.PROTO_TCP:
+                transport, _ = await self.loop.create_connection(lambda: protocol, self.host, int(self.port))
+                if self.no_delay:
+                    sock = transport.get_extra_info('socket')
+                    if sock is not None:
+                        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            elif self.proto == protos.PROTO_UNIX:
+                # Not all loops (uvloop) accept a path for remote_addr, so connect the socket ourselves
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                try:
+                    sock.setblocking(False)
+                    sock.connect(self.port)
+                except OSError:
+                    sock.close()
+                    raise
+                transport, _ = await self.loop.create_datagram_endpoint(lambda: protocol, sock=sock)
+            else:
+                transport, _ = await self.loop.create_datagram_endpoint(
+                    lambda: protocol, remote_addr=(self.host, int(self.port)))
+                if self.ttl != -1:
+                    sock = transport.get_extra_info('socket')
+                    if sock is not None and sock.family == socket.AF_INET:
+                        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self.ttl)
+        except OSError as exc:
+            raise exceptions.SendError('%r: could not connect: %s' % (self, exc)) from exc
+        self._protocol = protocol
+        self._transport = transport
+        self._set_limits()
+        logs.logger.debug('%r: connected', self)
+
+    def _set_limits(self):
+        try:
+            self._transport.set_write_buffer_limits(high=self.high, low=self.low)
+        except (AttributeError, NotImplementedError):
+            pass
+
+    def frame(self, data: bytes) -> bytes:
+        if self.proto == protos.PROTO_TCP:
+            if self.stream_slip:
+                return slip_encode(data)
+            return length_prefix(data)
+        return data
+
+    def write(self, data: bytes) -> int:
+        """
+        Queue a serialized OSC packet for sending, without waiting for it to be flushed.
+        """
+        if not self.connected:
+            raise exceptions.SendError('%r: not connected' % self)
+        if self._protocol.exc is not None:
+            exc, self._protocol.exc = self._protocol.exc, None
+            raise exceptions.SendError('%r: %s' % (self, exc)) from exc
+        framed = self.frame(data)
+        self.last_used = self.loop.time()
+        if self.proto == protos.PROTO_TCP:
+            self._transport.write(framed)
+        else:
+            self._transport.sendto(framed)
+        return len(data)
+
+    async def drain(self):
+        """
+        Wait until the write buffer has dropped below the low watermark, if it had exceeded the high watermark.
+        """
+        if self._protocol is None:
+            return
+        await self._protocol.wait_writable()
+        if self._protocol.exc is not None:
+            exc, self._protocol.exc = self._protocol.exc, None
+            raise exceptions.SendError('%r: %s' % (self, exc)) from exc
+
+    async def send(self, data: bytes) -> int:
+        await self.connect()
+        count = self.write(data)
+        await self.drain()
+        return count
+
+    def close(self):
+        if self._connecting is not None:
+            self._connecting.cancel()
+            self._connecting = None
+        if self._transport is not None:
+            self._transport.close()
+        self._transport = None
+        self._protocol = None
+
+    async def wait_closed(self):
+        protocol = self._protocol
+        self.close()
+        if protocol is not None:
+            await protocol.closed
@@ -56,7 +56,8 @@ ELSE:
 cdef tuple EMPTY_STRINGS
 
 cdef class TypeSpec(abstractspecs.AbstractSpec):
-    pass
+    # The pack.Plan for this typespec, built on first use
+    cdef object plan
 
 cpdef object guess_for_arg_list(object args: Iterable[types.MessageTypes])
 
@@ -3,8 +3,12 @@ import asyncio
 import contextlib
 import datetime
 import functools
+import multiprocessing
+import os
 import random
+import signal
 import sys
+import time
 from typing import Union
 
 import netifaces
@@ -16,9 +20,12 @@ import test_data
 
 from aiolo import MultiCast, AioServer, Address, Message, PROTO_UDP, PROTO_UNIX, TimeTag, FRAC_PER_SEC, \
     NO_ARGS, Route, unix_timestamp_to_osc_timestamp, TT_IMMEDIATE, MultiCastAddress, Bundle, ANY_PATH, TypeSpec, \
-    StartError, PROTO_DEFAULT, EPOCH_UTC, ANY_ARGS, JAN_1970, ThreadedServer, Midi, PROTO_TCP, INFINITY, \
+    StartError, RouteError, PROTO_DEFAULT, EPOCH_UTC, ANY_ARGS, JAN_1970, ThreadedServer, Midi, PROTO_TCP, INFINITY, \
     INFINITUM, TIMETAG, MIDI, NIL, FALSE, TRUE, BLOB, STRING, DOUBLE, INT64, Path, Sub, Subs, \
-    compile_osc_address_pattern
+    compile_osc_address_pattern, TransportPool, Pacer, TimerWheel, Scheduler, Sequencer, \
+    iter_packets, parse_packet, FRAMING_LENGTH, FRAMING_SLIP, length_prefix, slip_encode, decode_columns, \
+    ServerGroup, ProtocolServer, Ring, DeliveryQueue, Late, LATE_FLAG, ReceivedBundle, \
+    StreamDecoder, ShmAddress, ShmServer
 
 
 def create_task(coro, cancel_timeout=conftest.CANCEL_TIMEOUT):
@@ -71,7 +78,8 @@ def event_loop(request):
 
 @pytest.fixture(params=[
     AioServer,
-    ThreadedServer
+    ThreadedServer,
+    ProtocolServer,
 ])
 def any_server_class(request, event_loop):
     return request.param
@@ -227,6 +235,611 @@ async def test_multiple_addresses(any_server):
     assert results == [[0], [1], [2]]
 
 
+@pytest.mark.parametrize('url', [
+    'osc.udp://:%s',
+    'osc.tcp://:%s',
+    'osc.unix:///tmp/test-aiolo-%s.osc',
+])
+@pytest.mark.asyncio
+async def test_send_async(any_server_class, unused_tcp_port, url):
+    """
+    Test non-blocking sends over loop-managed transports.
+    """
+    if any_server_class is AioServer and url.startswith('osc.tcp'):
+        # AioServer only polls liblo's listening socket, so it misses data on connections that outlive the accept
+        pytest.skip('AioServer does not poll accepted TCP connections')
+    server = any_server_class(url=url % unused_tcp_port)
+    foo = server.route('/foo', [int, str])
+    server.start()
+    address = Address(url=url % unused_tcp_port)
+    address.set_write_buffer_limits(high=128, low=32)
+    task = create_task(subscribe(foo.sub(), 4))
+    try:
+        for i in range(3):
+            assert await address.send_async(foo, i, 'foo') > 0
+        assert await address.bundle_async([Message(foo, 3, 'bar')]) > 0
+        results = await task
+        assert sorted(results) == [[0, 'foo'], [1, 'foo'], [2, 'foo'], [3, 'bar']]
+        with pytest.raises(ValueError):
+            address.set_write_buffer_limits(high=1, low=2)
+    finally:
+        address.close()
+        server.stop()
+
+
+@pytest.mark.asyncio
+async def test_transport_pool(event_loop, unused_tcp_port):
+    """
+    Test that pooled Addresses share warm connections, and that idle connections are evicted.
+    """
+    server = ThreadedServer(url='osc.tcp://:%s' % unused_tcp_port)
+    foo = server.route('/foo', int)
+    server.start()
+    pool = TransportPool(max_per_destination=2, idle_timeout=0.2)
+    task = create_task(subscribe(foo.sub(), 5))
+    try:
+        # Concurrent first callers share one connection
+        acquired = await asyncio.gather(*(pool.acquire(PROTO_TCP, None, unused_tcp_port) for _ in range(4)))
+        assert len(set(map(id, acquired))) == 1 and len(pool) == 1
+        for i in range(5):
+            address = Address(url='osc.tcp://:%s' % unused_tcp_port, pool=pool)
+            await address.send_async(foo, i)
+        assert len(pool) == 1
+        assert sorted(await task) == [[0], [1], [2], [3], [4]]
+        await asyncio.sleep(0.5)
+        assert len(pool) == 0
+    finally:
+        pool.close()
+        server.stop()
+
+
+@pytest.mark.asyncio
+async def test_pacer(event_loop, unused_udp_port):
+    """
+    Test that a paced Address queues sends which exceed the rate, and releases them in order.
+    """
+    server = ThreadedServer(url='osc.udp://:%s' % unused_udp_port)
+    foo = server.route('/foo', int)
+    server.start()
+    pacer = Pacer(packets_per_second=50, burst_packets=2, max_queue=6)
+    address = Address(url='osc.udp://:%s' % unused_udp_port, pacer=pacer)
+    task = create_task(subscribe(foo.sub(), 8))
+    try:
+        counts = [address.send(foo, i) for i in range(8)]
+        assert all(counts[:2]) and not any(counts[2:])
+        for i in range(8, 10):
+            with pytest.raises(asyncio.QueueFull):
+                address.send(foo, i)
+        assert pacer.stats == {'sent': 2, 'queued': 6, 'delayed': 0, 'dropped': 2}
+        start = event_loop.time()
+        await address.drain()
+        assert event_loop.time() - start >= 0.1
+        assert pacer.stats == {'sent': 8, 'queued': 0, 'delayed': 6, 'dropped': 2}
+        assert await task == [[i] for i in range(8)]
+    finally:
+        server.stop()
+
+
+@pytest.mark.asyncio
+async def test_dispatch(server):
+    """
+    Test that packets dispatched to a server are routed as though they had been received.
+    """
+    foo = server.route('/foo', int)
+    task = create_task(subscribe(foo.sub(), 3))
+    server.dispatch(bytes(Message(foo, 1)))
+    server.dispatch(memoryview(bytes(Bundle([Message(foo, 2), Message(foo, 3)]))))
+    assert await task == [[1], [2], [3]]
+    with pytest.raises(ValueError):
+        server.dispatch(b'')
+
+
+@pytest.mark.parametrize('server_class', [AioServer, ProtocolServer])
+@pytest.mark.asyncio
+async def test_pending_timer(event_loop, unused_udp_port, server_class):
+    """
+    Test that queued bundles share a single loop timer, which is cancelled on stop.
+    """
+    server = server_class(port=unused_udp_port)
+    foo = server.route('/foo', int)
+    server.start()
+    handle = None
+    try:
+        task = create_task(subscribe(foo.sub(), 3))
+        start = now()
+        handles = []
+        for i, delay in enumerate((0.3, 0.2, 0.1)):
+            server.dispatch(bytes(Bundle([Message(foo, i)], timetag=start + datetime.timedelta(seconds=delay))))
+            handles.append(server.pending_timer)
+        for i in range(100):
+            server.dispatch(bytes(Message('/bar', i)))
+        # Each earlier bundle moves the timer earlier, and messages which are not queued leave it alone
+        assert handles[0].cancelled() and handles[1].cancelled()
+        assert server.pending_timer is handles[2] and not handles[2].cancelled()
+        assert await task == [[2], [1], [0]]
+        assert not server.events_pending and server.pending_timer is None
+        server.dispatch(bytes(Bundle([Message(foo, 3)], timetag=now() + datetime.timedelta(seconds=1))))
+        handle = server.pending_timer
+        assert handle is not None
+    finally:
+        server.stop()
+    assert server.pending_timer is None and handle.cancelled()
+
+
+@pytest.mark.parametrize('server_class', [AioServer, ProtocolServer])
+@pytest.mark.asyncio
+async def test_socket_stats(event_loop, unused_udp_port, server_class):
+    """
+    Test that socket options are applied, and that datagrams dropped by the kernel are reported.
+    """
+    server = server_class(port=unused_udp_port, rcvbuf=4096, sndbuf=8192, max_msg_size=4096)
+    assert server.stats['rcvbuf'] is None
+    server.start()
+    try:
+        stats = server.stats
+        # Linux doubles the requested size for bookkeeping
+        assert 4096 <= stats['rcvbuf'] <= 8192 and 8192 <= stats['sndbuf'] <= 16384
+        assert stats['max_msg_size'] == 4096
+        address = Address(port=unused_udp_port)
+        # The loop does not read while the socket is flooded
+        for i in range(200):
+            address.send('/foo', b'x' * 1024)
+        if sys.platform.startswith('linux'):
+            stats = server.stats
+            assert stats['rx_queue'] > 0 and stats['kernel_drops'] > 0
+    finally:
+        server.stop()
+    with pytest.raises(ValueError):
+        server_class(port=unused_udp_port, rcvbuf=-1)
+
+
+@pytest.mark.asyncio
+async def test_delivery_queue(any_server_class, unused_udp_port):
+    """
+    Test that future bundles are held in a DeliveryQueue and published in timetag order, and that late and
+    overflowing messages are handled.
+    """
+    delivery = DeliveryQueue(max_pending=3, late_policy=LATE_FLAG, tolerance=0.05)
+    server = any_server_class(port=unused_udp_port, delivery=delivery)
+    assert not server.queue_enabled
+    foo = server.route('/foo', int)
+    server.start()
+    address = Address(port=unused_udp_port)
+    try:
+        task = create_task(subscribe(foo.sub(), 5))
+        start = now()
+        for i, delay in enumerate((0.3, 0.1, 0.2, 0.4)):
+            address.bundle([Message(foo, i)], timetag=start + datetime.timedelta(seconds=delay))
+        address.bundle([Message(foo, 4)], timetag=start - datetime.timedelta(seconds=1))
+        address.send(foo, 5)
+        results = await task
+        assert results[0] == Late([4], pytest.approx(1, abs=0.5))
+        assert results[1:] == [[5], [1], [2], [0]]
+        stats = delivery.stats
+        assert stats['pending'] == 0 and stats['delivered'] == 4 and stats['late'] == 1
+        assert stats['overflowed'] == 1 and stats['dropped'] == 0
+        assert stats['max_lateness'] >= 0.5
+    finally:
+        server.stop()
+    with pytest.raises(ValueError):
+        ThreadedServer(port=unused_udp_port, ring_size=1024, delivery=delivery)
+
+    # Messages are not published before their timetag, even when it shares a tick with an earlier one
+    loop = asyncio.get_event_loop()
+    coarse = DeliveryQueue(resolution=0.05)
+    bar = Route('/bar', int)
+    published = []
+    bar_sub = bar.sub()
+
+    async def receive():
+        async for data in bar_sub:
+            published.append((data, loop.time()))
+            if len(published) == 2:
+                await bar_sub.unsub()
+                break
+
+    task = create_task(receive())
+    start = loop.time()
+    whens = [start + 0.07, start + 0.09]
+    for i, when in enumerate(whens):
+        coarse.push(when, bar, [i])
+    await task
+    # uvloop may fire up to a millisecond early
+    assert [data for data, _ in published] == [[0], [1]]
+    assert all(at >= when - 0.002 for (_, at), when in zip(published, whens))
+
+
+@pytest.mark.asyncio
+async def test_bundled(any_server_class, unused_udp_port):
+    """
+    Test that a bundled server publishes each bundle's messages together, with its timetag.
+    """
+    delivery = DeliveryQueue(late_policy=LATE_FLAG, tolerance=0.5)
+    server = any_server_class(port=unused_udp_port, bundled=True, delivery=delivery)
+    ch = server.route('/ch', 'if')
+    server.start()
+    address = Address(port=unused_udp_port)
+    try:
+        bundles = create_task(subscribe(server.bundle_route.sub(), 3))
+        singles = create_task(subscribe(ch.sub(), 1))
+        timetag = TimeTag(now() + datetime.timedelta(seconds=0.1))
+        address.bundle([Message(ch, i, i / 128) for i in range(64)], timetag=timetag)
+        address.bundle([Message(ch, i, 0.) for i in range(64, 128)])
+        # Due before the loop's clock began, but still late rather than immediate
+        past = TimeTag(datetime.datetime(1990, 1, 1, tzinfo=datetime.timezone.utc))
+        address.bundle([Message(ch, -1, 0.)], timetag=past)
+        address.send(ch, 128, 1.)
+        received = await bundles
+        late = next(item for item in received if isinstance(item, Late))
+        first, second = [item for item in received if item is not late]
+        assert isinstance(first, ReceivedBundle) and first.timetag == TT_IMMEDIATE
+        assert first.items == [(ch, [i, 0.]) for i in range(64, 128)]
+        assert isinstance(late, Late) and late.data.items == [(ch, [-1, 0.])] and late.lateness > 1e8
+        assert second.timetag == timetag
+        assert second.items == [(ch, [i, i / 128]) for i in range(64)]
+        assert await singles == [[128, 1.]]
+    finally:
+        server.stop()
+
+
+@pytest.mark.asyncio
+async def test_recv_batch(event_loop, unused_udp_port):
+    """
+    Test that a server receiving in batches dispatches every datagram, including bundles.
+    """
+    server = AioServer(port=unused_udp_port, recv_batch=8)
+    assert server.recv_batch == 8
+    foo = server.route('/foo', int)
+    server.start()
+    address = Address(port=unused_udp_port)
+    task = create_task(subscribe(foo.sub(), 22))
+    try:
+        for i in range(20):
+            address.send(foo, i)
+        address.bundle([Message(foo, 20), Message(foo, 21)])
+        assert await task == [[i] for i in range(22)]
+    finally:
+        server.stop()
+    with pytest.raises(StartError):
+        AioServer(port=unused_udp_port, proto=PROTO_TCP, recv_batch=8).start()
+
+
+def test_ring():
+    """
+    Test that a ring returns packets in order across wraparound, and counts drops when full.
+    """
+    ring = Ring(100)
+    assert ring.capacity == 128
+    assert ring.pop() is None
+    packets = [bytes([i]) * (i % 23) for i in range(200)]
+    popped = []
+    for packet in packets:
+        assert ring.push(packet)
+        while len(ring) > 32:
+            popped.append(ring.pop())
+    while len(ring):
+        popped.append(ring.pop())
+    assert popped == packets
+    while ring.push(b'x' * 20):
+        pass
+    assert ring.dropped == 1
+    assert not ring.push(b'x' * 200)
+    assert ring.dropped == 2
+
+
+@pytest.mark.parametrize('drain_on_loop', [True, False])
+@pytest.mark.asyncio
+async def test_threaded_server_ring(event_loop, unused_udp_port, drain_on_loop):
+    """
+    Test that a ThreadedServer with a ring routes messages in batches, on the loop or from a consumer.
+    """
+    server = ThreadedServer(port=unused_udp_port, ring_size=1 << 16, drain_on_loop=drain_on_loop)
+    foo = server.route('/foo', int)
+    bar = server.route('/bar', ANY_ARGS)
+    server.start()
+    address = Address(port=unused_udp_port)
+    task = create_task(subscribe(foo.sub() | bar.sub(), 21))
+    try:
+        for i in range(20):
+            address.send(foo, i)
+        address.send(bar, 'x', 1.5)
+        if drain_on_loop:
+            with pytest.raises(RouteError):
+                server.drain_ring()
+        else:
+            drained = 0
+            for _ in range(100):
+                await asyncio.sleep(0.01)
+                drained += server.drain_ring()
+                if drained == 21:
+                    break
+            assert drained == 21
+        assert await task == {foo: [[i] for i in range(20)], bar: [['x', 1.5]]}
+        assert server.ring.dropped == 0
+    finally:
+        server.stop()
+
+
+def test_stream_decoder():
+    """
+    Test that a stream decoder frames packets split across chunks at every offset, and rejects oversized packets.
+    """
+    packets = [bytes(Message('/foo', i)) for i in (1, 0xc0, 0xdb, 0xc0db)]
+    for stream in (b''.join(map(length_prefix, packets)), b''.join(map(slip_encode, packets))):
+        for split in range(1, len(stream)):
+            decoder = StreamDecoder()
+            decoded = []
+            for chunk in (stream[:split], stream[split:]):
+                buffer = decoder.get_buffer()
+                buffer[:len(chunk)] = chunk
+                decoder.feed(len(chunk))
+                decoded.extend(decoder)
+            assert decoded == packets
+            assert decoder.packets == 4 and not len(decoder)
+    decoder = StreamDecoder(max_packet_size=16)
+    decoder.write(length_prefix(bytes(Message('/foo', 'x' * 16))))
+    with pytest.raises(ValueError):
+        list(decoder)
+
+
+@pytest.mark.asyncio
+async def test_protocol_server(event_loop, unused_tcp_port):
+    """
+    Test that a ProtocolServer reassembles length-prefixed and SLIP framed packets, and pauses its connections.
+    """
+    server = ProtocolServer(port=unused_tcp_port, proto=PROTO_TCP, max_burst=1)
+    foo = server.route('/foo', int)
+    server.start()
+    task = create_task(subscribe(foo.sub(), 4))
+    writers = []
+    try:
+        _, writer = await asyncio.open_connection('127.0.0.1', unused_tcp_port)
+        writers.append(writer)
+        data = length_prefix(bytes(Message(foo, 1))) + length_prefix(bytes(Message(foo, 2)))
+        # Split mid-header, and then mid-packet
+        for chunk in (data[:2], data[2:9], data[9:]):
+            writer.write(chunk)
+            await writer.drain()
+            await asyncio.sleep(0.01)
+        _, writer = await asyncio.open_connection('127.0.0.1', unused_tcp_port)
+        writers.append(writer)
+        # 0xc0db escapes both SLIP_END and SLIP_ESC
+        writer.write(slip_encode(bytes(Message(foo, 3))) + slip_encode(bytes(Message(foo, 0xc0db))))
+        assert sorted(await task) == [[1], [2], [3], [0xc0db]]
+        assert len(server.connections) == 2
+        assert sorted(connection.packets for connection in server.connections) == [2, 2]
+        server.pause_reading()
+        assert all(connection.paused for connection in server.connections)
+        server.resume_reading()
+        assert not any(connection.paused for connection in server.connections)
+        # As fed by loops without BufferedProtocol
+        task = create_task(subscribe(foo.sub(), 1))
+        connection = next(c for c in server.connections if c.decoder.framing == FRAMING_LENGTH)
+        connection.data_received(length_prefix(bytes(Message(foo, 4))))
+        assert await task == [[4]]
+    finally:
+        for writer in writers:
+            writer.close()
+        server.stop()
+
+
+def _shm_produce(url, start):
+    address = ShmAddress(url=url)
+    for i in range(start, start + 100):
+        while not address.send('/foo', i):
+            time.sleep(0.001)
+    address.close()
+
+
+def _shm_consume(url):
+    try:
+        ShmServer(url=url, size=4096).start()
+    except StartError:
+        return
+    raise AssertionError('a second consumer started')
+
+
+@pytest.mark.asyncio
+async def test_shm(event_loop):
+    """
+    Test that a ShmServer receives messages and bundles pushed to its ring by this and other processes.
+    """
+    url = 'osc.shm://test-%s' % os.getpid()
+    server = ShmServer(url=url, size=4096)
+    foo = server.route('/foo', int)
+    server.start()
+    task = create_task(subscribe(foo.sub(), 302))
+    try:
+        address = ShmAddress(url=url)
+        assert address.send('/foo', -1) > 0
+        assert address.bundle([Message('/foo', -2)]) > 0
+        context = multiprocessing.get_context('fork')
+        producers = [context.Process(target=_shm_produce, args=(url, start)) for start in (0, 100, 200)]
+        for producer in producers:
+            producer.start()
+        received = await task
+        for producer in producers:
+            producer.join()
+            assert producer.exitcode == 0
+        assert sorted(data[0] for data in received) == list(range(-2, 300))
+        assert not len(server.ring)
+        with pytest.raises(RouteError):
+            server.drain_ring()
+        # A ring has one consumer, in this process or another
+        with pytest.raises(StartError, match=r'already has a consumer'):
+            ShmServer(url=url, size=4096).start()
+        consumer = context.Process(target=_shm_consume, args=(url,))
+        consumer.start()
+        consumer.join()
+        assert consumer.exitcode == 0
+        # A producer which died holding the lock does not block the others
+        dead = context.Process(target=os.getpid)
+        dead.start()
+        dead.join()
+        with open(server.ring.path, 'r+b') as f:
+            # The lock follows the magic number
+            f.seek(8)
+            f.write(dead.pid.to_bytes(8, sys.byteorder))
+        task = create_task(subscribe(foo.sub(), 1))
+        assert address.send('/foo', 300) > 0
+        assert await task == [[300]]
+        address.close()
+        # Once the consumer stops, or if it died, another may start
+        server.stop()
+        with open(server.ring.path, 'r+b') as f:
+            # The consumer follows the lock
+            f.seek(16)
+            f.write(dead.pid.to_bytes(8, sys.byteorder))
+        server.start()
+    finally:
+        server.stop()
+        server.ring.unlink()
+
+
+@pytest.mark.parametrize('proto', ['udp', 'tcp'])
+@pytest.mark.asyncio
+async def test_server_group(event_loop, unused_tcp_port, proto):
+    """
+    Test that a server group's workers share a port, run the handlers declared in the parent, and are restarted.
+    """
+    total = multiprocessing.get_context('fork').Value('q', 0)
+    with pytest.raises(ValueError):
+        ServerGroup(unused_tcp_port, max_batch=0)
+    # A small batch, so that UDP workers yield to their handlers between reads
+    group = ServerGroup(unused_tcp_port, proto=proto, workers=2, check_interval=60, max_batch=2)
+
+    @group.route('/foo', int)
+    def on_foo(data):
+        with total.get_lock():
+            total.value += data[0]
+
+    group.start()
+    try:
+        assert group.alive == 2
+        for batch in range(2):
+            addresses = [Address(url='osc.%s://127.0.0.1:%s' % (proto, unused_tcp_port)) for _ in range(4)]
+            for i, address in enumerate(addresses):
+                for j in range(5):
+                    address.send(Route('/foo', int), i * 5 + j)
+            for _ in range(200):
+                if total.value == sum(range(20)) * (batch + 1):
+                    break
+                await asyncio.sleep(0.01)
+            del addresses
+            if not batch:
+                os.kill(group.pids[0], signal.SIGKILL)
+                await asyncio.sleep(0.1)
+                assert group.alive == 1
+                assert group.check() == 1
+                assert group.alive == 2
+        stats = group.stats
+        assert stats['packets'] == 40 and stats['errors'] == 0 and stats['restarts'] == 1
+        assert sum(stats['per_worker']) == 40
+        assert total.value == 2 * sum(range(20))
+    finally:
+        group.stop()
+    assert group.alive == 0
+
+
+def test_timer_wheel():
+    """
+    Test that the timer wheel pops items in order, never early, across cascades and overflow.
+    """
+    wheel = TimerWheel(0.001, bits=4, levels=2)
+    rand = random.Random(0)
+    whens = [rand.uniform(0, 2) for _ in range(1000)] + [0.5] * 10
+    entries = [wheel.push(when, i) for i, when in enumerate(whens)]
+    cancelled = set(rand.sample(range(len(whens)), 100))
+    for i in cancelled:
+        assert wheel.cancel(entries[i])
+    assert len(wheel) == len(whens) - len(cancelled)
+    popped = []
+    now = 0.
+    while len(wheel):
+        now += rand.uniform(0, 0.05)
+        due = wheel.pop_due(now)
+        assert all(when <= now for when, _ in due)
+        if len(wheel):
+            assert wheel.next_due() > now
+        popped.extend(due)
+    expected = sorted((when, i) for i, when in enumerate(whens) if i not in cancelled)
+    assert popped == expected
+
+    # Items are held back within their tick, and cancelled overflow entries do not count towards next_due()
+    wheel = TimerWheel(0.001, bits=2, levels=1)
+    wheel.push(0.0105, 'a')
+    assert wheel.pop_due(0.0104) == [] and wheel.next_due() == 0.0105
+    assert wheel.pop_due(0.0105) == [(0.0105, 'a')]
+    wheel.cancel(wheel.push(1., 'b'))
+    wheel.push(2., 'c')
+    assert wheel.next_due() == 2.
+
+
+@pytest.mark.asyncio
+async def test_scheduler(event_loop, unused_udp_port):
+    """
+    Test that scheduled messages are sent in order, batched into bundles, and cancelled messages are not sent.
+    """
+    server = ThreadedServer(url='osc.udp://:%s' % unused_udp_port)
+    foo = server.route('/foo', int)
+    server.start()
+    address = Address(url='osc.udp://:%s' % unused_udp_port)
+    scheduler = Scheduler(address)
+    task = create_task(subscribe(foo.sub(), 9))
+    try:
+        start = event_loop.time()
+        handles = [scheduler.at(start + 0.05 + (i // 3) * 0.02, Message(foo, i)) for i in range(10)]
+        assert scheduler.cancel(handles[4])
+        assert len(scheduler) == 9
+        await scheduler.drain()
+        assert event_loop.time() - start >= 0.09 - scheduler.lookahead
+        assert len(scheduler) == 0
+        # Messages which came due together were batched
+        assert scheduler.sent == 4
+        assert await task == [[i] for i in range(10) if i != 4]
+    finally:
+        scheduler.close()
+        server.stop()
+
+
+@pytest.mark.asyncio
+async def test_sequencer(event_loop, unused_udp_port):
+    """
+    Test that a sequencer streams each repeat of its pattern ahead of time, and picks up live pattern changes.
+    """
+    server = ThreadedServer(url='osc.udp://:%s' % unused_udp_port)
+    foo = server.route('/foo', int)
+    server.start()
+    address = Address(url='osc.udp://:%s' % unused_udp_port)
+    pattern = [Message(foo, 0), None, Message(foo, 1), [Message(foo, 2), Message(foo, 3)]]
+    sequencer = Sequencer(address, pattern, bpm=1500, lookahead=0.05, repeat=3)
+    assert sequencer.step_duration == 0.01
+    sub = foo.sub()
+    expected = []
+    try:
+        sequencer.start()
+        assert sequencer.running
+        while sequencer.position < 4:
+            await asyncio.sleep(0.005)
+        # Steps already sent are unaffected, the edit applies from the next step
+        sent = sequencer.position
+        for i in range(sent):
+            expected.extend([[n] for n in [[0], [], [1], [2, 3]][i % 4]])
+        sequencer.pattern = [Message(foo, 4)] * 4
+        expected.extend([[4]] * (12 - sent))
+        await sequencer.wait()
+        assert not sequencer.running
+        assert sequencer.position == 12
+        stats = sequencer.stats
+        assert stats['steps'] == 12 - (sent + 2) // 4
+        assert stats['late'] == 0
+        assert stats['min_slack'] > 0
+        assert await subscribe(sub, len(expected)) == expected
+    finally:
+        sequencer.stop()
+        server.stop()
+
+
 @pytest.fixture(params=[
     lambda port, ip, iface: (
         Address(url='osc.tcp://%s:%s' % (ip, port())),
@@ -520,6 +1133,97 @@ async def test_bundle_delayed(server):
     assert not server.events_pending
 
 
+@pytest.mark.asyncio
+async def test_numeric_arrays(server):
+    address = Address(url=server.url)
+    levels = server.route(Route('/levels', 'f' * 64, as_array=True))
+    counts = server.route(Route('/counts', 'hhh', as_array=True))
+    task = create_task(subscribe(levels.sub() | counts.sub(), 2))
+    values = array.array('f', [i / 64 for i in range(64)])
+    message = Message(levels, values)
+    assert message == Message(levels, *values)
+    address.message(message)
+    address.message(Message(counts, array.array('q', [1, -2, 2 ** 40])))
+    results = await task
+    assert_results(results, {
+        levels: [array.array('f', values)],
+        counts: [array.array('q', [1, -2, 2 ** 40])],
+    })
+
+    with pytest.raises(TypeError, match=r'Invalid array'):
+        Message(levels, array.array('d', values))
+    with pytest.raises(ValueError, match=r'length'):
+        Message(levels, values[:32])
+    # Arrays are validated as scalar args are
+    for typecode, typespec in (('f', 'ff'), ('d', 'dd')):
+        for value in (float('nan'), float('inf')):
+            with pytest.raises((ValueError, OverflowError)) as array_error:
+                Message(Route('/ff', typespec), array.array(typecode, [value, 1.]))
+            with pytest.raises((ValueError, OverflowError)) as scalar_error:
+                Message(Route('/ff', typespec), value, 1.)
+            assert array_error.type is scalar_error.type
+    with pytest.raises(ValueError, match=r'single numeric or MIDI type'):
+        Route('/foo', 'fi', as_array=True)
+
+
+@pytest.mark.asyncio
+async def test_midi(server):
+    midi = Midi(1, 0x90, 60, 127)
+    assert midi.packed == 0x01903c7f and Midi.from_packed(midi.packed) == midi
+    assert bytes(midi) == b'\x01\x90\x3c\x7f'
+    assert hash(midi) == hash(Midi(1, 0x90, 60, 127)) and midi != Midi(1, 0x80, 60, 0)
+    midi[3] = 0
+    assert midi == Midi(1, 0x90, 60, 0)
+
+    address = Address(url=server.url)
+    notes = server.route(Route('/notes', 'mm', as_array=True))
+    task = create_task(subscribe(notes.sub(), 2))
+    address.send(notes, Midi(1, 0x90, 60, 127), Midi(1, 0x90, 64, 127))
+    address.message(Message(notes, array.array('I', [0x01803c00, 0x01804000])))
+    results = await task
+    assert results == [array.array('I', [0x01903c7f, 0x0190407f]), array.array('I', [0x01803c00, 0x01804000])]
+
+
+@pytest.mark.asyncio
+async def test_route_fields(server):
+    address = Address(url=server.url)
+    point = server.route(Route('/touch/point', 'iff', fields='id, x, y'))
+    assert point.record.__name__ == 'TouchPoint'
+    task = create_task(subscribe(point.sub(), 1))
+    address.send(point, 3, 0.5, 0.25)
+    [result] = await task
+    assert isinstance(result, point.record)
+    assert (result.id, result.x, result.y) == (3, 0.5, 0.25)
+    assert result == point.record(3, 0.5, 0.25)
+    assert hash(result) == hash((3, 0.5, 0.25)) and result._replace(id=4) == (4, 0.5, 0.25)
+
+    with pytest.raises(ValueError, match=r'do not match typespec'):
+        Route('/foo', 'if', fields=['a'])
+    with pytest.raises(ValueError, match=r'require a typespec'):
+        Route('/foo', fields=['a'])
+
+
+@pytest.mark.asyncio
+async def test_decode_columns(server):
+    meter = server.route('/meter', 'isf')
+    rows = [Message(meter, i, 'ch%s' % i, i / 2) for i in range(5)]
+    expected = [array.array('i', range(5)), ['ch%s' % i for i in range(5)], array.array('f', [i / 2 for i in range(5)])]
+    assert decode_columns([bytes(m) for m in rows], 'isf') == expected
+    assert decode_columns(rows, meter.typespec) == expected
+    with pytest.raises(ValueError, match=r'row 1 has typespec'):
+        decode_columns([rows[0], Message(Route('/meter', 'iff'), 1, 2., 3.)], 'isf')
+
+    address = Address(url=server.url)
+    sub = meter.sub()
+    for message in rows:
+        address.message(message)
+    items = [await sub.next()]
+    while len(items) < len(rows):
+        await asyncio.sleep(0.01)
+        items.extend(sub.drain_nowait())
+    assert decode_columns(items, meter.typespec) == expected
+
+
 def test_bundle_and_message_ops():
     foo = Route('/foo', 's')
     bar = Route('/bar', 's')
@@ -584,6 +1288,90 @@ def test_bundle_and_message_ops():
     assert sorted(bundles) == [bundle1, bundle2, bundle3, bundle4]
 
 
+def test_cached_hash_and_equality():
+    foo = Route('/foo', 'i')
+    message = Message(foo, 1)
+    assert hash(message) == hash(message) == hash(Message(foo, 1))
+    assert {message: 1}[Message(foo, 1)] == 1
+    assert message != Message(foo, 2)
+
+    nested = Bundle(message)
+    bundle = Bundle([message, nested])
+    other = Bundle([message, Bundle(message)])
+    assert hash(bundle) == hash(other) and bundle == other
+    size = bundle.nbytes
+
+    # Mutating a nested bundle invalidates its parent's cached hash, size and equality
+    nested.add(Message(foo, 2))
+    assert bundle != other
+    assert hash(bundle) != hash(other)
+    assert bundle.nbytes == size + Message(foo, 2).nbytes + 4
+    other[1].add(Message(foo, 2))
+    assert hash(bundle) == hash(other) and bundle == other
+
+
+def test_serialize_into_and_buffer():
+    foo = Route('/foo', 's')
+    message = Message(foo, 'foo')
+    raw = message.raw().tobytes()
+    assert bytes(message) == raw
+    assert memoryview(message).readonly
+
+    buf = bytearray(4 + len(raw))
+    assert message.serialize_into(buf, 4) == len(raw)
+    assert bytes(buf[4:]) == raw
+    with pytest.raises(ValueError, match=r'too small'):
+        message.serialize_into(buf, 5)
+
+    inner = Bundle(message)
+    bundle = Bundle([message, inner], TimeTag(now()))
+    view = memoryview(bundle)
+    assert bytes(view) == bundle.raw().tobytes()
+    with pytest.raises(BufferError):
+        bundle.add(message)
+    view.release()
+
+    # Changes to nested bundles invalidate the cached serialization
+    inner.add(message)
+    assert len(memoryview(bundle)) == bundle.nbytes == len(bundle.raw())
+    buf = bytearray(bundle.nbytes)
+    assert bundle.serialize_into(buf) == len(buf)
+    assert bytes(buf) == bytes(bundle)
+
+
+def test_from_raw_and_iter_packets():
+    foo = Route('/foo', 'is')
+    message = Message(foo, 1, 'foo')
+    assert Message.from_raw(message.raw()) == message
+    assert Message.from_raw(memoryview(message)).route == foo
+
+    nested = Bundle([message, Message('/bar', b'\xc0\xdb')], TimeTag(now()))
+    bundle = Bundle([message, nested], TimeTag(now()))
+    assert Bundle.from_raw(bytes(bundle)) == bundle
+    assert parse_packet(bundle.raw()) == bundle
+    with pytest.raises(ValueError, match=r'overruns'):
+        Bundle.from_raw(bytes(bundle)[:-4])
+
+    packets = [message, bundle, nested]
+    stream = b''.join(length_prefix(bytes(p)) for p in packets)
+    assert list(iter_packets(stream, FRAMING_LENGTH)) == packets
+    with pytest.raises(ValueError, match=r'truncated'):
+        list(iter_packets(stream[:-1], FRAMING_LENGTH))
+    stream = bytearray(b''.join(slip_encode(bytes(p)) for p in packets))
+    assert list(iter_packets(stream, FRAMING_SLIP)) == packets
+    assert list(iter_packets(bytes(nested), flatten=True)) == list(nested)
+
+
+def test_pack_flat_and_nested_args():
+    foo = Route('/foo', 'isfh')
+    assert Message(foo, 1, 'a', 2., 3) == Message(foo, [1, ['a', 2.]], 3)
+    assert Message(foo, 1, 'a', 2., 3).unpack() == [1, 'a', 2., 3]
+    with pytest.raises(TypeError, match=r'Invalid type for FLOAT'):
+        Message(foo, 1, 'a', 2, 3)
+    with pytest.raises(OverflowError, match=r'INT64'):
+        Message(foo, 1, 'a', 2., 2 ** 63)
+
+
 def test_message_arglength_mismatch():
     foo = Route('/foo', 's')
     with pytest.raises(ValueError, match=r'Argument length does not match typespec .*'):
@@ -810,14 +1598,44 @@ def test_timetag():
     tt = tt + 3
     assert tt == (3, 1)
     tt = tt - 2.1
-    assert tt == (0, .9 * FRAC_PER_SEC)
+    assert tt.sec == 0 and tt.frac == pytest.approx(.9 * FRAC_PER_SEC, abs=4)
 
     # Test inplace operations
     tt = TimeTag((0, 1))
     tt += 3
     assert tt == (3, 1)
     tt -= 2.1
-    assert tt == (0, .9 * FRAC_PER_SEC)
+    assert tt.sec == 0 and tt.frac == pytest.approx(.9 * FRAC_PER_SEC, abs=4)
+
+    # Arithmetic, comparison and hashing are exact on the 64 bit NTP value
+    tt = TimeTag((100, 5))
+    assert tt + 1 == (101, 5) and tt + 1 - 1 == tt
+    assert hash(TimeTag(tt)) == hash(tt) and len({tt, TimeTag((100, 5))}) == 1
+    assert TimeTag((100, 6)) > tt
+    assert TimeTag((101, 0)) - tt == pytest.approx(1 - 5 / FRAC_PER_SEC)
+    assert sorted([TimeTag((1, 2)), TimeTag((1, 1)), TimeTag((0, 3))]) == [(0, 3), (1, 1), (1, 2)]
+    assert Message(Route('/foo', 't'), tt).unpack() == [tt]
+    assert abs(TimeTag.now().unix_timestamp - datetime.datetime.now().timestamp()) < 1
+
+    # Offsets which leave the range of a timetag raise, however large
+    for offset in (3e9, 1e10, -1e10, 2 ** 40, -2 ** 40, float('inf'), float('nan')):
+        with pytest.raises(OverflowError):
+            TimeTag.now() + offset
+    with pytest.raises(OverflowError):
+        TimeTag((5, 0)) - 6
+    assert TimeTag((5, 0)) + 3e9 == (3000000005, 0)
+    assert TimeTag((0xffffffff, 0)) - 4e9 == (0xffffffff - 4000000000, 0)
+
+    # Differences of more than 2 ** 31 seconds do not wrap
+    assert TimeTag.now() - TimeTag((0, 5)) == pytest.approx(TimeTag.now().osc_timestamp, abs=1)
+    assert TimeTag((0, 5)) - TimeTag((0xffffffff, 5)) == -0xffffffff
+
+    # ints outside the range of a timetag still compare
+    tt = TimeTag.now()
+    assert tt > -1 and tt >= -1 and tt != -1 and not tt == -1
+    assert tt < 2 ** 33 and tt <= 2 ** 40 and not tt == 2 ** 40 and tt != 2 ** 40
+    assert tt < (2 ** 32, 0) and tt > (-1, 0)
+    assert tt > datetime.datetime(1800, 1, 1, tzinfo=datetime.timezone.utc)
 
     for dt in (
             EPOCH_UTC,